@@ -0,0 +1,64 @@
+# -* encoding: utf-8 *-
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Measures how long it takes to parse and sort a large number of Debian version strings, like the aptly versioners do
+with the versions of a package in a repository. The versions are random, but the same in each run. Run it from the
+repository root like this::
+
+    python benchmarks/debversion_sort.py [COUNT]
+"""
+
+import os
+import random
+import sys
+import time
+
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "py"))
+
+from gopythongo.utils.debversion import DebianVersion  # noqa: E402
+
+
+def generate_versions(count: int) -> List[str]:
+    rnd = random.Random(22)
+    versions = []  # type: List[str]
+    for _ in range(count):
+        version = ".".join(str(rnd.randint(0, 20)) for _ in range(rnd.randint(1, 4)))
+        version += rnd.choice(["", "", "", "~rc%s" % rnd.randint(1, 5), "~bpo%s" % rnd.randint(1, 9), "+git%s" %
+                               rnd.randint(20160101, 20161231), "dev%s" % rnd.randint(1, 3)])
+        if rnd.random() < 0.1:
+            version = "%s:%s" % (rnd.randint(1, 3), version)
+        if rnd.random() < 0.7:
+            version = "%s-%s" % (version, rnd.choice([str(rnd.randint(1, 12)), "%s~bpo8" % rnd.randint(1, 3),
+                                                      "0ubuntu%s" % rnd.randint(1, 5)]))
+        versions.append(version)
+    return versions
+
+
+def measure(label: str, count: int, func) -> None:  # type: ignore
+    start = time.perf_counter()
+    func()
+    print("%-45s %8.1fms" % (label % count, (time.perf_counter() - start) * 1000))
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    version_strings = generate_versions(count)
+
+    parsed = []  # type: List[DebianVersion]
+    measure("parse %s versions", count, lambda: parsed.extend(DebianVersion.fromstring(v) for v in version_strings))
+    measure("sort %s versions with key=sort_key", count, lambda: sorted(parsed, key=DebianVersion.sort_key))
+    # the sort keys are cached now, so this only measures the comparisons
+    measure("sort %s versions with cached keys", count, lambda: sorted(parsed, key=DebianVersion.sort_key))
+
+    fresh = [DebianVersion.fromstring(v) for v in version_strings]
+    measure("sort %s versions with rich comparisons", count, lambda: sorted(fresh))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+# -* encoding: utf-8 *-
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Measures how long GoPythonGo takes to start, i.e. to import itself, register all plugins and build its command-line
+parser, which it does in every process, including the one inside the build environment. Each run uses a new Python
+interpreter. Run it from the repository root like this::
+
+    python benchmarks/startup.py [RUNS]
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+_SRC = os.path.join(os.path.dirname(_HERE), "src", "py")
+
+_startup = """
+import sys, time
+start = time.perf_counter()
+import gopythongo.main
+from gopythongo import initializers, versioners, builders, assemblers, packers, stores
+for subinit in [initializers.init_subsystem, versioners.init_subsystem, builders.init_subsystem,
+                assemblers.init_subsystem, packers.init_subsystem, stores.init_subsystem]:
+    subinit()
+gopythongo.main.get_parser()
+print(time.perf_counter() - start)
+print(",".join(m for m in ["docker", "dockerpty", "aptly_api", "requests", "hvac", "semantic_version", "packaging",
+                           "jinja2"] if m in sys.modules))
+"""
+
+
+def main() -> None:
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    env = dict(os.environ)
+    env["PYTHONPATH"] = _SRC
+    times = []
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, "-c", _startup], env=env, universal_newlines=True)
+        duration, modules = output.split("\n")[:2]
+        times.append(float(duration))
+
+    print("GoPythonGo startup over %s runs: median %.1fms, min %.1fms, max %.1fms" %
+          (runs, statistics.median(times) * 1000, min(times) * 1000, max(times) * 1000))
+    print("Expensive modules imported during startup: %s" % (modules or "none"))
+
+
+if __name__ == "__main__":
+    main()
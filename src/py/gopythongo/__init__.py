@@ -4,5 +4,12 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import sys
+
 version = "0.7.10.dev0"
 program_version = "GoPythonGo %s" % version
+
+# Startup profiling must begin before the rest of GoPythonGo is imported, so it can't wait for the command-line parser
+if "--profile-startup" in sys.argv or any(arg.startswith("--profile-startup-json") for arg in sys.argv):
+    from gopythongo import startupprofile
+    startupprofile.enable()
@@ -29,12 +29,12 @@ def get_assemblers_by_type(type: str) -> Dict[str, 'BaseAssembler']:
 def init_subsystem() -> None:
     global _assemblers
 
-    from gopythongo.assemblers import django, virtualenv, certifybuild
-    _assemblers = {
-        "django": django.assembler_class(),
-        "virtualenv": virtualenv.assembler_class(),
-        "certifybuild": certifybuild.assembler_class(),
-    }
+    _assemblers = {}
+    plugins.register_builtins(_assemblers, {
+        "django": "gopythongo.assemblers.django",
+        "virtualenv": "gopythongo.assemblers.virtualenv",
+        "certifybuild": "gopythongo.assemblers.certifybuild",
+    }, "assembler_class", BaseAssembler, "assembler_name")
 
     plugins.load_plugins("gopythongo.assemblers", _assemblers, "assembler_class", BaseAssembler, "assembler_name")
 
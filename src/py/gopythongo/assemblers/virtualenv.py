@@ -5,12 +5,20 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 import configargparse
+import json
+import shutil
+import tempfile
+import time
 import os
 
-from typing import Type
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Type, Dict, List, Tuple, Union
 
 from gopythongo.assemblers import BaseAssembler
-from gopythongo.utils import ErrorMessage, highlight, run_process, print_info, create_script_path
+from gopythongo.utils import ErrorMessage, highlight, run_process, print_info, create_script_path, umasked_makedirs, \
+    print_warning, venvsnapshot
+from gopythongo.utils.buildcontext import the_context
+from gopythongo.utils.wheelcache import WheelCache, parse_wheel_filename
 
 
 class VirtualEnvAssembler(BaseAssembler):
@@ -32,12 +40,43 @@ class VirtualEnvAssembler(BaseAssembler):
         gr_pip.add_argument("--upgrade-pip", dest="upgrade_pip", action="store_true", default=False,
                             help="If specified, GoPythonGo will update pip and virtualenv inside the build environment "
                                  "to the newest available version before installing packages")
+        gr_pip.add_argument("--incremental-virtualenv", dest="virtualenv_snapshots", default=None,
+                            env_var="INCREMENTAL_VIRTUALENV",
+                            help="Path to a folder on the build host (for example next to your pbuilder basetgz) "
+                                 "where GoPythonGo stores a snapshot of the virtualenv after each successful build. It "
+                                 "will be mounted into the build environment automatically. Subsequent builds in the "
+                                 "same build environment restore the snapshot and only install, upgrade or remove the "
+                                 "packages that changed. pip upgrades the dependencies of restored packages only if "
+                                 "the new requirements need it, so pin all requirements (e.g. with a constraints file "
+                                 "in --pip-opts) if incremental builds must install the same versions as clean "
+                                 "builds")
+        gr_pip.add_argument("--wheel-cache", dest="wheel_cache", default=None, env_var="WHEEL_CACHE",
+                            help="Path to a folder on the build host that is used as a persistent cache for wheels "
+                                 "built inside the build environment. It will be mounted into the build environment "
+                                 "automatically. Wheels are kept separately for each build environment (distribution, "
+                                 "installed system packages and Python ABI), so C extensions are only recompiled when "
+                                 "the build environment changes")
+        gr_pip.add_argument("--wheel-cache-max-size", dest="wheel_cache_max_size", type=int, default=2048,
+                            env_var="WHEEL_CACHE_MAX_SIZE",
+                            help="The maximum size of the wheel cache in megabytes. The least recently used wheels "
+                                 "will be removed when the cache grows beyond this size (Default: 2048)")
 
         gr_setuppy = parser.add_argument_group("Setup.py Assembler options")
         gr_setuppy.add_argument("--setuppy-install", dest="setuppy_install", action="append", default=[],
                                 help="After all pip commands have run, this can run 'python setup.py install' on " +
                                      "additional packages available in any filesystem path. This option can be " +
-                                     "used multiple times")
+                                     "used multiple times.")
+        gr_setuppy.add_argument("--setuppy-install-wheels", dest="setuppy_install_wheels", action="store_true",
+                                default=False,
+                                help="Instead of running 'python setup.py install' for each --setuppy-install project "
+                                     "one after another, build wheels for all of them in parallel and install them "
+                                     "together with all pip packages in a single pip run. The wheels are built in "
+                                     "isolated build environments before any pip packages are installed, so the "
+                                     "setup.py files can't import packages installed via --packages.")
+        gr_setuppy.add_argument("--setuppy-install-jobs", dest="setuppy_install_jobs", type=int,
+                                default=os.cpu_count() or 1,
+                                help="The number of wheels for --setuppy-install projects that GoPythonGo builds in "
+                                     "parallel when --setuppy-install-wheels is set (Default: the number of CPUs)")
 
         gr_python = parser.add_argument_group("Python ecosystem options")
         gr_python.add_argument("--use-virtualenv", dest="virtualenv_binary", default="/usr/bin/virtualenv",
@@ -53,19 +92,84 @@ class VirtualEnvAssembler(BaseAssembler):
             if not (os.path.exists(path) and os.path.exists(os.path.join(path, "setup.py"))):
                 raise ErrorMessage("Cannot run setup.py in %s, because it does not exist" % highlight(path))
 
+        if args.setuppy_install_jobs < 1:
+            raise ErrorMessage("%s must be at least 1" % highlight("--setuppy-install-jobs"))
+
         if args.is_inner and not os.path.exists(args.virtualenv_binary) or not \
                 os.access(args.virtualenv_binary, os.X_OK):
             raise ErrorMessage("virtualenv not found in path or not executable (%s).\n"
                                "You can specify an alternative path with %s" %
                                (args.virtualenv_binary, highlight("--use-virtualenv")))
 
+        if args.wheel_cache:
+            if not os.path.isabs(args.wheel_cache):
+                raise ErrorMessage("%s must be an absolute path. %s is not absolute." %
+                                   (highlight("--wheel-cache"), highlight(args.wheel_cache)))
+
+            if args.wheel_cache_max_size <= 0:
+                raise ErrorMessage("%s must be a positive number of megabytes" % highlight("--wheel-cache-max-size"))
+
+            if not args.is_inner:
+                if not os.path.exists(args.wheel_cache):
+                    umasked_makedirs(args.wheel_cache, 0o755)
+                elif not os.path.isdir(args.wheel_cache) or not os.access(args.wheel_cache, os.W_OK):
+                    raise ErrorMessage("The wheel cache %s is not a writable folder" % highlight(args.wheel_cache))
+                the_context.mounts.add(args.wheel_cache)
+
+        if args.virtualenv_snapshots:
+            if not os.path.isabs(args.virtualenv_snapshots):
+                raise ErrorMessage("%s must be an absolute path. %s is not absolute." %
+                                   (highlight("--incremental-virtualenv"), highlight(args.virtualenv_snapshots)))
+
+            if not args.is_inner:
+                if not os.path.exists(args.virtualenv_snapshots):
+                    umasked_makedirs(args.virtualenv_snapshots, 0o755)
+                elif not os.path.isdir(args.virtualenv_snapshots) or not os.access(args.virtualenv_snapshots, os.W_OK):
+                    raise ErrorMessage("The virtualenv snapshot folder %s is not a writable folder" %
+                                       highlight(args.virtualenv_snapshots))
+                the_context.mounts.add(args.virtualenv_snapshots)
+
+    @staticmethod
+    def _get_installed_packages(pip_binary: str) -> Dict[str, str]:
+        out = run_process(pip_binary, "list", "--format=json", "--disable-pip-version-check")
+        # run_process merges stderr into the output, so we look for the line containing the JSON list
+        for line in out.output.split("\n"):
+            if line.startswith("["):
+                return {pkg["name"]: pkg["version"] for pkg in json.loads(line)}
+        return {}
+
+    @staticmethod
+    def _get_requested_packages(args: configargparse.Namespace, local_wheels: List[str]) -> Union[List[str], None]:
+        """
+        :return: the requirement specifiers of all packages requested by the user, or ``None`` if GoPythonGo can't
+                 tell, because some of them are not plain requirement specifiers (e.g. URLs or paths)
+        """
+        if args.setuppy_install and not args.setuppy_install_wheels:
+            return None
+
+        from packaging.requirements import Requirement, InvalidRequirement
+        for spec in args.packages:
+            try:
+                Requirement(spec)
+            except InvalidRequirement:
+                return None
+        return args.packages + [parse_wheel_filename(wheel)[0] for wheel in local_wheels]
+
     def assemble(self, args: configargparse.Namespace) -> None:
-        print_info("Initializing virtualenv in %s" % args.build_path)
-        venv = [args.virtualenv_binary]
-        if args.python_binary:
-            venv += ["-p", args.python_binary]
-        venv += [args.build_path]
-        run_process(*venv)
+        snapshot = None  # type: str
+        previous = None  # type: Dict[str, str]
+        if args.virtualenv_snapshots:
+            snapshot = venvsnapshot.get_snapshot_filename(args.virtualenv_snapshots, args.build_path,
+                                                          args.python_binary)
+            previous = venvsnapshot.restore_snapshot(snapshot, args.build_path)
+
+        if previous is None:
+            print_info("Initializing virtualenv in %s" % args.build_path)
+            venv = [args.virtualenv_binary]
+            if args.python_binary:
+                venv += ["-p", args.python_binary]
+            venv += [args.build_path]
+            run_process(*venv)
 
         pip_binary = create_script_path(args.build_path, "pip")
         run_pip = [pip_binary, "install"]
@@ -76,12 +180,52 @@ class VirtualEnvAssembler(BaseAssembler):
             print_info("Making sure that pip and virtualenv are up to date")
             run_process(*run_pip + ["--upgrade", "pip", "virtualenv"])
 
-        print_info("Installing pip packages")
-        if args.packages:
-            run_process(*run_pip + args.packages)
-
         envpy = create_script_path(args.build_path, "python")
-        if args.setuppy_install:
+
+        local_wheels = []  # type: List[str]
+        wheelbuild_dir = None  # type: str
+        if args.setuppy_install and args.setuppy_install_wheels:
+            wheelbuild_dir = tempfile.mkdtemp(prefix="gopythongo-wheels-")
+            local_wheels = self._build_local_wheels(args, pip_binary, wheelbuild_dir)
+
+        run_install = run_pip
+        if previous is not None:
+            # without --upgrade pip would keep the restored versions of unpinned requirements
+            run_install = run_pip + ["--upgrade", "--upgrade-strategy", "only-if-needed"]
+
+        try:
+            if args.packages or local_wheels:
+                print_info("Installing pip packages")
+                started = time.monotonic()
+                if args.wheel_cache:
+                    cache = WheelCache(args.wheel_cache, args.wheel_cache_max_size * 1024 * 1024)
+                    wheeldir = cache.open(envpy)
+
+                    # build or download all wheels into the cache, reusing the ones that are already there, then
+                    # install exclusively from the cache. Local project wheels are only passed through the cache so
+                    # pip resolves their dependencies, they're removed from it right away.
+                    run_wheel = [pip_binary, "wheel", "--wheel-dir", wheeldir, "--find-links", wheeldir]
+                    run_process(*run_wheel + args.pip_opts + args.packages + local_wheels)
+                    cache.discard([os.path.basename(x) for x in local_wheels])
+                    run_process(*run_install + ["--no-index", "--find-links", wheeldir] + args.packages +
+                                local_wheels)
+
+                    cache.record_usage(self._get_installed_packages(pip_binary))
+                    cache.close()
+                else:
+                    run_process(*run_install + args.packages + local_wheels)
+
+                if previous is not None and local_wheels:
+                    # local projects often keep their version number between builds, so pip would consider the
+                    # restored ones up to date
+                    run_process(*run_pip + ["--no-deps", "--force-reinstall"] + local_wheels)
+                print_info("Installing %s packages took %.1fs" %
+                           (highlight(str(len(args.packages) + len(local_wheels))), time.monotonic() - started))
+        finally:
+            if wheelbuild_dir:
+                shutil.rmtree(wheelbuild_dir, ignore_errors=True)
+
+        if args.setuppy_install and not args.setuppy_install_wheels:
             print_info("Installing setup.py packages")
             for path in args.setuppy_install:
                 print()
@@ -90,6 +234,59 @@ class VirtualEnvAssembler(BaseAssembler):
                 run_spy = [envpy, "setup.py", "install"]
                 run_process(*run_spy)
 
+        if args.virtualenv_snapshots:
+            if previous is not None:
+                requested = self._get_requested_packages(args, local_wheels)
+                if requested is None:
+                    print_warning("Not removing packages which are no longer required from the restored virtualenv, "
+                                  "because GoPythonGo can't determine the names of all requested packages")
+                else:
+                    orphans = venvsnapshot.find_orphans(envpy, requested)
+                    if orphans:
+                        run_process(pip_binary, "uninstall", "-y", *orphans)
+
+            installed = self._get_installed_packages(pip_binary)
+            if previous is not None:
+                venvsnapshot.print_changes(previous, installed)
+            venvsnapshot.save_snapshot(snapshot, args.build_path, installed)
+
+    @staticmethod
+    def _build_wheel(pip_binary: str, pip_opts: List[str], path: str, outdir: str) -> Tuple[str, float]:
+        started = time.monotonic()
+        # --no-deps: dependencies, including other local projects, are resolved in a single pass when installing
+        run_process(pip_binary, "wheel", "--no-deps", "--wheel-dir", outdir, *pip_opts + [path])
+        wheels = [os.path.join(outdir, fn) for fn in os.listdir(outdir) if fn.endswith(".whl")]
+        if len(wheels) != 1:
+            raise ErrorMessage("Building a wheel from %s should have created exactly one wheel, but it created %s" %
+                               (highlight(path), len(wheels)))
+        return wheels[0], time.monotonic() - started
+
+    def _build_local_wheels(self, args: configargparse.Namespace, pip_binary: str, wheelbuild_dir: str) -> List[str]:
+        """
+        Builds wheels for all --setuppy-install projects concurrently. The projects don't depend on each other at
+        build time, so they can all be built at once.
+
+        :return: a list of wheel filenames in the same order as ``args.setuppy_install``
+        """
+        print_info("Building wheels for %s local projects using %s parallel jobs" %
+                   (highlight(str(len(args.setuppy_install))), highlight(str(args.setuppy_install_jobs))))
+        started = time.monotonic()
+        results = []  # type: List[Tuple[str, float]]
+        with ThreadPoolExecutor(max_workers=args.setuppy_install_jobs) as executor:
+            futures = []  # type: List[Future[Tuple[str, float]]]
+            for ix, path in enumerate(args.setuppy_install):
+                outdir = os.path.join(wheelbuild_dir, str(ix))
+                os.mkdir(outdir)
+                futures.append(executor.submit(self._build_wheel, pip_binary, args.pip_opts,
+                                               os.path.abspath(path), outdir))
+            for f in futures:
+                results.append(f.result())
+
+        for path, (wheel, duration) in zip(args.setuppy_install, results):
+            print_info("Built %s from %s in %.1fs" % (highlight(os.path.basename(wheel)), highlight(path), duration))
+        print_info("Building local wheels took %.1fs" % (time.monotonic() - started))
+        return [wheel for wheel, _ in results]
+
     def print_help(self) -> None:
         print("VirtualEnv Assembler\n"
               "====================\n"
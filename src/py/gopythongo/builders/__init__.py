@@ -6,17 +6,27 @@
 from abc import abstractmethod
 
 import configargparse
+import glob
+import json
+import re
+import shutil
 import subprocess
 import sys
 import os
+import time
+import zipfile
 
-from typing import Dict, List, Tuple, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple, Any, Set, Callable, Union
 
 import gopythongo
 
+from gopythongo import utils
 from gopythongo.utils import print_info, highlight, create_script_path, print_warning, plugins, \
-                             CommandLinePlugin, ErrorMessage
+                             CommandLinePlugin, ErrorMessage, run_process, cmdargs_unquote_split, print_error, \
+                             print_debug
 from gopythongo.utils.buildcontext import the_context
+from gopythongo.utils.wheelcache import parse_wheel_filename
 from gopythongo.builders import help as _builder_help
 
 _builders = {}  # type: Dict[str, 'BaseBuilder']
@@ -60,12 +70,12 @@ def get_builders() -> Dict[str, 'BaseBuilder']:
 def init_subsystem() -> None:
     global _builders
 
-    from gopythongo.builders import docker, pbuilder, noisolation
-    _builders = {
-        "pbuilder": pbuilder.builder_class(),
-        "docker": docker.builder_class(),
-        "noisolation": noisolation.builder_class(),
-    }
+    _builders = {}
+    plugins.register_builtins(_builders, {
+        "pbuilder": "gopythongo.builders.pbuilder",
+        "docker": "gopythongo.builders.docker",
+        "noisolation": "gopythongo.builders.noisolation",
+    }, "builder_class", BaseBuilder, "builder_name")
 
     plugins.load_plugins("gopythongo.builders", _builders, "builder_class", BaseBuilder, "builder_name")
 
@@ -120,6 +130,19 @@ def add_args(parser: configargparse.ArgumentParser) -> None:
                                  "creating the virtualenv (e.g. driver libs for databases so that Python C extensions "
                                  "compile correctly")
 
+    gr_builder.add_argument("--matrix", dest="matrix", action="append", default=[],
+                            help="Build the project several times in parallel, e.g. for multiple distributions, "
+                                 "while versioning happens only once. Takes an argument in the form "
+                                 "'name:arguments' where 'arguments' are additional GoPythonGo command-line arguments "
+                                 "for this build, e.g. 'bookworm:--distribution=bookworm "
+                                 "--basetgz=/var/cache/pbuilder/bookworm.tgz --repo=bookworm'. The artifacts of each "
+                                 "build are stored with its arguments, so the builds can store into different "
+                                 "targets. Use the arguments to make sure that each build creates artifacts with "
+                                 "distinct filenames and that builds storing into the same target (e.g. an aptly "
+                                 "repo) create distinct packages.")
+    gr_builder.add_argument("--matrix-jobs", dest="matrix_jobs", type=int, default=None,
+                            help="The number of --matrix builds to run at the same time. (Default: all of them)")
+
     parser.add_argument("--help-builder", choices=_builders.keys(), default=None,
                         action=_builder_help.BuilderHelpAction)
 
@@ -131,22 +154,110 @@ class NoMountableGoPythonGo(ErrorMessage):
     pass
 
 
-def _test_gopythongo_version(cmd: List[str]) -> bool:
+_version_probe_cache = {}  # type: Dict[Tuple[str, str, float], Union[str, None]]
+
+
+def _cached_probe(kind: str, filename: str, probe: Callable[[str], Union[str, None]]) -> Union[str, None]:
+    """
+    Returns the result of ``probe(filename)``, which is cached until the mtime of ``filename`` changes.
+    """
+    key = (kind, os.path.abspath(filename), os.path.getmtime(filename))
+    if key not in _version_probe_cache:
+        _version_probe_cache[key] = probe(filename)
+    return _version_probe_cache[key]
+
+
+def _read_metadata_version(metadata_file: str) -> Union[str, None]:
+    """
+    :return: the version from a ``METADATA`` or ``PKG-INFO`` file if it describes GoPythonGo
+    """
+    fields = {}  # type: Dict[str, str]
+    with open(metadata_file, "rt", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            if not line.strip():
+                break  # the headers end at the first empty line
+            if ":" in line and not line[0].isspace():
+                key, value = line.split(":", 1)
+                fields.setdefault(key.strip().lower(), value.strip())
+    if fields.get("name", "").lower() == "gopythongo":
+        return fields.get("version")
+    return None
+
+
+def _find_metadata_files(virtualenv: str) -> List[str]:
+    """
+    :return: the metadata files of all GoPythonGo distributions installed in the virtualenv ``virtualenv``, including
+             development installs
+    """
+    ret = []  # type: List[str]
+    libdirs = glob.glob(os.path.join(virtualenv, "lib", "python*", "site-packages")) + \
+        [os.path.join(virtualenv, "Lib", "site-packages")]
+    for libdir in libdirs:
+        ret += glob.glob(os.path.join(libdir, "gopythongo-*.dist-info", "METADATA"))
+        ret += glob.glob(os.path.join(libdir, "gopythongo-*.egg-info", "PKG-INFO"))
+        # "setup.py develop" links to the source tree, which contains the metadata
+        egglink = os.path.join(libdir, "gopythongo.egg-link")
+        if os.path.isfile(egglink):
+            with open(egglink, "rt", encoding="utf-8") as f:
+                srcdir = f.readline().strip()
+            ret += glob.glob(os.path.join(srcdir, "gopythongo.egg-info", "PKG-INFO"))
+    return ret
+
+
+def _read_pex_version(pexfile: str) -> Union[str, None]:
+    """
+    :return: the version of the GoPythonGo distribution bundled in the PEX executable ``pexfile`` according to its
+             ``PEX-INFO`` manifest
+    """
     try:
-        output = subprocess.check_output(cmd, stderr=subprocess.STDOUT).strip().decode("utf-8")
-        if output == gopythongo.program_version:
-            return True
-        if len(output) >= 10 and output[:10] == gopythongo.program_version[:10]:
-            raise NoMountableGoPythonGo("Mixed versions! %s is GoPthonGo, but a different version (%s vs. %s)" %
-                                        (highlight(cmd[0]), highlight(output[11:]),
-                                         highlight(gopythongo.program_version[11:])))
+        with zipfile.ZipFile(pexfile) as pex:
+            pexinfo = json.loads(pex.read("PEX-INFO").decode("utf-8"))
+    except (zipfile.BadZipFile, KeyError, OSError, ValueError):
+        return None
+
+    for dist in pexinfo.get("distributions", {}).keys():
+        parsed = parse_wheel_filename(dist)
+        if parsed and parsed[0] == "gopythongo":
+            return parsed[1]
+    return None
+
+
+def _run_version_probe(cmd: List[str]) -> Union[str, None]:
+    try:
+        return subprocess.check_output(cmd, stderr=subprocess.STDOUT).strip().decode("utf-8")
     except subprocess.CalledProcessError as e:
         raise NoMountableGoPythonGo("Error when trying to find out GoPythonGo version of nested executable. %s" %
                                     str(e)) from e
 
+
+def _test_gopythongo_version(cmd: List[str]) -> bool:
+    output = _cached_probe(" ".join(cmd), cmd[0], lambda _: _run_version_probe(cmd))
+    if output == gopythongo.program_version:
+        return True
+    if len(output) >= 10 and output[:10] == gopythongo.program_version[:10]:
+        raise NoMountableGoPythonGo("Mixed versions! %s is GoPthonGo, but a different version (%s vs. %s)" %
+                                    (highlight(cmd[0]), highlight(output[11:]),
+                                     highlight(gopythongo.program_version[11:])))
+
     raise NoMountableGoPythonGo("Found something, but it's not GoPythonGo? (%s)" % output)
 
 
+def _test_gopythongo_metadata(files: List[str], probe: Callable[[str], Union[str, None]]) -> bool:
+    """
+    Checks the package metadata in ``files`` for the version of GoPythonGo without executing it, which is a lot
+    faster than starting another GoPythonGo process.
+
+    :return: ``True`` if one of ``files`` says it's this version of GoPythonGo. Otherwise GoPythonGo must be run to
+             find out.
+    """
+    for fn in files:
+        version = _cached_probe("metadata", fn, probe)
+        if version == gopythongo.version:
+            print_debug("%s says that it is %s" % (highlight(fn), gopythongo.program_version))
+            return True
+    return False
+
+
 def test_gopythongo(path: str) -> Tuple[str, List[str]]:
     """
     :returns: (str, list) -- A tuple containing the base path of the virtualenv/executable and a list containing
@@ -157,13 +268,16 @@ def test_gopythongo(path: str) -> Tuple[str, List[str]]:
         if os.access(path, os.X_OK):
             # path might be a PEX executable
             print_info("We found what is presumably a PEX executable in %s" % highlight(path))
-            if _test_gopythongo_version([path, "--version"]):
+            if _test_gopythongo_metadata([path], _read_pex_version) or \
+                    _test_gopythongo_version([path, "--version"]):
                 return os.path.dirname(path), [path]
 
     elif os.path.isdir(path):
         if os.access(create_script_path(path, "python"), os.X_OK):
             print_info("We found what is presumably a virtualenv in %s" % highlight(path))
-            if _test_gopythongo_version([create_script_path(path, "python"), "-m", "gopythongo.main", "--version"]):
+            if _test_gopythongo_metadata(_find_metadata_files(path), _read_metadata_version) or \
+                    _test_gopythongo_version([create_script_path(path, "python"), "-m", "gopythongo.main",
+                                              "--version"]):
                 return path, [create_script_path(path, "python"), "-m", "gopythongo.main"]
     raise NoMountableGoPythonGo("Can't find GoPythonGo as a virtualenv or PEX executable in %s" % path)
 
@@ -204,6 +318,16 @@ def validate_args(args: configargparse.Namespace) -> None:
     if not gpg_path_found:
         raise ErrorMessage("Can't detect GoPythonGo path. You should run GoPythonGo from a virtualenv.")
 
+    if args.matrix and not args.matrix_entry:
+        names = [parse_matrix_entry(entry)[0] for entry in args.matrix]
+        if len(set(names)) != len(names):
+            raise ErrorMessage("Each %s entry must have a unique name" % highlight("--matrix"))
+        if args.matrix_jobs is not None and args.matrix_jobs < 1:
+            raise ErrorMessage("%s must be at least 1" % highlight("--matrix-jobs"))
+        if args.builder_debug_login:
+            raise ErrorMessage("%s can't be used with %s" % (highlight("--builder-debug-login"),
+                                                            highlight("--matrix")))
+
     if not args.is_inner:
         for ix, runspec in enumerate(args.run_after_create):
             if os.path.isfile(runspec):
@@ -217,3 +341,168 @@ def validate_args(args: configargparse.Namespace) -> None:
 
 def build(args: configargparse.Namespace) -> None:
     _builders[args.builder].build(args)
+
+
+def parse_matrix_entry(entry: str) -> Tuple[str, List[str]]:
+    """
+    :return: a tuple of ``(name, arguments)`` for a --matrix argument
+    """
+    if ":" in entry:
+        name, extra_args = entry.split(":", 1)
+    else:
+        name, extra_args = entry, ""
+
+    if not re.match(r"^[A-Za-z0-9._-]+$", name):
+        raise ErrorMessage("The name of --matrix entry %s must only contain letters, digits, '.', '_' and '-'" %
+                           highlight(entry))
+    return name, cmdargs_unquote_split(extra_args) if extra_args.strip() else []
+
+
+def _get_matrix_cmd(name: str, extra_args: List[str], resume_from: str, statefile: str) -> List[str]:
+    # --store-only doesn't look for GoPythonGo, because it doesn't start a build environment
+    gopythongo_cmd = the_context.gopythongo_cmd or [sys.executable, "-m", "gopythongo.main"]
+    return gopythongo_cmd + sys.argv[1:] + extra_args + \
+        ["--matrix-entry", name, "--resume-from", resume_from, "--state-file", statefile]
+
+
+def _run_matrix_build(args: configargparse.Namespace, name: str, extra_args: List[str],
+                      basestate: str) -> Tuple[str, str, int, float]:
+    statefile = os.path.join(the_context.tempmount, "matrix-%s.json" % name)
+    shutil.copyfile(basestate, statefile)
+    # the child GoPythonGo resumes the build from the shared versions and stops after the build
+    cmd = _get_matrix_cmd(name, extra_args, "build", statefile)
+    started = time.time()
+    ret = run_process(*cmd, allow_nonzero_exitcode=True)
+    return statefile, ret.output, ret.exitcode, time.time() - started
+
+
+def tag_matrix_artifacts(args: configargparse.Namespace, store_target: str) -> None:
+    """
+    Records the --matrix entry that created the packer artifacts in ``the_context`` and the target that the entry's
+    Store will store them in, in the artifacts' metadata as ``matrix_entry`` and ``store_target``.
+    """
+    for artifact in the_context.packer_artifacts:
+        artifact.artifact_metadata["matrix_entry"] = args.matrix_entry
+        artifact.artifact_metadata["store_target"] = store_target
+
+
+def check_matrix_artifacts(created: List[Tuple[str, List[Dict[str, Any]]]]) -> None:
+    """
+    Makes sure that the --matrix builds don't conflict with each other.
+
+    :param created: a list of ``(name, artifacts)`` with the serialized packer artifacts of each --matrix build
+    :raises ErrorMessage: if two builds created the same file or the same package in the same version for the same
+                          store target
+    """
+    created_by = {}  # type: Dict[str, str]
+    packaged_by = {}  # type: Dict[Tuple[str, str, str, str], str]
+    for name, artifacts in created:
+        for artifact in artifacts:
+            filename = os.path.abspath(artifact["af"])
+            if filename in created_by:
+                raise ErrorMessage("Matrix builds %s and %s both created %s. Use the arguments of the %s entries "
+                                   "to give their artifacts distinct filenames." %
+                                   (highlight(created_by[filename]), highlight(name), highlight(filename),
+                                    highlight("--matrix")))
+            created_by[filename] = name
+
+            metadata = artifact["am"]
+            if "package_name" not in metadata or "version" not in metadata:
+                continue
+            key = (metadata.get("store_target", ""), artifact["t"], metadata["package_name"], metadata["version"])
+            if key in packaged_by:
+                raise ErrorMessage("Matrix builds %s and %s both created %s %s in version %s for %s. Use the "
+                                   "arguments of the %s entries to store them into different targets or to give "
+                                   "the packages distinct names." %
+                                   (highlight(packaged_by[key]), highlight(name), key[1], highlight(key[2]),
+                                    highlight(key[3]), key[0], highlight("--matrix")))
+            packaged_by[key] = name
+
+
+def build_matrix(args: configargparse.Namespace) -> None:
+    """
+    Builds the project once for each --matrix entry, each in its own GoPythonGo process with the entry's additional
+    arguments. Up to --matrix-jobs builds run at the same time. The output of each build is printed as a whole and
+    in the order of the entries once it's finished, and the packer artifacts of all builds are collected in
+    ``the_context``, so the Store stores them together.
+    """
+    entries = [parse_matrix_entry(entry) for entry in args.matrix]
+    basestate = os.path.join(the_context.tempmount, "matrix-base.json")
+    the_context.persist_state(basestate, "version")
+
+    statefiles = []  # type: List[Tuple[str, str]]
+    failed = []  # type: List[str]
+    with ThreadPoolExecutor(max_workers=args.matrix_jobs or len(entries)) as executor:
+        futures = []
+        for name, extra_args in entries:
+            print_info("Starting matrix build %s" % highlight(name))
+            futures.append((name, executor.submit(_run_matrix_build, args, name, extra_args, basestate)))
+
+        for name, future in futures:
+            statefile, output, exitcode, duration = future.result()
+            print(highlight("******** Output of matrix build %s follows ********" % name))
+            print(output)
+            if exitcode != 0:
+                print_error("Matrix build %s failed with exit code %s after %.1fs" % (highlight(name), exitcode,
+                                                                                     duration))
+                failed.append(name)
+            else:
+                print_info("Matrix build %s finished in %.1fs" % (highlight(name), duration))
+                statefiles.append((name, statefile))
+
+    if failed:
+        raise ErrorMessage("Matrix build(s) %s failed" % highlight(", ".join(failed)))
+    if utils.debug_donotexecute:
+        return
+
+    # check for builds that overwrote each other's artifacts before verifying the artifacts' digests
+    created = []  # type: List[Tuple[str, List[Dict[str, Any]]]]
+    for name, statefile in statefiles:
+        with open(statefile, "rt", encoding="utf-8") as f:
+            created.append((name, json.load(f)["packer_artifacts"]))
+    check_matrix_artifacts(created)
+
+    artifacts = set()  # type: Set[Any]
+    for name, statefile in statefiles:
+        the_context.resume_state(statefile, "store")
+        artifacts.update(the_context.packer_artifacts)
+    the_context.packer_artifacts = artifacts
+
+
+def store_matrix(args: configargparse.Namespace) -> None:
+    """
+    Stores the packer artifacts in ``the_context`` of each --matrix entry with the entry's additional arguments, so
+    the entries can store into different targets. The entries are stored one after another, each by its own
+    GoPythonGo process.
+    """
+    by_entry = {}  # type: Dict[str, Set[Any]]
+    for artifact in the_context.packer_artifacts:
+        by_entry.setdefault(artifact.artifact_metadata.get("matrix_entry"), set()).add(artifact)
+
+    entries = [parse_matrix_entry(entry) for entry in args.matrix]
+    unknown = set(by_entry.keys()) - set(name for name, _ in entries)
+    if unknown:
+        raise ErrorMessage("The build contains artifacts that no %s entry created: %s" %
+                           (highlight("--matrix"),
+                            ", ".join(highlight(a.artifact_filename) for name in unknown for a in by_entry[name])))
+
+    artifacts = the_context.packer_artifacts
+    try:
+        for name, extra_args in entries:
+            if name not in by_entry:
+                continue
+            statefile = os.path.join(the_context.tempmount, "matrix-%s-store.json" % name)
+            the_context.packer_artifacts = by_entry[name]
+            the_context.persist_state(statefile, "build")
+
+            print_info("Storing the artifacts of matrix build %s" % highlight(name))
+            started = time.time()
+            ret = run_process(*_get_matrix_cmd(name, extra_args, "store", statefile), allow_nonzero_exitcode=True)
+            print(highlight("******** Output of storing matrix build %s follows ********" % name))
+            print(ret.output)
+            if ret.exitcode != 0:
+                raise ErrorMessage("Storing the artifacts of matrix build %s failed with exit code %s" %
+                                   (highlight(name), ret.exitcode))
+            print_info("Stored the artifacts of matrix build %s in %.1fs" % (highlight(name), time.time() - started))
+    finally:
+        the_context.packer_artifacts = artifacts
@@ -4,13 +4,15 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import hashlib
 import os
 import re
+import stat
 import uuid
 
 import configargparse
 
-from typing import Any, Type
+from typing import Any, Type, Dict, List, Tuple, TYPE_CHECKING
 
 import sys
 from gopythongo import utils
@@ -19,7 +21,9 @@ from gopythongo.utils import print_info, highlight, ErrorMessage, template, run_
     ProcessOutput, print_warning
 from gopythongo.builders import BaseBuilder, get_dependencies
 from gopythongo.utils.buildcontext import the_context
-from requests.exceptions import RequestException
+
+if TYPE_CHECKING:
+    from docker import APIClient
 
 
 class DockerBuilder(BaseBuilder):
@@ -49,7 +53,7 @@ class DockerBuilder(BaseBuilder):
                                     "used, GoPythonGo will not use '--force-rm' to clean up the intermediate build "
                                     "images.")
         gp_docker.add_argument("--docker-debug-savecontext", dest="docker_debug_save_context", default=None,
-                               help="Set this to a filename to save the .tar.gz that GoPythonGo assembles as a "
+                               help="Set this to a filename to save the .tar(.gz) that GoPythonGo assembles as a "
                                     "Docker context to build the build environment container using 'docker build'.")
         gp_docker.add_argument("--docker-buildarg", dest="docker_buildargs", default=[], action="append",
                                help="Allows you to set Docker build args in the form of 'KEY=VALUE' which will be "
@@ -58,10 +62,44 @@ class DockerBuilder(BaseBuilder):
                                help="Allows you to set Dockerfile Jinja template context variables in the form of "
                                     "'key=value' which will be passed into your Dockerfile template before it is "
                                     "rendered to be sent to the Docker daemon.")
+        gp_docker.add_argument("--docker-build-image-name", dest="docker_build_image_name",
+                               default="gopythongo-build", env_var="DOCKER_BUILD_IMAGE_NAME",
+                               help="GoPythonGo tags build environment images with this name and a hash of the "
+                                    "rendered Dockerfile, the build args and the context files. If an image with the "
+                                    "same hash exists, GoPythonGo reuses it instead of running 'docker build'. "
+                                    "(Default: gopythongo-build)")
+        gp_docker.add_argument("--docker-force-rebuild", dest="docker_force_rebuild", action="store_true",
+                               default=False, env_var="DOCKER_FORCE_REBUILD",
+                               help="Always run 'docker build', even if a build environment image with the same "
+                                    "hash already exists (e.g. to pull in updated base images or packages).")
+        gp_docker.add_argument("--docker-context-compression", dest="docker_context_compression",
+                               choices=["auto", "gzip", "none"], default="auto",
+                               env_var="DOCKER_CONTEXT_COMPRESSION",
+                               help="Compress the build context sent to the Docker daemon using gzip or send an "
+                                    "uncompressed tar. 'auto' only compresses the context if the Docker API is not "
+                                    "reached through a local unix socket, where compression is just CPU overhead. "
+                                    "(Default: auto)")
+        gp_docker.add_argument("--docker-context-max-memory", dest="docker_context_max_memory", type=int, default=16,
+                               env_var="DOCKER_CONTEXT_MAX_MEMORY",
+                               help="The build context is packed while it's being uploaded to the Docker daemon. "
+                                    "This sets the maximum amount of memory in MB that GoPythonGo uses to buffer the "
+                                    "context if the upload is slower than packing it. (Default: 16)")
+        gp_docker.add_argument("--docker-reproducible-context", dest="docker_reproducible_context",
+                               action="store_true", default=False, env_var="DOCKER_REPRODUCIBLE_CONTEXT",
+                               help="Create the build context as a reproducible tar: entries are sorted, mtimes are "
+                                    "clamped to SOURCE_DATE_EPOCH (or 0), all files are owned by root with 0755 or "
+                                    "0644 permissions and the gzip header contains no timestamp. The same inputs "
+                                    "then always result in a byte-identical context.")
 
     def validate_args(self, args: configargparse.Namespace) -> None:
         _docker_args.validate_shared_args(args)
 
+        if args.docker_context_max_memory < 1:
+            raise ErrorMessage("%s must be at least 1 (MB)" % highlight("--docker-context-max-memory"))
+
+        if args.docker_reproducible_context:
+            targz.get_source_date_epoch()
+
         if not args.docker_buildfile:
             raise ErrorMessage("Using the docker builder requires you to specify a Dockerfile template via "
                                "--docker-buildfile.")
@@ -87,46 +125,80 @@ class DockerBuilder(BaseBuilder):
             print_error("Remove container %s" % c)
             run_process("docker", "rm", c, allow_nonzero_exitcode=True)
 
-    def build(self, args: configargparse.Namespace) -> None:
-        print_info("Building with %s" % highlight("docker"))
-        ctx = {
-            "run_after_create": args.run_after_create,
-            "dependencies": get_dependencies()
-        }
-        ctx.update({key: value for key, value in [x.split("=", 1) for x in args.dockerfile_vars]})
-        dockerfile = template.process_to_tempfile(args.docker_buildfile, ctx)
-
-        # ship all config files in a .tar.gz as context via Docker STDIN
-        # then run GoPythonGo in the resulting container with all folders mounted
-
-        from gopythongo.main import config_paths
-        memtgz = targz.create_targzip(filename=None,
-                                      paths=[(x, x) for x in list(config_paths)] + [(dockerfile, "/Dockerfile",)],
-                                      verbose=utils.enable_debug_output)
+    @staticmethod
+    def _hash_context(paths: List[Tuple[str, str]], buildargs: Dict[str, str]) -> str:
+        """
+        Calculates a hash over everything that influences the result of 'docker build': The names, types and
+        permissions of all entries in the build context as it's sent to Docker (see ``_get_context_stream``), the
+        contents of the files (including the rendered Dockerfile), the targets of symlinks and the build args.
+        """
+        h = hashlib.sha256()
+        for path, arcname in sorted(targz.list_paths(paths, include_dirs=True), key=lambda x: x[1]):
+            st = os.lstat(path)
+            if stat.S_ISLNK(st.st_mode):
+                h.update(("%s\0l\0%s\0" % (arcname, os.readlink(path))).encode("utf-8"))
+            elif stat.S_ISDIR(st.st_mode):
+                h.update(("%s\0d\0%o\0" % (arcname, st.st_mode & 0o7777)).encode("utf-8"))
+            else:
+                h.update(("%s\0f\0%o\0" % (arcname, st.st_mode & 0o7777)).encode("utf-8"))
+                with open(path, "rb") as f:
+                    for chunk in iter(lambda: f.read(65536), b""):
+                        h.update(chunk)
+                h.update(b"\0")
 
-        if args.docker_debug_save_context:
-            with open(args.docker_debug_save_context, "wb") as f:
-                print_info("Saving Docker context to %s" % highlight(args.docker_debug_save_context))
-                f.write(memtgz.getvalue())
+        for key in sorted(buildargs.keys()):
+            h.update(("%s=%s\0" % (key, buildargs[key])).encode("utf-8"))
+        return h.hexdigest()[:32]
 
-        dcl = _docker_args.get_docker_client(args)
+    @staticmethod
+    def _image_exists(dcl: 'APIClient', image: str) -> bool:
+        from docker.errors import ImageNotFound
+        from requests.exceptions import RequestException
 
         try:
-            build_output = dcl.build(
-                fileobj=memtgz.getbuffer(),
-                custom_context=True,
-                encoding="gzip",
-                forcerm=not args.docker_leave_images,
-                decode=True,
-                buildargs={
-                    key: value for key, value in [x.split("=", 1) for x in args.docker_buildargs]
-                },
-            )
+            dcl.inspect_image(image)
+        except ImageNotFound:
+            return False
         except RequestException as e:
-            raise ErrorMessage("GoPythonGo failed to execute the Docker build API call: %s" % str(e)) from e
+            raise ErrorMessage("GoPythonGo failed to query the Docker API for image %s: %s" %
+                               (highlight(image), str(e))) from e
+        return True
+
+    @staticmethod
+    def _compress_context(args: configargparse.Namespace) -> bool:
+        if args.docker_context_compression == "auto":
+            return not (args.docker_api.startswith("unix://") or args.docker_api.startswith("npipe://"))
+        return args.docker_context_compression == "gzip"
+
+    def _get_context_stream(self, args: configargparse.Namespace,
+                            context_paths: List[Tuple[str, str]]) -> targz.TarStream:
+        return targz.TarStream(context_paths, compress=self._compress_context(args),
+                               max_memory=args.docker_context_max_memory * 1024 * 1024,
+                               verbose=utils.enable_debug_output, include_dirs=True,
+                               source_date_epoch=targz.get_source_date_epoch()
+                               if args.docker_reproducible_context else None)
+
+    def _build_image(self, dcl: 'APIClient', args: configargparse.Namespace, context_paths: List[Tuple[str, str]],
+                     buildargs: Dict[str, str], build_image: str) -> None:
+        from requests.exceptions import RequestException
+
+        print_info("Building build environment image %s" % highlight(build_image))
+        # docker-py uploads the context while TarStream is still packing it
+        with self._get_context_stream(args, context_paths) as context:
+            try:
+                build_output = dcl.build(
+                    fileobj=context,
+                    custom_context=True,
+                    encoding="gzip" if context.compress else None,
+                    forcerm=not args.docker_leave_images,
+                    decode=True,
+                    buildargs=buildargs,
+                    tag=build_image,
+                )
+            except RequestException as e:
+                raise ErrorMessage("GoPythonGo failed to execute the Docker build API call: %s" % str(e)) from e
 
         prev_progress = False
-        full_output = []
         # do a build with fancy string formatting
         for line in build_output:
             if "progress" in line:
@@ -142,16 +214,45 @@ class DockerBuilder(BaseBuilder):
 
                 if "stream" in line:
                     print_debug(line["stream"].strip())
-                    full_output.append(line["stream"].strip())
                 elif "error" in line:
                     raise ErrorMessage("Docker build failed with error message: %s" % line["error"])
 
-        m = re.search("Successfully built ([0-9a-zA-Z]+)", "\n".join(full_output))
-        if m:
-            build_container_id = m.group(1)
+        if not self._image_exists(dcl, build_image):
+            raise ErrorMessage("Docker did not create the build environment image %s, so GoPythonGo can't execute the "
+                               "build. Check the docker output for reasons." % highlight(build_image))
+
+    def build(self, args: configargparse.Namespace) -> None:
+        print_info("Building with %s" % highlight("docker"))
+        ctx = {
+            "run_after_create": args.run_after_create,
+            "dependencies": get_dependencies()
+        }
+        ctx.update({key: value for key, value in [x.split("=", 1) for x in args.dockerfile_vars]})
+        dockerfile = template.process_to_tempfile(args.docker_buildfile, ctx)
+
+        # ship all config files in a .tar.gz as context via Docker STDIN
+        # then run GoPythonGo in the resulting container with all folders mounted
+
+        from gopythongo.main import config_paths
+        context_paths = [(x, x) for x in list(config_paths)] + [(dockerfile, "/Dockerfile",)]
+        buildargs = {key: value for key, value in [x.split("=", 1) for x in args.docker_buildargs]}
+        build_image = "%s:%s" % (args.docker_build_image_name, self._hash_context(context_paths, buildargs))
+
+        if args.docker_debug_save_context:
+            with open(args.docker_debug_save_context, "wb") as f, \
+                    self._get_context_stream(args, context_paths) as context:
+                print_info("Saving Docker context to %s" % highlight(args.docker_debug_save_context))
+                for chunk in context:
+                    f.write(chunk)
+
+        dcl = _docker_args.get_docker_client(args).api
+
+        if not args.docker_force_rebuild and self._image_exists(dcl, build_image):
+            print_info("Reusing existing build environment image %s" % highlight(build_image))
         else:
-            raise ErrorMessage("Unable to find the container ID of the build container, so GoPythonGo can't "
-                               "execute the build. Check the docker output for reasons.")
+            self._build_image(dcl, args, context_paths, buildargs, build_image)
+
+        build_container_id = build_image
 
         temp_container_name = "gopythongo-%s" % str(uuid.uuid4())
 
@@ -171,6 +272,7 @@ class DockerBuilder(BaseBuilder):
 
         import gopythongo.main  # import for later use of break_handlers
         import dockerpty  # dockerpty imports fcntl which will fail on Windows, so we can't import it at the top
+        from requests.exceptions import RequestException
 
         if args.builder_debug_login:
             print_info("Without --builder-debug-login, inside this container GoPythonGo would have run: %s" %
@@ -260,7 +362,9 @@ class DockerBuilder(BaseBuilder):
               "\n"
               "The Docker build process runs in 3 steps:\n"
               "    1. A build container is created using 'docker build' if it doesn't exist\n"
-              "       yet, containing sources, header files and compilers as needed.\n"
+              "       yet, containing sources, header files and compilers as needed. The\n"
+              "       image is tagged with a hash of the rendered Dockerfile, the build args\n"
+              "       and the context files, so it's only rebuilt when one of them changes.\n"
               "    2. GoPythonGo executes inside that build container and builds a virtualenv\n"
               "       using 'docker run'. This can't be done in step 1 because docker doesn't\n"
               "       allow the mounting of host folders during build time.\n"
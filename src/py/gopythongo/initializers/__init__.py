@@ -24,11 +24,11 @@ def get_initializers() -> Dict[str, 'BaseInitializer']:
 def init_subsystem() -> None:
     global _initializers
 
-    from gopythongo.initializers import pbuilder_fpm_aptly, docker_copy_docker
-    _initializers = {
-        "pbuilder_deb": pbuilder_fpm_aptly.initializer_class(".gopythongo"),
-        "docker": docker_copy_docker.initializer_class(".gopythongo"),
-    }
+    _initializers = {}
+    plugins.register_builtins(_initializers, {
+        "pbuilder_deb": "gopythongo.initializers.pbuilder_fpm_aptly",
+        "docker": "gopythongo.initializers.docker_copy_docker",
+    }, "initializer_class", BaseInitializer, "initializer_name", [".gopythongo"])
 
     plugins.load_plugins("gopythongo.initializers", _initializers, "initializer_class", BaseInitializer,
                          "initializer_name", [".gopythongo"])
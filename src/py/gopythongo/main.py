@@ -16,12 +16,13 @@ import sys
 import os
 
 from gopythongo.utils.buildcontext import the_context
+from gopythongo.utils import outbox, template
 from types import FrameType
 from typing import List, Any, Iterable, Set, Sequence, Union, Callable, Dict
 
 import gopythongo
 
-from gopythongo import initializers, builders, versioners, assemblers, packers, stores, utils
+from gopythongo import initializers, builders, versioners, assemblers, packers, stores, utils, startupprofile
 from gopythongo.utils import highlight, print_error, print_warning, print_info, init_color, ErrorMessage, print_debug, \
     success
 
@@ -67,7 +68,8 @@ def get_parser() -> configargparse.ArgumentParser:
 
     for subargs in [initializers.add_args, builders.add_args, versioners.add_args, assemblers.add_args,
                     packers.add_args, stores.add_args]:
-        subargs(parser)
+        with startupprofile.measure("add_args", subargs.__module__):
+            subargs(parser)
 
     gr_plan = parser.add_argument_group("Execution plan")
     gr_plan.add_argument("--ecosystem", dest="ecosystem", choices=["python"], default="python",
@@ -90,6 +92,24 @@ def get_parser() -> configargparse.ArgumentParser:
     gr_plan.add_argument("--gopythongo-path", dest="gopythongo_path", default=None,
                          help="Path to a virtual environment that contains GoPythonGo or a PEX GoPythonGo executable. "
                               "This will be mounted into the build environment")
+    gr_plan.add_argument("--outbox", dest="outbox", default=None,
+                         help="Keep the packed artifacts and the build state in this folder until the Store has "
+                              "published them. If storing fails, run GoPythonGo again with --store-only to publish "
+                              "the artifacts without rebuilding them")
+    gr_plan.add_argument("--state-file", dest="state_file", default=None,
+                         help="Save the build state (versions and packed artifacts) to this file after each stage of "
+                              "the build, so a later run can resume the build using --resume-from")
+    gr_plan.add_argument("--resume-from", dest="resume_from", choices=the_context.stages[1:], default=None,
+                         help="Skip all stages of the build before this one and reuse the versions and artifacts "
+                              "recorded in --state-file (or in --outbox when resuming from 'store'). Resuming from "
+                              "'build' reuses the versions, resuming from 'store' publishes the already packed "
+                              "artifacts")
+    gr_plan.add_argument("--store-only", dest="store_only", action="store_true", default=False,
+                         help="Skip the build and store the artifacts of a previous build. Shorthand for "
+                              "--resume-from=store")
+    gr_plan.add_argument("--template-cache", dest="template_cache", default=None,
+                         help="Store the bytecode of compiled Jinja2 templates in this folder, so later builds don't "
+                              "have to compile unchanged templates again")
     gr_plan.add_argument("--debug-noexec", dest="debug_noexec", action="store_true", default=False,
                          help="Setting this will prevent GoPythonGo from executing any commands. The command-line "
                               "will instead be printed to stdout for debugging purposes")
@@ -108,6 +128,13 @@ def get_parser() -> configargparse.ArgumentParser:
     gr_out.add_argument("--no-color", dest="no_color", action="store_true", default=False,
                         help="Do not use ANSI color sequences in output")
     gr_out.add_argument("--debug-config", action=DebugConfigAction)
+    gr_out.add_argument("--profile-startup", dest="profile_startup", action="store_true", default=False,
+                        help="Report how long GoPythonGo took to start, broken down by imported module and by plugin "
+                             "subsystem. This must be set on the command-line, because profiling has to begin before "
+                             "the configuration is read")
+    gr_out.add_argument("--profile-startup-json", dest="profile_startup_json", default=None, metavar="JSONFILE",
+                        help="Like --profile-startup, but write the profile to JSONFILE as JSON. Processes inside the "
+                             "build environment write to JSONFILE-inner.json")
 
     # This parameter signals to GoPythonGo that it is running inside the build environment,
     # you will likely never have to use this parameter yourself. It is used by GoPythonGo
@@ -117,6 +144,8 @@ def get_parser() -> configargparse.ArgumentParser:
     # serialized version as read by the Versioner and parsed by the Version Parser outside of the build environment
     parser.add_argument("--read-state", dest="read_state", default=None, help=argparse.SUPPRESS)
     parser.add_argument("--cwd", dest="cwd", default=None, help=argparse.SUPPRESS)
+    # the name of the --matrix entry that a GoPythonGo process started by a matrix build builds
+    parser.add_argument("--matrix-entry", dest="matrix_entry", default=None, help=argparse.SUPPRESS)
 
     return parser
 
@@ -135,6 +164,17 @@ def validate_args(args: configargparse.Namespace) -> None:
                                "both be present." % (highlight("--inner"), highlight("--read-state"),
                                                      highlight("--cwd"), highlight("MUST")))
 
+    if args.store_only:
+        if args.resume_from and args.resume_from != "store":
+            raise ErrorMessage("%s can't be combined with %s" %
+                               (highlight("--store-only"), highlight("--resume-from=%s" % args.resume_from)))
+        args.resume_from = "store"
+
+    if args.resume_from and not args.state_file and not (args.resume_from == "store" and args.outbox):
+        raise ErrorMessage("To resume the build from stage %s, GoPythonGo needs the state of a previous build from "
+                           "%s%s" % (highlight(args.resume_from), highlight("--state-file"),
+                                     " or %s" % highlight("--outbox") if args.resume_from == "store" else ""))
+
     if args.eatmydata:
         if not os.path.exists(args.eatmydata_executable) or not os.access(args.eatmydata_executable, os.X_OK):
             print_warning("%s is set, but %s is not an executable" %
@@ -147,6 +187,10 @@ def validate_args(args: configargparse.Namespace) -> None:
         # executable inside
         assemblers.validate_args(args)
         packers.validate_args(args)
+    elif args.resume_from == "store":
+        # --store-only doesn't build, assemble or pack anything, so don't block on their configuration
+        versioners.validate_args(args)
+        stores.validate_args(args)
     else:
         for subvalidate in [initializers.validate_args, builders.validate_args, versioners.validate_args,
                             assemblers.validate_args, packers.validate_args, stores.validate_args]:
@@ -209,12 +253,31 @@ def _find_default_mounts() -> Set[str]:
     return paths
 
 
+def _persist_state(args: configargparse.Namespace, completed_stage: str) -> None:
+    if args.state_file:
+        the_context.persist_state(args.state_file, completed_stage)
+
+
+def _report_startup_profile(args: configargparse.Namespace) -> None:
+    startupprofile.finish()
+    process = "inner" if args.is_inner else "matrix-%s" % args.matrix_entry if args.matrix_entry else "outer"
+    if args.profile_startup_json:
+        filename = args.profile_startup_json
+        if process != "outer":
+            filename = "%s-%s.json" % (os.path.splitext(filename)[0], process)
+        startupprofile.write_json(filename, process)
+        print_info("Wrote startup profile to %s" % highlight(filename))
+    else:
+        print_info("Startup profile (%s process):\n%s" % (process, startupprofile.format_report()))
+
+
 def route() -> None:
     signal.signal(signal.SIGINT, _sigint_handler)
 
     for subinit in [initializers.init_subsystem, versioners.init_subsystem, builders.init_subsystem,
                     assemblers.init_subsystem, packers.init_subsystem, stores.init_subsystem]:
-        subinit()
+        with startupprofile.measure("init_subsystem", subinit.__module__):
+            subinit()
 
     precheck = configargparse.ArgumentParser(add_help=False)
     precheck.add_argument("--cwd", dest="cwd", default=None, help=argparse.SUPPRESS)
@@ -237,11 +300,15 @@ def route() -> None:
                            "permissions." % highlight(os.getcwd()))
 
     if len(sys.argv) > 1:
-        args = get_parser().parse_args()
+        with startupprofile.measure("parse_args", "gopythongo.main"):
+            args = get_parser().parse_args()
         atexit.register(_cleanup_tempfiles, args)
         break_handlers["cleanup-tempfiles"] = lambda: _cleanup_tempfiles(args)
         init_color(args.no_color)
 
+        if startupprofile.is_enabled():
+            _report_startup_profile(args)
+
         validate_args(args)
 
         for mount in _find_default_mounts():
@@ -254,16 +321,51 @@ def route() -> None:
         utils.debug_donotexecute = args.debug_noexec
         utils.enable_debug_output = args.verbose
 
-        if not args.is_inner:
-            # STEP 1: Start the build, which will execute gopythongo.main --inner for step 2
-            versioners.version(args)
-            assemblers.assemble(args, assemblers.BaseAssembler.TYPE_PREISOLATION)
-            the_context.save_state()
-            builders.build(args)
+        if args.template_cache:
+            template.set_bytecode_cache(args.template_cache)
 
-            # STEP 3: After the inner, 2nd gopythongo process is finished, we end up here
-            the_context.load_state()
-            stores.store(args)
+        if not args.is_inner:
+            if args.resume_from == "store" and args.outbox and not args.matrix_entry:
+                outbox.load_outbox(args.outbox)
+            elif args.resume_from:
+                the_context.resume_state(args.state_file, args.resume_from)
+                print_info("Resuming the build from stage %s" % highlight(args.resume_from))
+
+            if not args.resume_from:
+                versioners.version(args)
+                _persist_state(args, "version")
+
+            if args.resume_from != "store":
+                # the packers will create new artifacts
+                the_context.packer_artifacts = set()
+
+                if args.matrix and not args.matrix_entry:
+                    # run one GoPythonGo process for each --matrix entry, which runs STEP 1 to 3 below
+                    builders.build_matrix(args)
+                else:
+                    # STEP 1: Start the build, which will execute gopythongo.main --inner for step 2
+                    assemblers.assemble(args, assemblers.BaseAssembler.TYPE_PREISOLATION)
+                    the_context.save_state()
+                    builders.build(args)
+
+                    # STEP 3: After the inner, 2nd gopythongo process is finished, we end up here
+                    the_context.load_state()
+
+                if args.matrix_entry:
+                    builders.tag_matrix_artifacts(args, stores.get_target(args))
+                elif args.outbox:
+                    outbox.fill_outbox(args.outbox)
+                _persist_state(args, "build")
+
+            # the GoPythonGo process running a matrix build stores the artifacts of each build through another
+            # GoPythonGo process with the build's arguments
+            if not args.matrix_entry or args.resume_from == "store":
+                if args.matrix and not args.matrix_entry:
+                    builders.store_matrix(args)
+                else:
+                    stores.store(args)
+                if args.outbox and not args.matrix_entry:
+                    outbox.clear_outbox(args.outbox)
         else:
             # we can't use .load_state() here because the_context doesn't know the state_file's path yet
             the_context.read(args.read_state)
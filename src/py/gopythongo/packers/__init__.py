@@ -21,12 +21,12 @@ def get_packers() -> Dict[str, 'BasePacker']:
 
 def init_subsystem() -> None:
     global _packers
-    from gopythongo.packers import fpm, targz
-
-    _packers = {
-        u"fpm": fpm.packer_class(),
-        u"targz": targz.packer_class(),
-    }
+    _packers = {}
+    plugins.register_builtins(_packers, {
+        u"fpm": "gopythongo.packers.fpm",
+        u"deb": "gopythongo.packers.deb",
+        u"targz": "gopythongo.packers.targz",
+    }, "packer_class", BasePacker, "packer_name")
 
     plugins.load_plugins("gopythongo.packers", _packers, "packer_class", BasePacker, "packer_name")
 
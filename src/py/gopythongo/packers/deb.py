@@ -0,0 +1,312 @@
+# -* encoding: utf-8 *-
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import argparse
+import getpass
+import os
+import platform
+import shlex
+import socket
+import time
+
+import configargparse
+
+from typing import Any, List, Type, Tuple
+
+from gopythongo.packers.fpm import FPMPacker
+from gopythongo.utils import print_info, highlight, ErrorMessage, sha256_file, targz
+from gopythongo.utils.buildcontext import the_context, PackerArtifact
+from gopythongo.utils.compression import backends, get_backend
+from gopythongo.utils.debfile import DebArchive
+
+# fpm's names for compression formats
+_fpm_compression = {
+    "gz": "gzip",
+    "zst": "zstd",
+}
+
+# maps the output of uname -m to Debian architectures, like fpm does for --architecture native
+_debian_architectures = {
+    "x86_64": "amd64",
+    "aarch64": "arm64",
+    "i386": "i386",
+    "i686": "i386",
+    "armv7l": "armhf",
+    "ppc64le": "ppc64el",
+    "s390x": "s390x",
+}
+
+
+class DebPacker(FPMPacker):
+    """
+    Creates .deb packages directly from Python instead of running FPM. The Packer reads the same opts files as the
+    FPM Packer (--run-fpm) and supports the subset of FPM's options that is commonly used to package a virtualenv.
+    """
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+
+    @property
+    def packer_name(self) -> str:
+        return "deb"
+
+    @property
+    def provides(self) -> List[str]:
+        return ["deb"]
+
+    def add_args(self, parser: configargparse.ArgumentParser) -> None:
+        # --run-fpm is added by the FPM Packer
+        gp_deb = parser.add_argument_group("Native .deb Packer options")
+        gp_deb.add_argument("--deb-compression", dest="deb_compression",
+                            choices=sorted(backends.keys()) + ["none"], default="gzip",
+                            help="The compression codec for the package contents (data.tar). zstd requires dpkg "
+                                 "1.21.18 or newer (Debian bookworm) on the target system and the 'zstandard' Python "
+                                 "package. The opts file can override this per package with FPM's --deb-compression "
+                                 "parameter. (Default: gzip)")
+        gp_deb.add_argument("--deb-compression-level", dest="deb_compression_level", type=int, default=None,
+                            help="The compression level for the package contents. (Default: the codec's default)")
+        gp_deb.add_argument("--deb-threads", dest="deb_threads", type=int, default=None,
+                            help="The number of threads to compress the package contents with. (Default: the number "
+                                 "of CPUs for gzip and zstd)")
+        gp_deb.add_argument("--deb-reproducible", dest="deb_reproducible", action="store_true", default=False,
+                            help="Create reproducible packages: file mtimes are clamped to --deb-source-date-epoch "
+                                 "and all generated files use it as their timestamp.")
+        gp_deb.add_argument("--deb-source-date-epoch", dest="deb_source_date_epoch", default=None,
+                            env_var="SOURCE_DATE_EPOCH",
+                            help="The UNIX timestamp used by --deb-reproducible. (Default: the SOURCE_DATE_EPOCH "
+                                 "environment variable or 0)")
+
+    def validate_args(self, args: configargparse.Namespace) -> None:
+        if not args.run_fpm:
+            raise ErrorMessage("The native .deb Packer needs at least one opts file passed using %s" %
+                               highlight("--run-fpm"))
+        self._validate_opts_files(args)
+
+        if args.deb_compression != "none":
+            get_backend(args.deb_compression).validate(args.deb_compression_level, args.deb_threads or 1)
+        if args.deb_reproducible:
+            targz.get_source_date_epoch(args.deb_source_date_epoch)
+
+    @staticmethod
+    def _get_deb_opts_parser() -> argparse.ArgumentParser:
+        parser = argparse.ArgumentParser(add_help=False, prog="--packer=deb")
+        parser.add_argument("-t", "--output-type", dest="output_type", choices=["deb"], default="deb")
+        parser.add_argument("-s", "--input-type", dest="input_type", choices=["dir"], default="dir")
+        parser.add_argument("-n", "--name", dest="package_name", default=None)
+        parser.add_argument("-v", "--version", dest="version", default=None)
+        parser.add_argument("--iteration", dest="iteration", default=None)
+        parser.add_argument("--epoch", dest="epoch", default=None)
+        parser.add_argument("-a", "--architecture", dest="architecture", default="native")
+        parser.add_argument("-m", "--maintainer", dest="maintainer", default=None)
+        parser.add_argument("--vendor", dest="vendor", default=None)
+        parser.add_argument("--license", dest="license", default=None)
+        parser.add_argument("--description", dest="description", default="no description given")
+        parser.add_argument("--url", dest="url", default=None)
+        parser.add_argument("--category", dest="category", default=None)
+        parser.add_argument("--deb-priority", dest="priority", default="optional")
+        parser.add_argument("-d", "--depends", dest="depends", action="append", default=[])
+        parser.add_argument("--deb-pre-depends", dest="pre_depends", action="append", default=[])
+        parser.add_argument("--deb-recommends", dest="recommends", action="append", default=[])
+        parser.add_argument("--deb-suggests", dest="suggests", action="append", default=[])
+        parser.add_argument("--provides", dest="provides", action="append", default=[])
+        parser.add_argument("--conflicts", dest="conflicts", action="append", default=[])
+        parser.add_argument("--replaces", dest="replaces", action="append", default=[])
+        parser.add_argument("--deb-field", dest="fields", action="append", default=[])
+        parser.add_argument("--config-files", dest="config_files", action="append", default=[])
+        parser.add_argument("--deb-no-default-config-files", dest="default_config_files", action="store_false",
+                            default=True)
+        # dpkg tracks folders from the package contents, so this is accepted for compatibility and ignored
+        parser.add_argument("--directories", dest="directories", action="append", default=[])
+        parser.add_argument("--before-install", dest="preinst", default=None)
+        parser.add_argument("--after-install", dest="postinst", default=None)
+        parser.add_argument("--before-remove", dest="prerm", default=None)
+        parser.add_argument("--after-remove", dest="postrm", default=None)
+        parser.add_argument("--deb-user", dest="user", default="root")
+        parser.add_argument("--deb-group", dest="group", default="root")
+        parser.add_argument("--deb-compression", dest="compression", default=None,
+                            choices=["gz", "gzip", "xz", "zst", "zstd", "none"])
+        parser.add_argument("--deb-compression-level", dest="compression_level", type=int, default=None)
+        parser.add_argument("-p", "--package", dest="package_file", default=None)
+        parser.add_argument("-C", "--chdir", dest="chdir", default=None)
+        parser.add_argument("--prefix", dest="prefix", default=None)
+        parser.add_argument("-x", "--exclude", dest="excludes", action="append", default=[])
+        parser.add_argument("-f", "--force", dest="force", action="store_true", default=False)
+        parser.add_argument("paths", nargs="*", default=[])
+        return parser
+
+    def _parse_deb_opts(self, fpm_opts: str, processed_args: List[str]) -> argparse.Namespace:
+        cmdline = []  # type: List[str]
+        for argline in processed_args:
+            cmdline += shlex.split(argline)
+
+        try:
+            opts, unknown = self._get_deb_opts_parser().parse_known_intermixed_args(cmdline)
+        except SystemExit as e:
+            raise ErrorMessage("Unable to parse the FPM parameters in %s (see above)" % highlight(fpm_opts)) from e
+
+        if unknown:
+            raise ErrorMessage("The native .deb Packer doesn't support these FPM parameters from %s: %s. Use %s "
+                               "instead." % (highlight(fpm_opts), highlight(" ".join(unknown)),
+                                             highlight("--packer=fpm")))
+        if not opts.package_name or not opts.version:
+            raise ErrorMessage("The opts file %s must specify the package name (-n) and version (-v)" %
+                               highlight(fpm_opts))
+        if not opts.paths:
+            raise ErrorMessage("The opts file %s doesn't specify any paths to package" % highlight(fpm_opts))
+        return opts
+
+    @staticmethod
+    def _get_architecture(architecture: str) -> str:
+        if architecture == "native":
+            architecture = platform.machine()
+        return _debian_architectures.get(architecture, architecture)
+
+    @staticmethod
+    def _get_paths(opts: argparse.Namespace) -> List[Tuple[str, str]]:
+        """
+        :return: a list of ``(source, destination)`` for the paths in the opts file. Like FPM's dir source, a path
+                 can have the form 'source=destination', otherwise it is installed at the same path.
+        """
+        ret = []  # type: List[Tuple[str, str]]
+        for path in opts.paths:
+            if "=" in path:
+                source, dest = path.split("=", 1)
+            else:
+                source = dest = path
+
+            if opts.chdir and not os.path.isabs(source):
+                source = os.path.join(opts.chdir, source)
+            if opts.prefix:
+                dest = os.path.join(opts.prefix, dest.lstrip("/"))
+            ret.append((source, "/" + dest.lstrip("/")))
+        return ret
+
+    def _create_archive(self, args: configargparse.Namespace, opts: argparse.Namespace,
+                        version: str) -> DebArchive:
+        control = [
+            ("Package", opts.package_name),
+            ("Version", version),
+        ]  # type: List[Tuple[str, str]]
+        for key, value in [("License", opts.license), ("Vendor", opts.vendor)]:
+            if value:
+                control.append((key, value))
+        control += [
+            ("Architecture", self._get_architecture(opts.architecture)),
+            ("Maintainer", opts.maintainer or "<%s@%s>" % (getpass.getuser(), socket.gethostname())),
+        ]
+        for key, values in [("Depends", opts.depends), ("Pre-Depends", opts.pre_depends),
+                            ("Recommends", opts.recommends), ("Suggests", opts.suggests),
+                            ("Provides", opts.provides), ("Conflicts", opts.conflicts),
+                            ("Replaces", opts.replaces)]:
+            if values:
+                control.append((key, ", ".join(values)))
+        for key, value in [("Section", opts.category), ("Priority", opts.priority), ("Homepage", opts.url)]:
+            if value:
+                control.append((key, value))
+        for field in opts.fields:
+            if ":" not in field:
+                raise ErrorMessage("--deb-field %s must have the form 'Field: value'" % highlight(field))
+            key, value = field.split(":", 1)
+            control.append((key.strip(), value.strip()))
+        control.append(("Description", opts.description))
+
+        compression = opts.compression or args.deb_compression
+        compression = _fpm_compression.get(compression, compression)
+        threads = args.deb_threads
+        if threads is None:
+            threads = (os.cpu_count() or 1) if compression != "none" and get_backend(compression).multithreaded else 1
+
+        deb = DebArchive(control, compression=compression,
+                         level=opts.compression_level if opts.compression_level is not None
+                         else args.deb_compression_level,
+                         threads=threads, owner=opts.user, group=opts.group,
+                         source_date_epoch=targz.get_source_date_epoch(args.deb_source_date_epoch)
+                         if args.deb_reproducible else None)
+
+        for source, dest in self._get_paths(opts):
+            deb.add_path(source, dest)
+            if opts.default_config_files and (dest == "/etc" or dest.startswith("/etc/")):
+                # like FPM, mark files installed to /etc as config files
+                if os.path.isdir(source):
+                    for root, dirs, files in os.walk(source):
+                        for fn in sorted(files):
+                            deb.add_conffile(os.path.join(dest, os.path.relpath(os.path.join(root, fn), source)))
+                else:
+                    deb.add_conffile(dest)
+        for pattern in opts.excludes:
+            deb.add_exclude(pattern)
+        for cf in opts.config_files:
+            deb.add_conffile(cf)
+        for script in ["preinst", "postinst", "prerm", "postrm"]:
+            if getattr(opts, script):
+                deb.add_script(script, getattr(opts, script))
+        return deb
+
+    def pack(self, args: configargparse.Namespace) -> None:
+        ctx = {
+            "basedir": args.build_path,
+            "buildctx": the_context,
+        }
+
+        for fpm_opts, processed_args, parsed_args, debian_version in self._render_opts_files(args, ctx):
+            opts = self._parse_deb_opts(fpm_opts, processed_args)
+
+            fullversion = opts.version
+            if opts.iteration:
+                fullversion = "%s-%s" % (fullversion, opts.iteration)
+            version = "%s:%s" % (opts.epoch, fullversion) if opts.epoch else fullversion
+
+            deb = self._create_archive(args, opts, version)
+            arch = self._get_architecture(opts.architecture)
+
+            # FPM replaces these tokens in the package filename
+            out_file = opts.package_file or "NAME_FULLVERSION_ARCH.EXTENSION"
+            for token, value in [("NAME", opts.package_name), ("FULLVERSION", fullversion),
+                                 ("VERSION", opts.version), ("ITERATION", opts.iteration or ""),
+                                 ("EPOCH", opts.epoch or ""), ("ARCH", arch), ("TYPE", "deb"),
+                                 ("EXTENSION", "deb")]:
+                out_file = out_file.replace(token, value)
+            if os.path.isdir(out_file):
+                out_file = os.path.join(out_file, "%s_%s_%s.deb" % (opts.package_name, fullversion, arch))
+
+            print_info("Creating %s from %s (%s, %s threads)" %
+                       (highlight(out_file), highlight(fpm_opts), deb.data_member_name, deb.threads))
+            started = time.time()
+            deb.write(out_file)
+            print_info("Created %s (%.1f MB) in %.1fs" %
+                       (highlight(out_file), os.path.getsize(out_file) / 1024 / 1024, time.time() - started))
+
+            the_context.packer_artifacts.add(PackerArtifact(
+                "deb",
+                out_file,
+                {
+                    "package_name": opts.package_name,
+                    "version": str(debian_version.version),
+                    "sha256": sha256_file(out_file),
+                },
+                self,
+                self.packer_name
+            ))
+
+    def print_help(self) -> None:
+        print("%s\n"
+              "================\n"
+              "\n"
+              "Creates .deb packages without running FPM, which avoids FPM's startup time\n"
+              "and the need for a Ruby toolchain in the build environment. The files are\n"
+              "streamed into the package without creating a staging copy and the package\n"
+              "contents can be compressed with multiple threads (--deb-compression).\n"
+              "\n"
+              "The Packer reads the same opts files as the FPM Packer (%s) and supports\n"
+              "FPM's commonly used parameters: -n, -v, --iteration, --epoch, -a, -m,\n"
+              "--vendor, --license, --description, --url, --category, -d, --provides,\n"
+              "--conflicts, --replaces, --deb-pre-depends, --deb-recommends, --deb-suggests,\n"
+              "--deb-field, --config-files, --before/after-install/remove, --deb-user,\n"
+              "--deb-group, --deb-compression, -p, -C, --prefix, -x and 'source=destination'\n"
+              "paths. It reports all other parameters as errors." %
+              (highlight(".deb Packer"), highlight("--run-fpm")))
+
+
+packer_class = DebPacker  # type: Type[DebPacker]
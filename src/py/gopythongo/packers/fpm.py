@@ -8,12 +8,16 @@ import configargparse
 import shlex
 import json
 import os
+import time
 
-from typing import Any, List, Dict, Union, Type
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Dict, Union, Type, Tuple
 
 from gopythongo.packers import BasePacker
-from gopythongo.utils import template, print_info, highlight, run_process, ErrorMessage, flatten, cmdargs_unquote_split
+from gopythongo.utils import template, print_info, highlight, run_process, ErrorMessage, flatten, cmdargs_unquote_split, \
+    sha256_file, ProcessOutput
 from gopythongo.utils.buildcontext import the_context, PackerArtifact
+from gopythongo.versioners.parsers import VersionContainer
 
 
 class FPMPacker(BasePacker):
@@ -85,13 +89,25 @@ class FPMPacker(BasePacker):
                                   "is invoked, allowing you to specify arbitrary extra command-line parameters. Make "
                                   "sure that you use an equals sign, i.e. --fpm-opts='' to avoid 'Unknown parameter' "
                                   "errors! (http://bugs.python.org/issue9334).")
+        gr_opts.add_argument("--fpm-jobs", dest="fpm_jobs", type=int, default=None, env_var="FPM_JOBS",
+                             help="The number of FPM processes to run at the same time when --run-fpm is used "
+                                  "multiple times. FPM is slow to start and compresses packages using a single "
+                                  "thread, so independent packages are created faster in parallel. (Default: the "
+                                  "number of CPUs)")
 
     def validate_args(self, args: configargparse.Namespace) -> None:
+        if args.fpm_jobs is not None and args.fpm_jobs < 1:
+            raise ErrorMessage("%s must be at least 1" % highlight("--fpm-jobs"))
+
         if args.is_inner and (not os.path.exists(args.fpm) or not os.access(args.fpm, os.X_OK)):
             raise ErrorMessage("fpm not found in path or not executable (%s).\n"
                                "You can specify an alternative executable using %s" %
                                (args.fpm, highlight("--use-fpm")))
 
+        self._validate_opts_files(args)
+
+    @staticmethod
+    def _validate_opts_files(args: configargparse.Namespace) -> None:
         if args.run_fpm:
             for opts in args.run_fpm:
                 if opts.startswith("template:"):
@@ -156,23 +172,15 @@ class FPMPacker(BasePacker):
 
         return ret if len(ret) > 0 else None
 
-    def pack(self, args: configargparse.Namespace) -> None:
-        # TODO: don't use deb here, fpm works universally
-        fpm_base = [
-            args.fpm, "-t", "deb", "-s", "dir",
-        ]
-
-        if args.fpm_extra_opts:
-            fpm_base += cmdargs_unquote_split(args.fpm_extra_opts)
-
-        ctx = {
-            "basedir": args.build_path,
-            "buildctx": the_context,
-        }
-
-        for ix, fpm_opts in enumerate(args.run_fpm):
-            print_info("Running FPM run %s of %s" % (ix + 1, len(args.run_fpm)))
+    def _render_opts_files(self, args: configargparse.Namespace,
+                           ctx: Dict[str, Any]) -> List[Tuple[str, List[str], Dict[str, str], VersionContainer[Any]]]:
+        """
+        Renders the opts file of each --run-fpm parameter with the version generated for its package.
 
+        :return: a list of ``(opts file, processed opts, parsed opts, version)`` tuples in the order of --run-fpm
+        """
+        ret = []  # type: List[Tuple[str, List[str], Dict[str, str], VersionContainer[Any]]]
+        for fpm_opts in args.run_fpm:
             # hen meet egg. We need to process the fpm_opts template to read the package name to get the actual
             # version string that we generated before and then rerender the fpm_opts template with the real version
             # string
@@ -189,10 +197,31 @@ class FPMPacker(BasePacker):
             ctx["debian_version"] = the_context.generated_versions[preparsed_args["package_name"]]
             del preparsed_args  # make sure we don't accidentally use this below
             processed_args = self._load_fpm_opts(fpm_opts, process_templates=True, ctx=ctx)
-            parsed_args = self._parse_fpm_opts(processed_args)
+            ret.append((fpm_opts, processed_args, self._parse_fpm_opts(processed_args), ctx["debian_version"]))
+        return ret
+
+    def pack(self, args: configargparse.Namespace) -> None:
+        # TODO: don't use deb here, fpm works universally
+        fpm_base = [
+            args.fpm, "-t", "deb", "-s", "dir",
+        ]
+
+        if args.fpm_extra_opts:
+            fpm_base += cmdargs_unquote_split(args.fpm_extra_opts)
 
+        ctx = {
+            "basedir": args.build_path,
+            "buildctx": the_context,
+        }
+
+        # render all opts files up front, as templating uses the shared ctx, then run FPM concurrently
+        runs = []  # type: List[Tuple[str, Dict[str, str], List[str], VersionContainer[Any]]]
+        for fpm_opts, processed_args, parsed_args, debian_version in self._render_opts_files(args, ctx):
             # now let's go create the package
             if parsed_args["package_file"]:
+                if parsed_args["package_file"] in [r[1]["package_file"] for r in runs]:
+                    raise ErrorMessage("Multiple FPM runs would create the same package file %s" %
+                                       highlight(parsed_args["package_file"]))
                 if os.path.exists(parsed_args["package_file"]):
                     print_info("%s already exists, will be removed and recreated" %
                                highlight(parsed_args["package_file"]))
@@ -201,8 +230,28 @@ class FPMPacker(BasePacker):
             run_params = list(fpm_base)  # operate on a copy so we don't change fpm_base
             for argline in processed_args:
                 run_params += shlex.split(argline)
-            fpm_out = run_process(*run_params)
-
+            runs.append((fpm_opts, parsed_args, run_params, debian_version))
+
+        jobs = min(args.fpm_jobs or os.cpu_count() or 1, max(len(runs), 1))
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = []
+            for ix, (fpm_opts, parsed_args, run_params, debian_version) in enumerate(runs):
+                print_info("Running FPM run %s of %s (%s)" %
+                           (ix + 1, len(runs), highlight(parsed_args["package_name"])))
+                futures.append(executor.submit(self._run_fpm, run_params))
+
+            # collect the results in the order of --run-fpm, waiting for all runs before reporting the first error
+            results = []  # type: List[Tuple[ProcessOutput, float]]
+            error = None  # type: ErrorMessage
+            for future in futures:
+                try:
+                    results.append(future.result())
+                except ErrorMessage as e:
+                    error = error or e
+            if error:
+                raise error
+
+        for (fpm_opts, parsed_args, run_params, debian_version), (fpm_out, duration) in zip(runs, results):
             out_file = ""
             if parsed_args["package_file"]:
                 if not os.path.exists(parsed_args["package_file"]):
@@ -221,16 +270,25 @@ class FPMPacker(BasePacker):
                                        "FPM's output or an output filename parameter (-p) in the FPM opts file (%s)" %
                                        (highlight(":path"), highlight(fpm_opts)))
 
-            print_info("FPM: %s created" % highlight(out_file))
+            print_info("FPM: %s created in %.1fs" % (highlight(out_file), duration))
 
             the_context.packer_artifacts.add(PackerArtifact(
                 "deb",
                 out_file,
-                {"package_name": parsed_args["package_name"]},
+                {
+                    "package_name": parsed_args["package_name"],
+                    "version": str(debian_version.version),
+                    "sha256": sha256_file(out_file),
+                },
                 self,
                 self.packer_name
             ))
 
+    @staticmethod
+    def _run_fpm(run_params: List[str]) -> Tuple[ProcessOutput, float]:
+        started = time.time()
+        return run_process(*run_params), time.time() - started
+
     def print_help(self) -> None:
         print("%s\n"
               "==========\n"
@@ -4,12 +4,16 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import os
+import time
+
 import configargparse
 
-from typing import Any, List, Union, Type
+from typing import Any, List, Union, Type, Tuple
 
 from gopythongo.packers import BasePacker
-from gopythongo.utils import print_info, highlight, ErrorMessage, targz
+from gopythongo.utils import print_info, highlight, ErrorMessage, targz, sha256_file
+from gopythongo.utils.compression import backends, get_backend
 from gopythongo.utils.buildcontext import the_context, PackerArtifact
 
 
@@ -35,9 +39,68 @@ class TarGzPacker(BasePacker):
                             help="Takes an argument in the form 'ext:path' where 'ext' is appended to the "
                                  "targz-basename and then the contents of path are stored and compressed in a .tar.gz "
                                  "archive. 'ext' is optional, but be careful to not overwrite your archives when you "
-                                 "use multiple --targz arguments.")
+                                 "use multiple --targz arguments. You can override --targz-compression, "
+                                 "--targz-level and --targz-threads for each archive by appending options like this: "
+                                 "'ext:path;codec=zstd;level=19;threads=8'.")
         gp_tgz.add_argument("--targz-relative", dest="targz_relative", action="store_true", default=False,
                             help="Store relative paths in the .tar.gz archives.")
+        gp_tgz.add_argument("--targz-compression", dest="targz_compression", choices=sorted(backends.keys()),
+                            default="gzip",
+                            help="The compression codec to use for the archives. The file extension of the archive "
+                                 "follows the codec (.tar.gz, .tar.zst or .tar.xz). zstd requires the 'zstandard' "
+                                 "Python package. (Default: gzip)")
+        gp_tgz.add_argument("--targz-level", dest="targz_level", type=int, default=None,
+                            help="The compression level. (Default: the codec's default, 9 for gzip, 3 for zstd and 6 "
+                                 "for xz)")
+        gp_tgz.add_argument("--targz-threads", dest="targz_threads", type=int, default=None,
+                            help="The number of threads to compress each archive with. gzip compresses blocks in "
+                                 "parallel like pigz, zstd uses its own worker threads and xz only supports a single "
+                                 "thread. (Default: the number of CPUs for gzip and zstd)")
+        gp_tgz.add_argument("--targz-reproducible", dest="targz_reproducible", action="store_true", default=False,
+                            help="Create reproducible archives: identical inputs result in byte-identical archives. "
+                                 "Entries are sorted by name, mtimes are clamped to --targz-source-date-epoch, all "
+                                 "files are owned by root with 0755 or 0644 permissions and the compressed stream "
+                                 "contains no timestamps. Note that Python invalidates timestamp-based .pyc files "
+                                 "when their source's mtime changes, so export SOURCE_DATE_EPOCH for the whole build "
+                                 "to make pip write hash-based .pyc files instead.")
+        gp_tgz.add_argument("--targz-source-date-epoch", dest="targz_source_date_epoch", default=None,
+                            env_var="SOURCE_DATE_EPOCH",
+                            help="The UNIX timestamp used by --targz-reproducible to clamp file mtimes. (Default: "
+                                 "the SOURCE_DATE_EPOCH environment variable or 0)")
+
+    @staticmethod
+    def _parse_spec(args: configargparse.Namespace, spec: str) -> Tuple[str, str, str, int, int]:
+        """
+        :return: a tuple of ``(ext, path, codec, level, threads)`` for a --targz argument, where ``ext`` is ``None``
+                 if the spec doesn't have one and ``threads`` is ``None`` if it wasn't set
+        """
+        parts = spec.split(";")
+        spec = parts[0]
+        codec, level, threads = args.targz_compression, args.targz_level, args.targz_threads
+        for opt in parts[1:]:
+            if "=" not in opt:
+                raise ErrorMessage("Invalid option %s in --targz %s. Options must have the form 'key=value'." %
+                                   (highlight(opt), highlight(spec)))
+            key, value = opt.split("=", 1)
+            try:
+                if key == "codec":
+                    codec = value
+                elif key == "level":
+                    level = int(value)
+                elif key == "threads":
+                    threads = int(value)
+                else:
+                    raise ErrorMessage("Unknown option %s in --targz %s. Valid options are codec, level and "
+                                       "threads." % (highlight(key), highlight(spec)))
+            except ValueError as e:
+                raise ErrorMessage("The value of %s in --targz %s must be an integer" %
+                                   (highlight(key), highlight(spec))) from e
+
+        if ":" in spec:
+            ext, path = spec.split(":", 1)
+        else:
+            ext, path = None, spec
+        return ext, path, codec, level, threads
 
     def validate_args(self, args: configargparse.Namespace) -> None:
         if not args.targz_basename:
@@ -45,23 +108,28 @@ class TarGzPacker(BasePacker):
 
         validate_fns = []  # type: List[str]
         for spec in args.targz:
-            if ":" in spec:
-                ext = spec.split(":", 1)[0]
-                fn = "%s_%s" % (args.targz_basename, ext)
+            ext, path, codec, level, threads = self._parse_spec(args, spec)
+            get_backend(codec).validate(level, threads or 1)
+
+            if ext:
+                fn = "%s_%s.tar.%s" % (args.targz_basename, ext, get_backend(codec).extension)
             else:
-                fn = args.targz_basename
+                fn = "%s.tar.%s" % (args.targz_basename, get_backend(codec).extension)
 
             if fn in validate_fns:
                 raise ErrorMessage("Multiple --targz parameters result in the same filename '%s'." % highlight(fn))
             else:
                 validate_fns.append(fn)
 
+        if args.targz_reproducible:
+            targz.get_source_date_epoch(args.targz_source_date_epoch)
+
     def predict_future_artifacts(self, args: configargparse.Namespace) -> Union[List[str], None]:
         # TODO: right now I don't know if this implementation will turn out to be more useful than return None
         ret = []  # type: List[str]
         for spec in args.targz:
-            if ":" in spec:
-                ext, path = spec.split(":", 1)
+            ext, path, codec, level, threads = self._parse_spec(args, spec)
+            if ext:
                 basename = "%s_%s" % (args.targz_basename, ext)
             else:
                 basename = args.targz_basename
@@ -71,23 +139,39 @@ class TarGzPacker(BasePacker):
 
     def pack(self, args: configargparse.Namespace) -> None:
         for spec in args.targz:
-            if ":" in spec:
-                ext, path = spec.split(":", 1)
-                fn = "%s_%s-%s.tar.gz" % (args.targz_basename, ext,
-                                          str(the_context.read_version.version))
+            ext, path, codec, level, threads = self._parse_spec(args, spec)
+            backend = get_backend(codec)
+            if threads is None:
+                threads = (os.cpu_count() or 1) if backend.multithreaded else 1
+
+            if ext:
+                fn = "%s_%s-%s.tar.%s" % (args.targz_basename, ext,
+                                          str(the_context.read_version.version), backend.extension)
             else:
-                path = spec
-                fn = "%s-%s.tar.gz" % (args.targz_basename, str(the_context.read_version.version))
+                fn = "%s-%s.tar.%s" % (args.targz_basename, str(the_context.read_version.version),
+                                       backend.extension)
 
             # TODO: find the full path for the resulting file
 
-            print_info("Creating bundle tarball of %s in %s" % (highlight(path), highlight(fn)))
-            targz.create_targzip(filename=fn, paths=[(path, path)], make_paths_relative=args.targz_relative)
+            print_info("Creating bundle tarball of %s in %s (%s, %s threads)" %
+                       (highlight(path), highlight(fn), codec, threads))
+            started = time.time()
+            targz.create_targzip(filename=fn, paths=[(path, path)], make_paths_relative=args.targz_relative,
+                                 compression=codec, level=level, threads=threads,
+                                 source_date_epoch=targz.get_source_date_epoch(args.targz_source_date_epoch)
+                                 if args.targz_reproducible else None)
+            print_info("Created %s (%.1f MB) in %.1fs" %
+                       (highlight(fn), os.path.getsize(fn) / 1024 / 1024, time.time() - started))
 
             the_context.packer_artifacts.add(PackerArtifact(
                 "targz",
                 fn,
-                {"package_name": args.targz_basename},
+                {
+                    "package_name": args.targz_basename,
+                    "version": str(the_context.read_version.version),
+                    "sha256": sha256_file(fn),
+                    "compression": codec,
+                },
                 self,
                 self.packer_name
             ))
@@ -96,7 +180,9 @@ class TarGzPacker(BasePacker):
         print("%s\n"
               "==============\n"
               "\n"
-              "Just creates a gzipped tar archive." % highlight(".tar.gz Packer"))
+              "Just creates a compressed tar archive. By default the archive is compressed\n"
+              "with gzip using all CPUs. Use --targz-compression to create .tar.zst or\n"
+              ".tar.xz archives instead." % highlight(".tar.gz Packer"))
 
 
 packer_class = TarGzPacker  # type: Type[TarGzPacker]
@@ -4,17 +4,29 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import atexit
+import threading
+import time
+
 import configargparse
 import os
 
-from typing import List
+from typing import List, Dict, Any, Tuple, TYPE_CHECKING
 
-from gopythongo.utils import highlight, ErrorMessage, create_script_path
+from gopythongo.utils import highlight, ErrorMessage, create_script_path, print_info
 from gopythongo.utils.buildcontext import the_context
 
+if TYPE_CHECKING:
+    import aptly_api
+    import requests
+
 
 _aptly_shared_args_added = False  # type: bool
 
+_aptly_api_clients = {}  # type: Dict[Tuple[str, int, int, float, int], 'aptly_api.Client']
+_aptly_api_stats = {"requests": 0, "errors": 0, "total_time": 0.0, "max_time": 0.0}  # type: Dict[str, Any]
+_aptly_api_stats_lock = threading.Lock()
+
 
 def add_shared_args(parser: configargparse.ArgumentParser) -> None:
     global _aptly_shared_args_added
@@ -31,6 +43,20 @@ def add_shared_args(parser: configargparse.ArgumentParser) -> None:
                                      help="Path to the aptly config file to use.")
         gr_aptly_shared.add_argument("--repo", dest="aptly_repo", default=None, env_var="REPO",
                                      help="Name of the aptly repository to place the package in.")
+        gr_aptly_shared.add_argument("--aptly-api-retries", dest="aptly_api_retries", type=int, default=3,
+                                     env_var="APTLY_API_RETRIES",
+                                     help="How often GoPythonGo retries a request to the aptly API server when it "
+                                          "can't connect or the server reports a temporary error (HTTP 502, 503 or "
+                                          "504). Only requests that are safe to repeat are retried after they have "
+                                          "been sent. (Default: 3)")
+        gr_aptly_shared.add_argument("--aptly-api-backoff", dest="aptly_api_backoff", type=float, default=0.5,
+                                     env_var="APTLY_API_BACKOFF",
+                                     help="The base delay in seconds between retries, which doubles on each retry. "
+                                          "(Default: 0.5)")
+        gr_aptly_shared.add_argument("--aptly-api-pool-size", dest="aptly_api_pool_size", type=int, default=8,
+                                     env_var="APTLY_API_POOL_SIZE",
+                                     help="The maximum number of keep-alive connections to the aptly API server that "
+                                          "GoPythonGo keeps open. (Default: 8)")
 
         gr_ast = parser.add_argument_group("Aptly shared options (Stores)")
         gr_ast.add_argument("--aptly-distribution", dest="aptly_distribution", default="", env_var="APTLY_DISTRIBUTION",
@@ -91,6 +117,11 @@ def validate_shared_args(args: configargparse.Namespace) -> None:
         raise ErrorMessage("To use the aptly Versioner or Store, you MUST provide the name of the aptly repository to "
                            "operate on via %s" % highlight("--repo"))
 
+    if args.aptly_api_retries < 0 or args.aptly_api_backoff < 0 or args.aptly_api_pool_size < 1:
+        raise ErrorMessage("%s and %s must not be negative and %s must be at least 1" %
+                           (highlight("--aptly-api-retries"), highlight("--aptly-api-backoff"),
+                            highlight("--aptly-api-pool-size")))
+
     if args.use_aptly_wrapper:
         wrapper_cmd = create_script_path(the_context.gopythongo_path, "vaultwrapper")
         if not os.path.exists(wrapper_cmd) or not os.access(wrapper_cmd, os.X_OK):
@@ -108,3 +139,100 @@ def get_aptly_cmdline(args: configargparse.Namespace, *, override_aptly_cmd: str
         cmdline += ["-config", args.aptly_config]
 
     return cmdline
+
+
+def _print_aptly_api_stats() -> None:
+    with _aptly_api_stats_lock:
+        if _aptly_api_stats["requests"]:
+            print_info("aptly API: %s requests (%s failed), %.1fms average and %.1fms maximum latency, %.1fs total" %
+                       (highlight(str(_aptly_api_stats["requests"])), _aptly_api_stats["errors"],
+                        _aptly_api_stats["total_time"] / _aptly_api_stats["requests"] * 1000,
+                        _aptly_api_stats["max_time"] * 1000, _aptly_api_stats["total_time"]))
+
+
+class _PooledRequests(object):
+    """
+    Replaces the ``do_*`` methods of an ``aptly_api`` API section, which use a new connection for every request, with
+    methods using a shared ``requests.Session``. ``aptly_api.Client`` has no way to pass in a session, so this relies
+    on the sections' private ``_make_url`` and ``_error_from_response``. That's why requirements.txt pins
+    aptly-api-client to the version these have been checked against. Run the tests in
+    ``gopythongo.tests.aptly_client`` before changing the pin.
+    """
+    def __init__(self, section: Any, session: 'requests.Session') -> None:
+        self.section = section
+        self.session = session
+
+    def request(self, method: str, urlpath: str, **kwargs: Any) -> 'requests.Response':
+        start = time.perf_counter()
+        failed = True
+        try:
+            resp = self.session.request(method, self.section._make_url(urlpath), verify=self.section.ssl_verify,
+                                        cert=self.section.ssl_cert, auth=self.section.http_auth,
+                                        timeout=self.section.timeout, **kwargs)
+            failed = resp.status_code < 200 or resp.status_code >= 300
+        finally:
+            elapsed = time.perf_counter() - start
+            with _aptly_api_stats_lock:
+                _aptly_api_stats["requests"] += 1
+                _aptly_api_stats["errors"] += 1 if failed else 0
+                _aptly_api_stats["total_time"] += elapsed
+                _aptly_api_stats["max_time"] = max(_aptly_api_stats["max_time"], elapsed)
+
+        if failed:
+            import aptly_api
+            raise aptly_api.AptlyAPIException(self.section._error_from_response(resp), status_code=resp.status_code)
+        return resp
+
+    def do_get(self, urlpath: str, params: Dict[str, str]=None) -> 'requests.Response':
+        return self.request("GET", urlpath, params=params)
+
+    def do_post(self, urlpath: str, data: Any=None, params: Dict[str, str]=None, files: Any=None,
+                json: Any=None) -> 'requests.Response':
+        return self.request("POST", urlpath, data=data, params=params, files=files, json=json)
+
+    def do_put(self, urlpath: str, data: Any=None, files: Any=None, json: Any=None) -> 'requests.Response':
+        return self.request("PUT", urlpath, data=data, files=files, json=json)
+
+    def do_delete(self, urlpath: str, params: Dict[str, str]=None, data: Any=None,
+                  json: Any=None) -> 'requests.Response':
+        return self.request("DELETE", urlpath, params=params, data=data, json=json)
+
+
+def get_aptly_api_client(args: configargparse.Namespace) -> 'aptly_api.Client':
+    """
+    Returns an aptly API client for ``--aptly-server-url`` that is shared by all Versioners and Stores in this process.
+    ``aptly_api.Client`` makes every request through a new connection, so the returned client's API sections are
+    rewired to use a single ``requests.Session`` with keep-alive, a connection pool and retries with exponential
+    backoff. All requests are counted and timed and the statistics are printed when GoPythonGo exits.
+    """
+    key = (args.aptly_server_url, args.aptly_timeout, args.aptly_api_retries, args.aptly_api_backoff,
+           args.aptly_api_pool_size)
+    if key in _aptly_api_clients:
+        return _aptly_api_clients[key]
+
+    import aptly_api
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry = Retry(total=args.aptly_api_retries, connect=args.aptly_api_retries, read=args.aptly_api_retries,
+                  status=args.aptly_api_retries, backoff_factor=args.aptly_api_backoff,
+                  status_forcelist=(502, 503, 504), raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=args.aptly_api_pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    client = aptly_api.Client(args.aptly_server_url, timeout=args.aptly_timeout)
+    for section in [client.files, client.misc, client.packages, client.publish, client.repos, client.snapshots,
+                    client.mirrors]:
+        pooled = _PooledRequests(section, session)
+        section.do_get = pooled.do_get
+        section.do_post = pooled.do_post
+        section.do_put = pooled.do_put
+        section.do_delete = pooled.do_delete
+
+    if not _aptly_api_clients:
+        atexit.register(_print_aptly_api_stats)
+    _aptly_api_clients[key] = client
+    return client
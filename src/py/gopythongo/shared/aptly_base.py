@@ -3,20 +3,35 @@
 # This Source Code Form is subject to the terms of the Mozilla Public
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
-from typing import Any, List
+from typing import Any, List, Tuple, Dict, Set, Iterable, Sequence, Union, cast
 
 import configargparse
 import gopythongo.shared.aptly_args as _aptly_args
 from gopythongo.stores import BaseStore
 
-from gopythongo.utils import ErrorMessage, highlight
+from gopythongo.utils import ErrorMessage, highlight, print_info, print_debug
+from gopythongo.utils.buildcontext import PackerArtifact
 from gopythongo.utils.debversion import DebianVersion, InvalidDebianVersionString
 from gopythongo.versioners import BaseVersioner
+from gopythongo.versioners.parsers import VersionContainer
+from gopythongo.versioners.parsers.debianparser import DebianVersionParser
 
 
 _aptly_shared_args_added = False  # type: bool
 
 
+def _get_debian_versionparser() -> DebianVersionParser:
+    from gopythongo.versioners import get_version_parsers
+    return cast(DebianVersionParser, get_version_parsers()["debian"])
+
+
+def _report_unparsable_versions(errors: List[Tuple[str, str]]) -> None:
+    if errors:
+        print_info("aptly returned %s unparsable Debian version string(s). This should never happen in a APT "
+                   "repository where all versions must be valid Debian versions. (Unparseable return values were: "
+                   "%s)" % (len(errors), ", ".join(highlight(version_str) for version_str, _ in errors)))
+
+
 class AptlyBaseVersioner(BaseVersioner):
     def __init__(self, *args: Any, **kwargs: Any) -> None:
         super().__init__(*args, **kwargs)
@@ -56,6 +71,23 @@ class AptlyBaseVersioner(BaseVersioner):
                                 allow_fallback_version: bool=False) -> List[DebianVersion]:
             raise NotImplementedError("Each subclass of AptlyBaseVersioner must implement query_repo_versions")
 
+    def parse_repo_versions(self, version_strs: Iterable[str], args: configargparse.Namespace) -> List[DebianVersion]:
+        """
+        Parses all version strings returned by aptly in one go.
+
+        :return: the sorted list of the valid versions in ``version_strs``
+        """
+        versions, errors = _get_debian_versionparser().parse_many(version_strs, args)
+        _report_unparsable_versions(errors)
+        return sorted((v.version for v in versions), key=DebianVersion.sort_key)
+
+    def query_repo_packages(self, query: str, args: configargparse.Namespace) -> List[Tuple[str, str, str]]:
+        """
+        :return: a list of ``(package name, version, SHA256 digest)`` tuples for all packages in the repo matching
+                 ``query``. Combine multiple queries using aptly's ``|`` operator to look up many packages at once.
+        """
+        raise NotImplementedError("Each subclass of AptlyBaseVersioner must implement query_repo_packages")
+
     def read(self, args: configargparse.Namespace) -> str:
         versions = self.query_repo_versions(args.aptly_query, args, allow_fallback_version=True)
 
@@ -76,3 +108,142 @@ class AptlyBaseStore(BaseStore):
 
     def validate_args(self, args: configargparse.Namespace) -> None:
         _aptly_args.validate_shared_args(args)
+
+    def get_target(self, args: configargparse.Namespace) -> str:
+        # a repo can only contain one package with the same name and version, whatever distribution it's published in
+        location = args.aptly_server_url or args.aptly_config
+        return "aptly repo %s%s" % (args.aptly_repo, " at %s" % location if location else "")
+
+    @staticmethod
+    def _get_aptly_versioner() -> AptlyBaseVersioner:
+        raise NotImplementedError("Each subclass of AptlyBaseStore must implement _get_aptly_versioner")
+
+    @staticmethod
+    def _name_query(package_names: Iterable[str]) -> str:
+        """
+        :return: an aptly query matching all packages called one of ``package_names``
+        """
+        return " | ".join("Name (%s)" % name for name in sorted(set(package_names)))
+
+    def _query_repo_packages(self, artifacts: Iterable[PackerArtifact],
+                             args: configargparse.Namespace) -> Dict[Tuple[str, str], Set[str]]:
+        """
+        Looks up all versions of all ``artifacts`` in the repo with a single query.
+
+        :return: a dict mapping ``(package name, version)`` to the SHA256 digests of the package files in the repo
+        """
+        names = [pkg.artifact_metadata["package_name"] for pkg in artifacts]
+        existing = {}  # type: Dict[Tuple[str, str], Set[str]]
+        if names:
+            for name, version, digest in self._get_aptly_versioner().query_repo_packages(self._name_query(names), args):
+                existing.setdefault((name, version), set()).add(digest)
+        return existing
+
+    @staticmethod
+    def _is_unchanged(pkg: PackerArtifact, existing: Dict[Tuple[str, str], Set[str]],
+                      args: configargparse.Namespace) -> bool:
+        """
+        :param existing: the result of ``_query_repo_packages``
+        :return: ``True`` if the repo already contains a package with the same name and version as ``pkg`` whose
+                 SHA256 digest matches the digest the Packer recorded for ``pkg``
+        """
+        if "sha256" not in pkg.artifact_metadata or "version" not in pkg.artifact_metadata:
+            return False
+
+        key = (pkg.artifact_metadata["package_name"], pkg.artifact_metadata["version"])
+        if pkg.artifact_metadata["sha256"] in existing.get(key, set()):
+            print_info("Repo %s already contains %s %s with the same SHA256 digest, skipping it" %
+                       (highlight(args.aptly_repo), highlight(key[0]), highlight(key[1])))
+            return True
+        return False
+
+    @staticmethod
+    def _get_debian_versionparser() -> DebianVersionParser:
+        return _get_debian_versionparser()
+
+    def _query_repo_versions(self, package_names: Sequence[str],
+                             args: configargparse.Namespace) -> Dict[str, List[DebianVersion]]:
+        """
+        Fetches all versions of all ``package_names`` in the repo with a single query.
+
+        :return: a dict mapping each package name to the sorted list of its versions in the repo
+        """
+        index = {name: [] for name in package_names}  # type: Dict[str, List[DebianVersion]]
+        if not package_names:
+            return index
+
+        packages = [(name, version) for name, version, digest in
+                    self._get_aptly_versioner().query_repo_packages(self._name_query(package_names), args)
+                    if name in index]
+        versions, errors = self._get_debian_versionparser().parse_many((version for _, version in packages), args)
+        _report_unparsable_versions(errors)
+
+        # parse_many leaves out invalid version strings, so skip their packages to match them up with the versions
+        invalid = set(version_str for version_str, _ in errors)
+        for (name, _), parsed in zip((pkg for pkg in packages if pkg[1] not in invalid), versions):
+            index[name].append(parsed.version)
+        for versions in index.values():
+            versions.sort(key=DebianVersion.sort_key)
+        return index
+
+    def _find_new_version(self, package_name: str, repo_versions: List[DebianVersion],
+                          version: VersionContainer[DebianVersion], action: str,
+                          args: configargparse.Namespace) -> VersionContainer[DebianVersion]:
+        """
+        Find the next version given `action` for `package_name` in `repo_versions`, the sorted list of all versions
+        of `package_name` in the target repo.
+        """
+        print_debug("Finding a version string in the aptly store for package %s" % highlight(package_name))
+        debvp = self._get_debian_versionparser()
+        repo_version_strs = set(str(v) for v in repo_versions)
+        tried = set()  # type: Set[str]
+
+        while True:
+            # the same as querying aptly for "$Version (% *version*)"
+            debversions = [v for v in repo_versions if str(version.version) in str(v)]
+            if not debversions:
+                print_info("%s seems to be as yet unused" % highlight(str(version.version)))
+                return version
+
+            # we already have a version in the repo
+            new_base = debversions[-1]
+            print_debug("Found an existing version %s for package %s" %
+                        (highlight(str(new_base)), highlight(package_name)))
+            after_action = debvp.execute_action(debvp.deserialize(str(new_base)), action)
+            if after_action.version < version.version:
+                if args.aptly_overwrite_newer:
+                    print_info("Will overwrite same or newer version in repo with older version (existing: %s, "
+                               "new: %s)" % (highlight(str(version.version)), highlight(str(after_action.version))))
+                    return after_action
+                else:
+                    raise ErrorMessage("Repo already contains a newer version of %s than the one that was going to be "
+                                       "added (existing: %s new: %s)" %
+                                       (highlight(package_name), highlight(str(new_base)),
+                                        highlight(str(version.version))))
+
+            if str(after_action.version) not in repo_version_strs:
+                print_info("After executing action %s, the selected next version for %s is %s" %
+                           (highlight(action), highlight(package_name), highlight(str(after_action.version))))
+                return after_action
+
+            if str(after_action.version) in tried:
+                raise ErrorMessage("Version action %s can't create an unused version for %s. %s is already in the "
+                                   "repo." % (highlight(action), highlight(package_name),
+                                              highlight(str(after_action.version))))
+            tried.add(str(after_action.version))
+            print_debug("The new after-action (%s) version %s, based off %s, derived from %s is already taken, so "
+                        "we now search for an unused version string for %s" %
+                        (action, highlight(str(after_action.version)), highlight(str(new_base)),
+                         highlight(str(version.version)), highlight(package_name)))
+            version = after_action
+
+    def generate_future_versions(self, artifact_names: Sequence[str], base_version: VersionContainer[Any], action: str,
+                                 args: configargparse.Namespace) -> Union[Dict[str, VersionContainer[DebianVersion]],
+                                                                          None]:
+        ret = {}  # type: Dict[str, VersionContainer[DebianVersion]]
+        base_debv = base_version.convert_to("debian")
+        repo_versions = self._query_repo_versions(artifact_names, args)
+        for package_name in artifact_names:
+            next_version = self._find_new_version(package_name, repo_versions[package_name], base_debv, action, args)
+            ret[package_name] = next_version
+        return ret
@@ -7,10 +7,12 @@
 import configargparse
 import os
 
-from docker import DockerClient
-from docker.tls import TLSConfig
+from typing import TYPE_CHECKING
+
 from gopythongo.utils import highlight, ErrorMessage
-from requests.exceptions import RequestException
+
+if TYPE_CHECKING:
+    from docker import DockerClient
 
 _docker_shared_args_added = False  # type: bool
 
@@ -40,7 +42,10 @@ def add_shared_args(parser: configargparse.ArgumentParser) -> None:
     _docker_shared_args_added = True
 
 
-def get_docker_client(args: configargparse.Namespace) -> DockerClient:
+def get_docker_client(args: configargparse.Namespace) -> 'DockerClient':
+    from docker import DockerClient
+    from docker.tls import TLSConfig
+
     return DockerClient(
         args.docker_api,
         tls=TLSConfig(
@@ -70,6 +75,8 @@ def validate_shared_args(args: configargparse.Namespace) -> None:
     except ValueError:
         raise ErrorMessage("Parameter to --docker-ssl-version must be an integer between 1 and 5")
 
+    from requests.exceptions import RequestException
+
     dcl = get_docker_client(args)
     try:
         info = dcl.info()
@@ -0,0 +1,153 @@
+# -* encoding: utf-8 *-
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Measures where the time goes before GoPythonGo starts doing real work: how long each module takes to import and how
+long each plugin subsystem takes to register its plugins and add its command-line arguments. Enabled by
+``--profile-startup``.
+
+This module is enabled from ``gopythongo/__init__.py`` before any other part of GoPythonGo is imported, so it must
+only depend on the standard library.
+"""
+
+import contextlib
+import json
+import os
+import sys
+import time
+
+from importlib.abc import MetaPathFinder
+from importlib.machinery import ModuleSpec
+from types import ModuleType
+from typing import Any, Callable, Dict, Iterator, List, Sequence, Tuple, Union
+
+_finder = None  # type: Union['_TimingFinder', None]
+_enabled_at = None  # type: Union[float, None]
+_finished_at = None  # type: Union[float, None]
+
+# (module name, self time, cumulative time) in the order in which the modules finished importing
+_imports = []  # type: List[Tuple[str, float, float]]
+# (category, name, duration) in the order in which the steps finished
+_steps = []  # type: List[Tuple[str, str, float]]
+# the cumulative import time of the nested imports of each module that is currently being imported
+_import_stack = []  # type: List[float]
+
+
+def _timed_exec_module(fullname: str, exec_module: Callable[[ModuleType], None]) -> Callable[[ModuleType], None]:
+    def exec_and_measure(module: ModuleType) -> None:
+        _import_stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            exec_module(module)
+        finally:
+            cumulative = time.perf_counter() - start
+            nested = _import_stack.pop()
+            if _import_stack:
+                _import_stack[-1] += cumulative
+            _imports.append((fullname, cumulative - nested, cumulative))
+    exec_and_measure.__wrapped__ = exec_module  # type: ignore
+    return exec_and_measure
+
+
+class _TimingFinder(MetaPathFinder):
+    """
+    Asks the other finders on ``sys.meta_path`` for the module spec and wraps the ``exec_module`` method of the
+    returned loader, so the time it takes to execute the module is recorded. The loader itself is left in place,
+    because libraries inspect module loaders (e.g. for ``importlib.resources``).
+    """
+    def find_spec(self, fullname: str, path: Union[Sequence[str], None],
+                  target: Union[ModuleType, None]=None) -> Union[ModuleSpec, None]:
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                # builtin and frozen modules are loaded by classes, which we don't patch, and they're fast anyway
+                if spec.loader is not None and not isinstance(spec.loader, type) and \
+                        hasattr(spec.loader, "exec_module"):
+                    # some finders share one loader between modules, so don't wrap our own wrapper
+                    exec_module = getattr(spec.loader.exec_module, "__wrapped__", spec.loader.exec_module)
+                    spec.loader.exec_module = _timed_exec_module(fullname, exec_module)  # type: ignore
+                return spec
+        return None
+
+
+def enable() -> None:
+    global _finder, _enabled_at
+    if _finder is None:
+        _enabled_at = time.perf_counter()
+        _finder = _TimingFinder()
+        sys.meta_path.insert(0, _finder)
+
+
+def is_enabled() -> bool:
+    return _finder is not None
+
+
+def finish() -> None:
+    """
+    Stops measuring imports. Everything that happens afterwards is part of the actual work, not of the startup.
+    """
+    global _finished_at
+    if _finder is not None and _finished_at is None:
+        _finished_at = time.perf_counter()
+        sys.meta_path.remove(_finder)
+
+
+@contextlib.contextmanager
+def measure(category: str, name: str) -> Iterator[None]:
+    """
+    Records how long the code in the ``with`` block takes as a startup step, if startup profiling is enabled.
+    """
+    if _finder is None or _finished_at is not None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _steps.append((category, name, time.perf_counter() - start))
+
+
+def get_profile() -> Dict[str, Any]:
+    total = (_finished_at or time.perf_counter()) - (_enabled_at or 0.0)
+    return {
+        "total": total,
+        "imports": [{"module": name, "self": self, "cumulative": cumulative}
+                    for name, self, cumulative in sorted(_imports, key=lambda x: x[1], reverse=True)],
+        "steps": [{"category": category, "name": name, "duration": duration}
+                  for category, name, duration in sorted(_steps, key=lambda x: x[2], reverse=True)],
+    }
+
+
+def format_report(limit: int=25) -> str:
+    """
+    :return: a report of the ``limit`` modules with the longest import times and all measured startup steps, each
+             sorted by duration
+    """
+    profile = get_profile()
+    lines = [
+        "GoPythonGo startup took %.1fms, %.1fms of which were spent importing %s modules" %
+        (profile["total"] * 1000, sum(i["self"] for i in profile["imports"]) * 1000, len(profile["imports"])),
+        "",
+        "%10s %10s  %s" % ("self (ms)", "cum. (ms)", "module"),
+    ]
+    for imp in profile["imports"][:limit]:
+        lines.append("%10.1f %10.1f  %s" % (imp["self"] * 1000, imp["cumulative"] * 1000, imp["module"]))
+
+    lines += ["", "%10s  %s" % ("time (ms)", "startup step (steps include the steps and imports they trigger)")]
+    for step in profile["steps"]:
+        lines.append("%10.1f  %s %s" % (step["duration"] * 1000, step["category"], step["name"]))
+    return "\n".join(lines)
+
+
+def write_json(filename: str, process: str) -> None:
+    profile = get_profile()
+    profile["process"] = process
+    profile["pid"] = os.getpid()
+    with open(filename, "wt", encoding="utf-8") as f:
+        json.dump(profile, f, indent=2)
@@ -23,12 +23,12 @@ def get_stores() -> Dict[str, 'BaseStore']:
 def init_subsystem() -> None:
     global _stores
 
-    from gopythongo.stores import aptly, aptly_remote, docker
-    _stores = {
-        "aptly": aptly.store_class(),
-        "remote-aptly": aptly_remote.store_class(),
-        "docker": docker.store_class(),
-    }
+    _stores = {}
+    plugins.register_builtins(_stores, {
+        "aptly": "gopythongo.stores.aptly",
+        "remote-aptly": "gopythongo.stores.aptly_remote",
+        "docker": "gopythongo.stores.docker",
+    }, "store_class", BaseStore, "store_name")
 
     plugins.load_plugins("gopythongo.stores", _stores, "store_class", BaseStore, "store_name")
 
@@ -80,6 +80,16 @@ class BaseStore(CommandLinePlugin):
     def store(self, args: configargparse.Namespace) -> None:
         raise NotImplementedError("Each subclass of BaseStore MUST implement store")
 
+    def get_target(self, args: configargparse.Namespace) -> str:
+        """
+        Describes where this Store puts artifacts with the given command-line parameters, e.g. a repository. The
+        --matrix builds that store into the same target must not create the same package in the same version.
+
+        :param args: command-line parameters
+        :return: a description of the target
+        """
+        return self.store_name
+
     @abstractmethod
     def print_help(self) -> None:
         raise NotImplementedError("Each subclass of BaseStore MUST implement print_help")
@@ -97,6 +107,10 @@ def validate_args(args: configargparse.Namespace) -> None:
         _stores[args.store].validate_args(args)
 
 
+def get_target(args: configargparse.Namespace) -> str:
+    return _stores[args.store].get_target(args)
+
+
 def store(args: configargparse.Namespace) -> None:
     from gopythongo.utils.buildcontext import the_context
     if len(the_context.packer_artifacts) == 0:
@@ -7,15 +7,13 @@
 import configargparse
 import tempfile
 
-from typing import Any, Sequence, Union, Dict, cast, List, Type
+from typing import Any, cast, List, Type
 
 from gopythongo.shared.aptly_args import get_aptly_cmdline
 from gopythongo.shared.aptly_base import AptlyBaseStore
-from gopythongo.utils import print_debug, highlight, print_info, run_process, ErrorMessage, print_warning, \
+from gopythongo.utils import highlight, print_info, run_process, ErrorMessage, print_warning, \
     create_script_path, cmdargs_unquote_split
 from gopythongo.utils.buildcontext import the_context
-from gopythongo.utils.debversion import DebianVersion
-from gopythongo.versioners.parsers import VersionContainer
 from gopythongo.versioners.parsers.debianparser import DebianVersionParser
 from gopythongo.versioners.aptly import AptlyVersioner
 
@@ -69,97 +67,35 @@ class AptlyStore(AptlyBaseStore):
         aptlyv = cast(AptlyVersioner, get_versioners()["aptly"])
         return aptlyv
 
-    @staticmethod
-    def _get_debian_versionparser() -> DebianVersionParser:
-        from gopythongo.versioners import get_version_parsers
-        debvp = cast(DebianVersionParser, get_version_parsers()["debian"])
-        return debvp
-
-    def _check_version_exists(self, package_name: str, version: str, args: configargparse.Namespace) -> bool:
-        aptlyv = self._get_aptly_versioner()
-        if aptlyv.query_repo_versions("Name (%s), $Version (= %s)" %
-                                      (package_name, version), args,
-                                      allow_fallback_version=False):
-            return True
-        else:
-            return False
-
-    def _check_package_exists(self, package_name: str, args: configargparse.Namespace) -> bool:
-        aptlyv = self._get_aptly_versioner()
-        if aptlyv.query_repo_versions("Name (%s)" % package_name, args, allow_fallback_version=False):
-            return True
-        else:
-            return False
-
-    def _find_new_version(self, package_name: str, version: VersionContainer[DebianVersion], action: str,
-                          args: configargparse.Namespace) -> VersionContainer[DebianVersion]:
-        """
-        Find the next version given `action` in the target repo for `package_name`.
-        """
-        print_debug("Finding a version string in the aptly store for package %s" % highlight(package_name))
-        aptlyv = self._get_aptly_versioner()
-        debvp = self._get_debian_versionparser()
-
-        debversions = aptlyv.query_repo_versions("Name (%s), $Version (%% *%s*)" %
-                                                 (package_name, version.version), args, allow_fallback_version=False)
-
-        if debversions:
-            # we already have a version in the repo
-            new_base = debversions[-1]
-            print_debug("Found an existing version %s for package %s" %
-                        (highlight(str(new_base)), highlight(package_name)))
-            after_action = debvp.execute_action(debvp.deserialize(str(new_base)), action)
-            if after_action.version < version.version:
-                if args.aptly_overwrite_newer:
-                    print_info("Will overwrite same or newer version in repo with older version (existing: %s, "
-                               "new: %s)" % (highlight(str(version.version)), highlight(str(after_action.version))))
-                    return after_action
-                else:
-                    raise ErrorMessage("Repo already contains a newer version of %s than the one that was going to be "
-                                       "added (existing: %s new: %s)" %
-                                       (highlight(package_name), highlight(str(new_base)),
-                                        highlight(str(version.version))))
-            if self._check_version_exists(package_name, str(after_action.version), args):
-                print_debug("The new after-action (%s) version %s, based off %s, derived from %s is already taken, so "
-                            "we now recursively search for an unused version string for %s" %
-                            (action, highlight(str(after_action.version)), highlight(str(new_base)),
-                             highlight(str(version.version)), highlight(package_name)))
-                return self._find_new_version(package_name, after_action, action, args)
-            else:
-                print_info("After executing action %s, the selected next version for %s is %s" %
-                           (highlight(action), highlight(package_name), highlight(str(after_action.version))))
-                return after_action
-        else:
-            print_info("%s seems to be as yet unused" % highlight(str(version.version)))
-            return version
-
-    def generate_future_versions(self, artifact_names: Sequence[str], base_version: VersionContainer[Any], action: str,
-                                 args: configargparse.Namespace) -> Union[Dict[str, VersionContainer[DebianVersion]],
-                                                                          None]:
-        ret = {}  # type: Dict[str, VersionContainer[DebianVersion]]
-        base_debv = base_version.convert_to("debian")
-        for package_name in artifact_names:
-            next_version = self._find_new_version(package_name, base_debv, action, args)
-            ret[package_name] = next_version
-        return ret
-
     def store(self, args: configargparse.Namespace) -> None:
         self.aptly_wrapper_cmd = create_script_path(the_context.gopythongo_path, "vaultwrapper")
-        # add each package to the repo
-        for pkg in the_context.packer_artifacts:
-            if not args.aptly_dont_remove:  # aptly DO remove
-                if self._check_package_exists(pkg.artifact_metadata["package_name"], args):
-                    print_info("Removing existing package %s from repo %s" %
-                               (highlight(pkg.artifact_metadata["package_name"]), args.aptly_repo))
-                    cmdline = get_aptly_cmdline(args)
-                    cmdline += ["repo", "remove", args.aptly_repo, pkg.artifact_metadata["package_name"]]
-                    run_process(*cmdline)
-
-            print_info("Adding %s to repo %s" % (highlight(pkg.artifact_filename), highlight(args.aptly_repo)))
+        # every aptly invocation opens and locks aptly's whole database, so we look up, remove and add all packages
+        # in one invocation each instead of once per package
+        existing = self._query_repo_packages(the_context.packer_artifacts, args)
+        changed = sorted([pkg for pkg in the_context.packer_artifacts if not self._is_unchanged(pkg, existing, args)],
+                         key=lambda x: x.artifact_filename)
+        if the_context.packer_artifacts and not changed:
+            print_info("All packages are already in repo %s, skipping the publishing step" %
+                       highlight(args.aptly_repo))
+            return
+
+        if not args.aptly_dont_remove:  # aptly DO remove
+            existing_names = set(name for name, version in existing.keys())
+            remove = sorted(set(pkg.artifact_metadata["package_name"] for pkg in changed) & existing_names)
+            if remove:
+                print_info("Removing existing packages %s from repo %s" %
+                           (highlight(", ".join(remove)), args.aptly_repo))
+                cmdline = get_aptly_cmdline(args)
+                cmdline += ["repo", "remove", args.aptly_repo, self._name_query(remove)]
+                run_process(*cmdline)
+
+        if changed:
+            for pkg in changed:
+                print_info("Adding %s to repo %s" % (highlight(pkg.artifact_filename), highlight(args.aptly_repo)))
             cmdline = get_aptly_cmdline(args)
             cmdline += cmdargs_unquote_split(args.aptly_repo_opts)
 
-            cmdline += ["repo", "add", args.aptly_repo, pkg.artifact_filename]
+            cmdline += ["repo", "add", args.aptly_repo] + [pkg.artifact_filename for pkg in changed]
             run_process(*cmdline)
 
         # publish the repo or update it if it has been previously published
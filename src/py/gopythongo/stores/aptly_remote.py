@@ -3,22 +3,27 @@
 # This Source Code Form is subject to the terms of the Mozilla Public
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
+import hashlib
+import os
 import shutil
-import uuid
+import time
 
-import aptly_api
 import configargparse
 
-from typing import Any, Sequence, Union, Dict, cast, List, Type
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Any, cast, List, Set, Type, Tuple, Iterable, TYPE_CHECKING
 
+import gopythongo.shared.aptly_args as _aptly_args
 from gopythongo.shared.aptly_base import AptlyBaseStore, AptlyBaseVersioner
-from gopythongo.utils import print_debug, highlight, print_info, run_process, ErrorMessage, \
-    create_script_path
-from gopythongo.utils.buildcontext import the_context
-from gopythongo.utils.debversion import DebianVersion
-from gopythongo.versioners.parsers import VersionContainer
+from gopythongo.utils import print_debug, highlight, print_info, print_warning, run_process, ErrorMessage, \
+    create_script_path, sha256_file
+from gopythongo.utils.buildcontext import the_context, PackerArtifact
 from gopythongo.versioners.parsers.debianparser import DebianVersionParser
 
+if TYPE_CHECKING:
+    import aptly_api
+
 
 class RemoteAptlyStore(AptlyBaseStore):
     def __init__(self, *args: Any, **kwargs: Any) -> None:
@@ -44,6 +49,17 @@ class RemoteAptlyStore(AptlyBaseStore):
         gp_ast.add_argument("--aptly-timeout", dest="aptly_timeout", type=int, default=120,
                             env_var="APTLY_TIMEOUT",
                             help="Number of seconds to wait for the aptly API to respond before raising an error.")
+        gp_ast.add_argument("--aptly-upload-jobs", dest="aptly_upload_jobs", type=int, default=4,
+                            env_var="APTLY_UPLOAD_JOBS",
+                            help="The number of package files to upload to the aptly API server at the same time. "
+                                 "(Default: 4)")
+        gp_ast.add_argument("--aptly-upload-retries", dest="aptly_upload_retries", type=int, default=3,
+                            env_var="APTLY_UPLOAD_RETRIES",
+                            help="How often to retry uploading a package file to the aptly API server if the upload "
+                                 "fails. GoPythonGo waits --aptly-api-backoff seconds before the first retry and "
+                                 "doubles the wait after each attempt. Files that have been uploaded successfully are "
+                                 "kept on the server, so running GoPythonGo again (e.g. with --store-only) only "
+                                 "uploads the missing files. (Default: 3)")
 
     def validate_args(self, args: configargparse.Namespace) -> None:
         super().validate_args(args)
@@ -59,6 +75,11 @@ class RemoteAptlyStore(AptlyBaseStore):
                                (highlight(args.version_action), highlight(args.version_action),
                                 highlight(", ".join(debvp.supported_actions))))
 
+        if args.aptly_upload_jobs < 1:
+            raise ErrorMessage("%s must be at least 1" % highlight("--aptly-upload-jobs"))
+        if args.aptly_upload_retries < 0:
+            raise ErrorMessage("%s must not be negative" % highlight("--aptly-upload-retries"))
+
         if args.aptly_skip_signing and args.aptly_gpgkey:
             raise ErrorMessage("Don't specify to skip signing (--aptly-skip-signing) and also specify a GPG key for "
                                "signing (--aptly-gpgkey).")
@@ -73,21 +94,6 @@ class RemoteAptlyStore(AptlyBaseStore):
         aptlyv = cast(RemoteAptlyVersioner, get_versioners()["remote-aptly"])
         return aptlyv
 
-    @staticmethod
-    def _get_debian_versionparser() -> DebianVersionParser:
-        from gopythongo.versioners import get_version_parsers
-        debvp = cast(DebianVersionParser, get_version_parsers()["debian"])
-        return debvp
-
-    def _check_version_exists(self, package_name: str, version: str, args: configargparse.Namespace) -> bool:
-        aptlyv = self._get_aptly_versioner()
-        if aptlyv.query_repo_versions("Name (%s), $Version (= %s)" %
-                                      (package_name, version), args,
-                                      allow_fallback_version=False):
-            return True
-        else:
-            return False
-
     def _check_package_exists(self, package_name: str, args: configargparse.Namespace) -> bool:
         aptlyv = self._get_aptly_versioner()
         if aptlyv.query_repo_versions("Name (%s)" % package_name, args, allow_fallback_version=False):
@@ -95,78 +101,164 @@ class RemoteAptlyStore(AptlyBaseStore):
         else:
             return False
 
-    def _find_new_version(self, package_name: str, version: VersionContainer[DebianVersion], action: str,
-                          args: configargparse.Namespace) -> VersionContainer[DebianVersion]:
+    @staticmethod
+    def _get_digest(pkg: PackerArtifact) -> str:
+        return pkg.artifact_metadata.get("sha256") or sha256_file(pkg.artifact_filename)
+
+    @staticmethod
+    def _get_upload_folder(artifacts: Iterable[PackerArtifact]) -> str:
         """
-        Find the next version given `action` in the target repo for `package_name`.
+        :return: a temporary folder name on the aptly server that only depends on the contents of ``artifacts``, so
+                 repeated attempts to store the same artifacts reuse the files that have already been uploaded
         """
-        print_debug("Finding a version string in the aptly store for package %s" % highlight(package_name))
-        aptlyv = self._get_aptly_versioner()
-        debvp = self._get_debian_versionparser()
-
-        debversions = aptlyv.query_repo_versions("Name (%s), $Version (%% *%s*)" %
-                                                 (package_name, version.version), args, allow_fallback_version=False)
-
-        if debversions:
-            # we already have a version in the repo
-            new_base = debversions[-1]
-            print_debug("Found an existing version %s for package %s" %
-                        (highlight(str(new_base)), highlight(package_name)))
-            after_action = debvp.execute_action(debvp.deserialize(str(new_base)), action)
-            if after_action.version < version.version:
-                if args.aptly_overwrite_newer:
-                    print_info("Will overwrite same or newer version in repo with older version (existing: %s, "
-                               "new: %s)" % (highlight(str(version.version)), highlight(str(after_action.version))))
-                    return after_action
-                else:
-                    raise ErrorMessage("Repo already contains a newer version of %s than the one that was going to be "
-                                       "added (existing: %s new: %s)" %
-                                       (highlight(package_name), highlight(str(new_base)),
-                                        highlight(str(version.version))))
-            if self._check_version_exists(package_name, str(after_action.version), args):
-                print_debug("The new after-action (%s) version %s, based off %s, derived from %s is already taken, so "
-                            "we now recursively search for an unused version string for %s" %
-                            (action, highlight(str(after_action.version)), highlight(str(new_base)),
-                             highlight(str(version.version)), highlight(package_name)))
-                self._find_new_version(package_name, after_action, action, args)
+        digests = sorted(RemoteAptlyStore._get_digest(pkg) for pkg in artifacts)
+        return "gopythongo-%s" % hashlib.sha256(" ".join(digests).encode("utf-8")).hexdigest()[:32]
+
+    @staticmethod
+    def _get_receipt_folder(folder: str) -> str:
+        """
+        aptly's files API doesn't report the size or digest of uploaded files and aptly keeps partially written files
+        when an upload fails. So after each successful upload an empty receipt named after the file and its SHA256
+        digest is uploaded into this folder, which is never added to the repo.
+        """
+        return "%s-receipts" % folder
+
+    @staticmethod
+    def _get_receipt_name(filename: str, digest: str) -> str:
+        return "%s.%s" % (os.path.basename(filename), digest)
+
+    @staticmethod
+    def _list_folder(_aptly: 'aptly_api.Client', folder: str) -> Set[str]:
+        import aptly_api
+
+        try:
+            return set(_aptly.files.list(folder))
+        except aptly_api.AptlyAPIException:
+            # the folder doesn't exist
+            return set()
+
+    def _get_files_to_upload(self, _aptly: 'aptly_api.Client', folder: str,
+                             artifacts: List[PackerArtifact]) -> List[PackerArtifact]:
+        """
+        :return: the artifacts that are not in ``folder`` on the aptly server yet. Files in ``folder`` that have no
+                 receipt for the digest of the local file may be incomplete or outdated, so they are deleted and
+                 included in the result.
+        """
+        uploaded = self._list_folder(_aptly, folder)
+        receipts = self._list_folder(_aptly, self._get_receipt_folder(folder))
+        to_upload = []  # type: List[PackerArtifact]
+        for pkg in artifacts:
+            basename = os.path.basename(pkg.artifact_filename)
+            if basename in uploaded:
+                if self._get_receipt_name(basename, self._get_digest(pkg)) in receipts:
+                    continue
+                print_warning("%s in Aptly temporary folder %s can't be verified and may be incomplete. Uploading it "
+                              "again." % (highlight(basename), highlight(folder)))
+                _aptly.files.delete("%s/%s" % (folder, basename))
+            to_upload.append(pkg)
+        return to_upload
+
+    @staticmethod
+    def _upload_file(_aptly: 'aptly_api.Client', folder: str, filename: str, digest: str, retries: int,
+                     backoff: float) -> Tuple[str, int, float]:
+        import aptly_api
+
+        size = os.path.getsize(filename)
+        for attempt in range(retries + 1):
+            print_info("Uploading %s (%.1f MB)" % (highlight(filename), size / 1024 / 1024))
+            start = time.perf_counter()
+            try:
+                _aptly.files.upload(folder, filename)
+                # aptly only answers once it has written the whole file, so the upload can be trusted from here on
+                _aptly.files.upload(RemoteAptlyStore._get_receipt_folder(folder),
+                                    (RemoteAptlyStore._get_receipt_name(filename, digest), BytesIO(b"")))
+            except (aptly_api.AptlyAPIException, OSError) as e:
+                if attempt == retries:
+                    raise
+                print_warning("Uploading %s failed (%s). Retrying in %.1fs..." %
+                              (highlight(filename), str(e), backoff * 2 ** attempt))
+                time.sleep(backoff * 2 ** attempt)
             else:
-                print_info("After executing action %s, the selected next version for %s is %s" %
-                           (highlight(action), highlight(package_name), highlight(str(after_action.version))))
-                return after_action
-        else:
-            print_info("%s seems to be as yet unused" % highlight(str(version.version)))
-            return version
-
-    def generate_future_versions(self, artifact_names: Sequence[str], base_version: VersionContainer[Any], action: str,
-                                 args: configargparse.Namespace) -> Union[Dict[str, VersionContainer[DebianVersion]],
-                                                                          None]:
-        ret = {}  # type: Dict[str, VersionContainer[DebianVersion]]
-        base_debv = base_version.convert_to("debian")
-        for package_name in artifact_names:
-            next_version = self._find_new_version(package_name, base_debv, action, args)
-            ret[package_name] = next_version
-        return ret
+                break
+        duration = time.perf_counter() - start
+        print_info("Uploaded %s in %.1fs (%.1f MB/s)" %
+                   (highlight(filename), duration, size / 1024 / 1024 / max(duration, 0.001)))
+        return filename, size, duration
+
+    def _verify_added(self, artifacts: Iterable[PackerArtifact], args: configargparse.Namespace) -> None:
+        """
+        Makes sure that the repo contains the exact files that the Packers created by comparing their SHA256 digests.
+        """
+        existing = self._query_repo_packages(artifacts, args)
+        for pkg in artifacts:
+            if "sha256" not in pkg.artifact_metadata or "version" not in pkg.artifact_metadata:
+                continue
+            key = (pkg.artifact_metadata["package_name"], pkg.artifact_metadata["version"])
+            if pkg.artifact_metadata["sha256"] not in existing.get(key, set()):
+                raise ErrorMessage("The SHA256 digest of %s %s in repo %s doesn't match the digest of %s. The upload "
+                                   "may have been corrupted." % (highlight(key[0]), highlight(key[1]),
+                                                                 highlight(args.aptly_repo),
+                                                                 highlight(pkg.artifact_filename)))
 
     def store(self, args: configargparse.Namespace) -> None:
-        _aptly = aptly_api.Client(args.aptly_server_url, timeout=args.aptly_timeout)
-        _tmpfolder = str(uuid.uuid4())
-        # add each package to the repo
-        for pkg in the_context.packer_artifacts:
-            print_info("Adding %s to repo %s" % (highlight(pkg.artifact_filename), highlight(args.aptly_repo)))
-            try:
-                _aptly.files.upload(_tmpfolder, pkg.artifact_filename)
-            except aptly_api.AptlyAPIException as e:
-                raise ErrorMessage("Unable to upload package file %s to Aptly temporary folder %s. Error was: %s" %
-                                   (pkg.artifact_filename, _tmpfolder, str(e))) from e
+        import aptly_api
+
+        _aptly = _aptly_args.get_aptly_api_client(args)
+        existing = self._query_repo_packages(the_context.packer_artifacts, args)
+        changed = [pkg for pkg in the_context.packer_artifacts if not self._is_unchanged(pkg, existing, args)]
+        if the_context.packer_artifacts and not changed:
+            print_info("All packages are already in repo %s, skipping the publishing step" %
+                       highlight(args.aptly_repo))
+            return
 
-            report = _aptly.repos.add_uploaded_file(args.aptly_repo, _tmpfolder, pkg.artifact_filename,
-                                                    remove_processed_files=True,
+        # upload all packages into the temporary folder concurrently, then add the whole folder to the repo
+        if changed:
+            _tmpfolder = self._get_upload_folder(changed)
+            to_upload = self._get_files_to_upload(_aptly, _tmpfolder, changed)
+            if len(to_upload) < len(changed):
+                print_info("Resuming upload: %s of %s files are already in Aptly temporary folder %s" %
+                           (len(changed) - len(to_upload), len(changed), highlight(_tmpfolder)))
+
+            start = time.perf_counter()
+            total_size = 0
+            if to_upload:
+                with ThreadPoolExecutor(max_workers=min(args.aptly_upload_jobs, len(to_upload))) as executor:
+                    futures = [(pkg.artifact_filename,
+                                executor.submit(self._upload_file, _aptly, _tmpfolder, pkg.artifact_filename,
+                                                self._get_digest(pkg), args.aptly_upload_retries,
+                                                args.aptly_api_backoff))
+                               for pkg in to_upload]
+                    for filename, future in futures:
+                        try:
+                            total_size += future.result()[1]
+                        except (aptly_api.AptlyAPIException, OSError) as e:
+                            for _, f in futures:
+                                f.cancel()
+                            # keep the temporary folder, so the next attempt only uploads the missing files
+                            raise ErrorMessage("Unable to upload package file %s to Aptly temporary folder %s. "
+                                               "Error was: %s" % (filename, _tmpfolder, str(e))) from e
+            duration = time.perf_counter() - start
+            print_info("Uploaded %s files (%.1f MB) in %.1fs (%.1f MB/s)" %
+                       (len(to_upload), total_size / 1024 / 1024, duration,
+                        total_size / 1024 / 1024 / max(duration, 0.001)))
+
+            print_info("Adding %s to repo %s" %
+                       (highlight(", ".join(os.path.basename(pkg.artifact_filename) for pkg in changed)),
+                        highlight(args.aptly_repo)))
+            report = _aptly.repos.add_uploaded_file(args.aptly_repo, _tmpfolder, remove_processed_files=True,
                                                     force_replace=not args.aptly_dont_remove)
             if report.failed_files:
                 raise ErrorMessage("Unable to add uploaded file(s) to Aptly repo: %s" % str(report))
             else:
                 print_debug("File import report: %s" % str(report))
 
+            self._verify_added(changed, args)
+            try:
+                _aptly.files.delete(self._get_receipt_folder(_tmpfolder))
+            except aptly_api.AptlyAPIException as e:
+                print_debug("Unable to delete Aptly temporary folder %s: %s" %
+                            (highlight(self._get_receipt_folder(_tmpfolder)), str(e)))
+
         # publish the repo or update it if it has been previously published
         if args.aptly_publish_endpoint:
             print_info("Publishing repo %s to endpoint %s" %
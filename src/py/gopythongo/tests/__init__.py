@@ -5,3 +5,16 @@
 from .debversion import *
 from .templating import *
 from .version_conversion import *
+from .wheelcache import *
+from .targz import *
+from .docker_context import *
+from .compression import *
+from .aptly_versions import *
+from .aptly_client import *
+from .outbox import *
+from .debfile import *
+from .plugins import *
+from .startupprofile import *
+from .versionprobe import *
+from .matrix import *
+from .venvsnapshot import *
@@ -0,0 +1,117 @@
+# -* encoding: utf-8 *-
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import atexit
+import io
+import json
+import re
+import threading
+import time
+
+from argparse import Namespace
+from contextlib import redirect_stdout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, List, Tuple
+
+from unittest.case import TestCase
+
+import aptly_api
+
+import gopythongo.shared.aptly_args as _aptly_args
+
+
+class _FakeAptlyHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        server = self.server  # type: Any
+        server.requests.append((self.path, self.client_address[1]))
+        status, body = server.responses.pop(0) if server.responses else (200, [])
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+class PooledAptlyClientTests(TestCase):
+    def setUp(self) -> None:
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _FakeAptlyHandler)
+        self.server.requests = []  # type: List[Tuple[str, int]]
+        self.server.responses = []  # type: List[Tuple[int, Any]]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        self.saved_stats = dict(_aptly_args._aptly_api_stats)
+        _aptly_args._aptly_api_stats.update({"requests": 0, "errors": 0, "total_time": 0.0, "max_time": 0.0})
+        self.saved_clients = dict(_aptly_args._aptly_api_clients)
+        _aptly_args._aptly_api_clients.clear()
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        atexit.unregister(_aptly_args._print_aptly_api_stats)
+        _aptly_args._aptly_api_stats.update(self.saved_stats)
+        _aptly_args._aptly_api_clients.clear()
+        _aptly_args._aptly_api_clients.update(self.saved_clients)
+
+    def _get_client(self, backoff: float=0.0) -> aptly_api.Client:
+        return _aptly_args.get_aptly_api_client(Namespace(
+            aptly_server_url="http://127.0.0.1:%s/" % self.server.server_address[1], aptly_timeout=5,
+            aptly_api_retries=2, aptly_api_backoff=backoff, aptly_api_pool_size=2))
+
+    def test_shared_connection(self) -> None:
+        repo = {"Name": "test repo", "Comment": "", "DefaultDistribution": "", "DefaultComponent": ""}
+        self.server.responses = [(200, [repo]), (200, repo)]
+        client = self._get_client()
+        self.assertIs(self._get_client(), client)
+
+        self.assertEqual([repo.name for repo in client.repos.list()], ["test repo"])
+        self.assertEqual(client.repos.show("test repo").name, "test repo")
+        self.assertEqual([path for path, _ in self.server.requests], ["/api/repos", "/api/repos/test%20repo"])
+        # both requests used the same keep-alive connection
+        self.assertEqual(len(set(port for _, port in self.server.requests)), 1)
+
+    def test_retry_with_backoff(self) -> None:
+        self.server.responses = [(503, {}), (503, {}), (200, [])]
+        started = time.time()
+        self.assertEqual(self._get_client(backoff=0.05).repos.list(), [])
+        # no delay before the first retry, then 0.05 * 2
+        self.assertGreaterEqual(time.time() - started, 0.1)
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual((_aptly_args._aptly_api_stats["requests"], _aptly_args._aptly_api_stats["errors"]), (1, 0))
+
+    def test_retries_exhausted(self) -> None:
+        self.server.responses = [(503, {"error": "overloaded"})] * 3
+        with self.assertRaises(aptly_api.AptlyAPIException) as cm:
+            self._get_client().repos.list()
+        self.assertEqual(cm.exception.status_code, 503)
+        self.assertIn("overloaded", str(cm.exception))
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_error_response(self) -> None:
+        self.server.responses = [(404, [{"error": "local repo with name test not found"}])]
+        with self.assertRaises(aptly_api.AptlyAPIException) as cm:
+            self._get_client().repos.show("test")
+        self.assertEqual(cm.exception.status_code, 404)
+        self.assertIn("local repo with name test not found", str(cm.exception))
+        # errors that aren't temporary aren't retried
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_stats(self) -> None:
+        self.server.responses = [(200, []), (404, {"error": "not found"}), (200, [])]
+        client = self._get_client()
+        client.repos.list()
+        self.assertRaises(aptly_api.AptlyAPIException, client.repos.show, "test")
+        client.repos.list()
+
+        out = io.StringIO()
+        with redirect_stdout(out):
+            _aptly_args._print_aptly_api_stats()
+        self.assertIn("aptly API: 3 requests (1 failed)", re.sub(r"\x1b\[[0-9;]*m", "", out.getvalue()))
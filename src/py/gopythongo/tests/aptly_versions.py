@@ -0,0 +1,223 @@
+# -* encoding: utf-8 *-
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+
+from argparse import Namespace
+from unittest.case import TestCase
+from typing import Any, Dict, List, Set, Tuple, Union, cast, NamedTuple
+
+import gopythongo.shared.aptly_args as _aptly_args
+
+from gopythongo.stores.aptly import AptlyStore
+from gopythongo.stores.aptly_remote import RemoteAptlyStore
+from gopythongo.utils import ErrorMessage, sha256_file
+from gopythongo.utils.buildcontext import PackerArtifact, the_context
+from gopythongo.utils.debversion import DebianVersion
+from gopythongo.versioners.parsers import VersionContainer
+from gopythongo.versioners.parsers.debianparser import DebianVersionParser
+
+
+_Args = NamedTuple("_Args", [("aptly_overwrite_newer", bool), ("aptly_repo", str)])
+args = cast(argparse.Namespace, _Args(aptly_overwrite_newer=False, aptly_repo="test"))
+
+
+class _FakeVersioner(object):
+    def __init__(self, packages: List[Tuple[str, str, str]]) -> None:
+        self.packages = packages
+        self.queries = []  # type: List[str]
+
+    def query_repo_packages(self, query: str, args: argparse.Namespace) -> List[Tuple[str, str, str]]:
+        self.queries.append(query)
+        return self.packages
+
+
+class _TestStore(AptlyStore):
+    versioner = None  # type: _FakeVersioner
+
+    @staticmethod
+    def _get_aptly_versioner() -> Any:
+        return _TestStore.versioner
+
+    @staticmethod
+    def _get_debian_versionparser() -> DebianVersionParser:
+        return DebianVersionParser()
+
+
+class AptlyVersionResolutionTests(TestCase):
+    def _generate(self, packages: List[Tuple[str, str, str]], base: str, action: str="bump-revision",
+                  names: List[str]=None) -> Any:
+        _TestStore.versioner = _FakeVersioner(packages)
+        store = _TestStore()
+        repo_versions = store._query_repo_versions(names or ["pkg"], args)
+        self.assertEqual(len(_TestStore.versioner.queries), 1)
+        return {
+            name: str(store._find_new_version(name, versions, VersionContainer(DebianVersion.fromstring(base), "debian"),
+                                              action, args).version)
+            for name, versions in repo_versions.items()
+        }
+
+    def test_unused_version(self) -> None:
+        self.assertEqual(self._generate([("pkg", "1.0-1", "")], "2.0"), {"pkg": "2.0"})
+
+    def test_next_free_revision(self) -> None:
+        packages = [("pkg", "1.0-%s" % i, "") for i in range(1, 50)] + [("other", "1.0-80", "")]
+        self.assertEqual(self._generate(packages, "1.0", names=["pkg", "other"]),
+                         {"pkg": "1.0-50", "other": "1.0-81"})
+
+    def test_newer_version_in_repo(self) -> None:
+        # "0.1.0-3" matches the "*1.0*" query, but is older than 1.0
+        self.assertRaises(ErrorMessage, self._generate, [("pkg", "0.1.0-3", "")], "1.0")
+
+    def test_no_progress(self) -> None:
+        self.assertRaises(ErrorMessage, self._generate, [("pkg", "1.0", "")], "1.0", "none")
+
+    def test_invalid_repo_version(self) -> None:
+        self.assertEqual(self._generate([("pkg", "1.0-1", ""), ("pkg", "1.0:1", ""), ("pkg", "1.0-2", "")], "1.0"),
+                         {"pkg": "1.0-3"})
+
+
+class _FakeFiles(object):
+    def __init__(self, folders: Dict[str, Set[str]], fail: Set[str]=None) -> None:
+        self.folders = folders
+        self.deleted = []  # type: List[str]
+        self.uploads = []  # type: List[Tuple[str, str]]
+        # the first upload of each of these files fails
+        self.fail = set(fail or [])
+        self._lock = threading.Lock()
+
+    def list(self, directory: str) -> List[str]:
+        import aptly_api
+        if directory not in self.folders:
+            raise aptly_api.AptlyAPIException("not found")
+        return sorted(self.folders[directory])
+
+    def upload(self, destination: str, *files: Union[str, Tuple[str, Any]]) -> List[str]:
+        import aptly_api
+        with self._lock:
+            names = [os.path.basename(f if isinstance(f, str) else f[0]) for f in files]
+            for name in names:
+                self.uploads.append((destination, name))
+                if name in self.fail:
+                    self.fail.remove(name)
+                    raise aptly_api.AptlyAPIException("upload of %s interrupted" % name, status_code=502)
+            self.folders.setdefault(destination, set()).update(names)
+            return ["%s/%s" % (destination, name) for name in names]
+
+    def delete(self, path: str) -> None:
+        self.deleted.append(path)
+        self.folders.pop(path, None)
+
+
+class _FakeRepos(object):
+    def __init__(self, files: _FakeFiles, versioner: _FakeVersioner,
+                 packages: Dict[str, Tuple[str, str, str]]) -> None:
+        self.files = files
+        self.versioner = versioner
+        # maps file names to the (name, version, digest) that aptly reads from them
+        self.packages = packages
+        self.added = []  # type: List[Tuple[str, str]]
+
+    def add_uploaded_file(self, reponame: str, dir: str, filename: str=None, remove_processed_files: bool=True,
+                          force_replace: bool=False) -> Any:
+        self.added.append((reponame, dir))
+        self.versioner.packages += [self.packages[fn] for fn in sorted(self.files.folders.pop(dir, set()))]
+        return Namespace(failed_files=[], report={})
+
+
+class _FakeClient(object):
+    def __init__(self, files: _FakeFiles, repos: _FakeRepos=None) -> None:
+        self.files = files
+        self.repos = repos
+
+
+class _TestRemoteStore(RemoteAptlyStore):
+    versioner = None  # type: _FakeVersioner
+
+    @staticmethod
+    def _get_aptly_versioner() -> Any:
+        return _TestRemoteStore.versioner
+
+
+class RemoteAptlyResumeTests(TestCase):
+    def test_unverified_files_are_uploaded_again(self) -> None:
+        artifacts = [PackerArtifact("deb", "/out/%s_1.0_all.deb" % name, {"sha256": name * 8}, cast(Any, None), "deb")
+                     for name in ["a", "b", "c"]]
+        store = RemoteAptlyStore()
+        folder = store._get_upload_folder(artifacts)
+        files = _FakeFiles({
+            folder: {"a_1.0_all.deb", "b_1.0_all.deb"},
+            # b's upload never finished, there's only a receipt for a
+            store._get_receipt_folder(folder): {"a_1.0_all.deb.%s" % ("a" * 8)},
+        })
+        to_upload = store._get_files_to_upload(cast(Any, _FakeClient(files)), folder, artifacts)
+        self.assertEqual([pkg.artifact_filename for pkg in to_upload], ["/out/b_1.0_all.deb", "/out/c_1.0_all.deb"])
+        self.assertEqual(files.deleted, ["%s/b_1.0_all.deb" % folder])
+
+
+class RemoteAptlyStoreTests(TestCase):
+    def setUp(self) -> None:
+        self.folder = tempfile.mkdtemp()
+        self.args = Namespace(aptly_server_url="http://aptly/", aptly_timeout=1, aptly_api_retries=0,
+                              aptly_api_backoff=0.0, aptly_api_pool_size=1, aptly_repo="test",
+                              aptly_upload_jobs=2, aptly_upload_retries=2, aptly_dont_remove=False,
+                              aptly_overwrite_newer=False, aptly_publish_endpoint=None)
+        packages = {}  # type: Dict[str, Tuple[str, str, str]]
+        self.artifacts = set()  # type: Set[PackerArtifact]
+        for name in ["a", "b", "c"]:
+            fn = os.path.join(self.folder, "%s_1.0_all.deb" % name)
+            with open(fn, "wb") as f:
+                f.write(name.encode("utf-8") * 1024)
+            packages[os.path.basename(fn)] = (name, "1.0", sha256_file(fn))
+            self.artifacts.add(PackerArtifact("deb", fn, {"package_name": name, "version": "1.0",
+                                                          "sha256": sha256_file(fn)}, cast(Any, None), "deb"))
+
+        _TestRemoteStore.versioner = _FakeVersioner([])
+        self.files = _FakeFiles({}, fail={"b_1.0_all.deb"})
+        self.repos = _FakeRepos(self.files, _TestRemoteStore.versioner, packages)
+        self.saved = (dict(_aptly_args._aptly_api_clients), the_context.packer_artifacts)
+        _aptly_args._aptly_api_clients[(self.args.aptly_server_url, self.args.aptly_timeout,
+                                        self.args.aptly_api_retries, self.args.aptly_api_backoff,
+                                        self.args.aptly_api_pool_size)] = cast(Any, _FakeClient(self.files,
+                                                                                                self.repos))
+        the_context.packer_artifacts = self.artifacts
+
+    def tearDown(self) -> None:
+        _aptly_args._aptly_api_clients.clear()
+        _aptly_args._aptly_api_clients.update(self.saved[0])
+        the_context.packer_artifacts = self.saved[1]
+        shutil.rmtree(self.folder)
+
+    def test_upload_with_retry(self) -> None:
+        store = _TestRemoteStore()
+        folder = store._get_upload_folder(self.artifacts)
+        store.store(self.args)
+
+        uploaded = [name for dest, name in self.files.uploads if dest == folder]
+        # b was uploaded twice, because the first attempt failed
+        self.assertEqual(sorted(uploaded), ["a_1.0_all.deb", "b_1.0_all.deb", "b_1.0_all.deb", "c_1.0_all.deb"])
+        self.assertEqual(sorted(name for dest, name in self.files.uploads if dest == store._get_receipt_folder(folder)),
+                         sorted("%s.%s" % (os.path.basename(pkg.artifact_filename), pkg.artifact_metadata["sha256"])
+                                for pkg in self.artifacts))
+        self.assertEqual(self.repos.added, [("test", folder)])
+        self.assertEqual(sorted(p[0] for p in _TestRemoteStore.versioner.packages), ["a", "b", "c"])
+        self.assertNotIn(store._get_receipt_folder(folder), self.files.folders)
+
+    def test_retries_exhausted(self) -> None:
+        self.args.aptly_upload_retries = 0
+        self.assertRaises(ErrorMessage, _TestRemoteStore().store, self.args)
+        self.assertEqual(self.repos.added, [])
+
+    def test_unchanged_packages(self) -> None:
+        _TestRemoteStore().store(self.args)
+        self.files.uploads.clear()
+        _TestRemoteStore().store(self.args)
+        self.assertEqual(self.files.uploads, [])
+        self.assertEqual(len(self.repos.added), 1)
@@ -0,0 +1,50 @@
+# -* encoding: utf-8 *-
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import gzip
+import lzma
+import os
+import zlib
+
+from io import BytesIO
+from unittest.case import TestCase
+
+from gopythongo.utils import ErrorMessage
+from gopythongo.utils.compression import get_backend
+
+
+class CompressionBackendTests(TestCase):
+    def setUp(self) -> None:
+        # compressible, but not trivially so, and not a multiple of the block size
+        self.data = b"".join(b"%d %s\n" % (i, os.urandom(8).hex().encode("ascii")) for i in range(40000))
+
+    def _compress(self, codec: str, level: int=None, threads: int=1) -> bytes:
+        out = BytesIO()
+        cf = get_backend(codec).open(out, level=level, threads=threads)
+        for i in range(0, len(self.data), 10000):
+            cf.write(self.data[i:i + 10000])
+        cf.close()
+        return out.getvalue()
+
+    def test_parallel_gzip(self) -> None:
+        single = self._compress("gzip", threads=1)
+        parallel = self._compress("gzip", threads=4)
+        self.assertEqual(gzip.decompress(parallel), self.data)
+        self.assertEqual(gzip.decompress(single), self.data)
+        # the dictionary priming keeps the block-parallel output close to single-threaded gzip
+        self.assertLess(len(parallel), len(single) * 1.05)
+
+    def test_parallel_gzip_empty(self) -> None:
+        self.data = b""
+        self.assertEqual(zlib.decompress(self._compress("gzip", threads=2), 16 + zlib.MAX_WBITS), b"")
+
+    def test_xz(self) -> None:
+        self.assertEqual(lzma.decompress(self._compress("xz", level=1)), self.data)
+        self.assertRaises(ErrorMessage, get_backend("xz").validate, None, 2)
+
+    def test_invalid_level(self) -> None:
+        self.assertRaises(ErrorMessage, get_backend("gzip").validate, 11, 1)
+        self.assertRaises(ErrorMessage, get_backend, "bzip3")
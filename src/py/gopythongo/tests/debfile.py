@@ -0,0 +1,86 @@
+# -* encoding: utf-8 *-
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import hashlib
+import os
+import shutil
+import tarfile
+import tempfile
+
+from io import BytesIO
+from typing import Dict
+from unittest.case import TestCase
+
+from gopythongo.utils.debfile import DebArchive
+
+
+def _read_ar(filename: str) -> Dict[str, bytes]:
+    members = {}  # type: Dict[str, bytes]
+    with open(filename, "rb") as f:
+        assert f.read(8) == b"!<arch>\n"
+        while True:
+            header = f.read(60)
+            if not header:
+                break
+            size = int(header[48:58])
+            members[header[:16].decode("ascii").strip()] = f.read(size)
+            if size % 2:
+                f.read(1)
+    return members
+
+
+class DebArchiveTests(TestCase):
+    def setUp(self) -> None:
+        self.folder = tempfile.mkdtemp()
+        self.source = os.path.join(self.folder, "venv")
+        os.makedirs(os.path.join(self.source, "bin"))
+        os.makedirs(os.path.join(self.source, "lib"))
+        with open(os.path.join(self.source, "bin", "python"), "wb") as f:
+            f.write(b"#!/bin/sh\n")
+        os.chmod(os.path.join(self.source, "bin", "python"), 0o755)
+        with open(os.path.join(self.source, "lib", "data.bin"), "wb") as f:
+            f.write(os.urandom(200 * 1024))
+        with open(os.path.join(self.source, "lib", "cached.pyc"), "wb") as f:
+            f.write(b"x")
+        os.symlink("python", os.path.join(self.source, "bin", "python3"))
+
+        self.control = [("Package", "test"), ("Version", "1.0-1"), ("Architecture", "all"),
+                        ("Maintainer", "Test <test@example.com>"), ("Description", "Test\nmore\n\ntext")]
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.folder)
+
+    def _write(self, deb: DebArchive) -> Dict[str, bytes]:
+        deb.add_path(self.source, "/opt/test")
+        deb.add_exclude("*.pyc")
+        deb.write(os.path.join(self.folder, "test.deb"))
+        return _read_ar(os.path.join(self.folder, "test.deb"))
+
+    def test_package_layout(self) -> None:
+        members = self._write(DebArchive(self.control, compression="xz"))
+        self.assertEqual(list(members.keys()), ["debian-binary", "control.tar.gz", "data.tar.xz"])
+        self.assertEqual(members["debian-binary"], b"2.0\n")
+
+        data = tarfile.open(fileobj=BytesIO(members["data.tar.xz"]))
+        self.assertEqual(data.getnames(), [".", "./opt", "./opt/test", "./opt/test/bin", "./opt/test/bin/python",
+                                           "./opt/test/bin/python3", "./opt/test/lib", "./opt/test/lib/data.bin"])
+        self.assertTrue(data.getmember("./opt/test/bin/python3").issym())
+        self.assertEqual(data.getmember("./opt/test/bin/python").mode, 0o755)
+        self.assertEqual(data.getmember("./opt/test/lib/data.bin").uname, "root")
+
+        control = tarfile.open(fileobj=BytesIO(members["control.tar.gz"]))
+        controlfile = control.extractfile("./control").read().decode("utf-8")
+        self.assertIn("Installed-Size: 207\n", controlfile)
+        self.assertTrue(controlfile.endswith("Description: Test\n more\n .\n text\n"))
+
+        with open(os.path.join(self.source, "lib", "data.bin"), "rb") as f:
+            md5 = hashlib.md5(f.read()).hexdigest()
+        self.assertIn("%s  opt/test/lib/data.bin\n" % md5, control.extractfile("./md5sums").read().decode("utf-8"))
+
+    def test_reproducible(self) -> None:
+        first = self._write(DebArchive(self.control, source_date_epoch=1000, threads=2))
+        second = self._write(DebArchive(self.control, source_date_epoch=1000))
+        self.assertEqual(first, second)
@@ -4,6 +4,9 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import copy
+import pickle
+
 from unittest.case import TestCase
 from gopythongo.utils.debversion import debian_substr_compare, split_version_parts, DebianVersion, \
                                         InvalidDebianVersionString
@@ -60,3 +63,31 @@ class DebianVersionTests(TestCase):
         self.assertRaises(InvalidDebianVersionString, DebianVersion.fromstring, "1.0:0")
         self.assertRaises(InvalidDebianVersionString, DebianVersion.fromstring, "ö:1.0")
         self.assertRaises(InvalidDebianVersionString, DebianVersion.fromstring, "1.Ö")
+
+    def test_sort_key(self) -> None:
+        version_strings = ["~~a", "~", "~~", "a1", "1.0", "1.0-1", "1.0~bpo1", "1.0-1~bpo1", "1:0.1", "1.0.0",
+                           "1.0a", "1.0~~", "1.0+git1", "1.0-1.1", "1.0-0ubuntu1"]
+        versions = [DebianVersion.fromstring(x) for x in version_strings]
+        by_key = sorted(versions, key=DebianVersion.sort_key)
+        self.assertListEqual([str(x) for x in sorted(versions)], [str(x) for x in by_key])
+        self.assertListEqual(['~~', '~~a', '~', '1.0~~', '1.0~bpo1', '1.0', '1.0-0ubuntu1', '1.0-1~bpo1', '1.0-1',
+                              '1.0-1.1', '1.0a', '1.0+git1', '1.0.0', 'a1', '1:0.1'], [str(x) for x in by_key])
+
+        # an epoch always wins and no epoch is the same as epoch 0
+        self.assertTrue(DebianVersion.fromstring("1:0.1") > DebianVersion.fromstring("2.0"))
+        self.assertEqual(DebianVersion.fromstring("0:1.0").sort_key(), DebianVersion.fromstring("1.0").sort_key())
+
+    def test_immutable_and_hashable(self) -> None:
+        v = DebianVersion.fromstring("1:1.0-1")
+        with self.assertRaises(AttributeError):
+            v.revision = "2"  # type: ignore
+        self.assertFalse(hasattr(v, "__dict__"))
+        self.assertIs(v.sort_key(), v.sort_key())
+
+        self.assertEqual(len({v, DebianVersion.fromstring("1:1.0-1"), DebianVersion("1", "1.0", "1")}), 1)
+        self.assertEqual(DebianVersion.fromstring("1.0"), DebianVersion.fromstring("0:1.0"))
+        self.assertNotEqual(DebianVersion.fromstring("1.0"), DebianVersion.fromstring("1.0-1"))
+        # repeated components are shared between instances
+        self.assertIs(DebianVersion.fromstring("2.0-" + "1").revision, v.revision)
+        self.assertEqual(copy.copy(v), v)
+        self.assertEqual(pickle.loads(pickle.dumps(v)), v)
@@ -0,0 +1,87 @@
+# -* encoding: utf-8 *-
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import os
+import shutil
+import tarfile
+import tempfile
+
+from io import BytesIO
+from typing import Dict, List, Tuple
+
+from unittest.case import TestCase
+
+from gopythongo.builders.docker import DockerBuilder
+from gopythongo.utils.targz import TarStream
+
+
+class DockerContextHashTests(TestCase):
+    def setUp(self) -> None:
+        self.folder = tempfile.mkdtemp()
+        self.config = os.path.join(self.folder, "config")
+        os.makedirs(os.path.join(self.config, "sub"))
+        self._write("config/sub/script.sh", "#!/bin/sh\n")
+        self.dockerfile = self._write("Dockerfile", "FROM debian\n")
+        self.paths = [(self.config, self.config), (self.dockerfile, "/Dockerfile")]  # type: List[Tuple[str, str]]
+        self.buildargs = {"DEBIAN_DISTRIBUTION": "bookworm"}  # type: Dict[str, str]
+        self.initial = self._hash()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.folder)
+
+    def _write(self, path: str, content: str) -> str:
+        fn = os.path.join(self.folder, path)
+        with open(fn, "wt") as f:
+            f.write(content)
+        return fn
+
+    def _hash(self) -> str:
+        return DockerBuilder._hash_context(self.paths, self.buildargs)
+
+    def test_unchanged(self) -> None:
+        self.assertEqual(self._hash(), self.initial)
+
+    def test_file_content(self) -> None:
+        self._write("config/sub/script.sh", "#!/bin/bash\n")
+        self.assertNotEqual(self._hash(), self.initial)
+
+    def test_dockerfile(self) -> None:
+        self._write("Dockerfile", "FROM debian:bookworm\n")
+        self.assertNotEqual(self._hash(), self.initial)
+
+    def test_file_mode(self) -> None:
+        os.chmod(os.path.join(self.config, "sub", "script.sh"), 0o755)
+        self.assertNotEqual(self._hash(), self.initial)
+
+    def test_buildargs(self) -> None:
+        self.buildargs["DEBIAN_DISTRIBUTION"] = "trixie"
+        self.assertNotEqual(self._hash(), self.initial)
+
+    def test_empty_folder(self) -> None:
+        os.makedirs(os.path.join(self.config, "empty"))
+        self.assertNotEqual(self._hash(), self.initial)
+
+    def test_symlink(self) -> None:
+        os.symlink("sub/script.sh", os.path.join(self.config, "link"))
+        linked = self._hash()
+        self.assertNotEqual(linked, self.initial)
+
+        os.unlink(os.path.join(self.config, "link"))
+        os.symlink("sub", os.path.join(self.config, "link"))
+        self.assertNotEqual(self._hash(), linked)
+
+    def test_hashes_what_the_context_contains(self) -> None:
+        os.makedirs(os.path.join(self.config, "empty"))
+        os.symlink("sub", os.path.join(self.config, "link"))
+        with TarStream(self.paths, include_dirs=True) as ts:
+            tf = tarfile.open(fileobj=BytesIO(b"".join(ts)))
+        members = {ti.name: ti for ti in tf.getmembers()}
+        config = self.config.lstrip("/")
+        self.assertEqual(set(members.keys()), {"Dockerfile", "%s/sub" % config, "%s/sub/script.sh" % config,
+                                               "%s/empty" % config, "%s/link" % config})
+        self.assertTrue(members["%s/empty" % config].isdir())
+        self.assertTrue(members["%s/link" % config].issym())
+        self.assertEqual(members["%s/link" % config].linkname, "sub")
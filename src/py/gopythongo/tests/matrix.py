@@ -0,0 +1,140 @@
+# -* encoding: utf-8 *-
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import json
+import os
+import shutil
+import tempfile
+
+from argparse import Namespace
+from typing import Any, Dict, List
+
+from unittest.case import TestCase
+
+from gopythongo import builders, packers, stores, versioners
+from gopythongo.utils import ErrorMessage
+from gopythongo.utils.buildcontext import the_context, PackerArtifact
+
+
+def _artifact(filename: str, package_name: str="test", version: str="1.0", target: str="repo") -> Dict[str, Any]:
+    return {"t": "deb", "af": filename, "am": {"package_name": package_name, "version": version, "sha256": "00",
+                                              "store_target": target}, "cbp": "deb"}
+
+
+class MatrixEntryTests(TestCase):
+    def test_parse_matrix_entry(self) -> None:
+        self.assertEqual(builders.parse_matrix_entry("bookworm"), ("bookworm", []))
+        self.assertEqual(builders.parse_matrix_entry("bookworm:"), ("bookworm", []))
+        self.assertEqual(builders.parse_matrix_entry("bookworm:--distribution=bookworm --repo='a b'"),
+                         ("bookworm", ["--distribution=bookworm", "--repo=a b"]))
+        self.assertEqual(builders.parse_matrix_entry("deb12.amd_64-x:--x=a:b"), ("deb12.amd_64-x", ["--x=a:b"]))
+
+    def test_invalid_name(self) -> None:
+        self.assertRaises(ErrorMessage, builders.parse_matrix_entry, "book worm:--distribution=bookworm")
+        self.assertRaises(ErrorMessage, builders.parse_matrix_entry, ":--distribution=bookworm")
+
+
+class MatrixArtifactTests(TestCase):
+    def test_distinct_artifacts(self) -> None:
+        builders.check_matrix_artifacts([
+            ("bullseye", [_artifact("test_1.0~deb11_all.deb", target="bullseye")]),
+            ("bookworm", [_artifact("test_1.0~deb12_all.deb", target="bookworm")]),
+            ("other", [_artifact("other_1.0_all.deb", package_name="other", target="bookworm")]),
+        ])
+
+    def test_same_filename(self) -> None:
+        self.assertRaises(ErrorMessage, builders.check_matrix_artifacts, [
+            ("bullseye", [_artifact("test_1.0_all.deb", target="bullseye")]),
+            ("bookworm", [_artifact("./test_1.0_all.deb", target="bookworm")]),
+        ])
+
+    def test_same_package_in_same_target(self) -> None:
+        self.assertRaises(ErrorMessage, builders.check_matrix_artifacts, [
+            ("bullseye", [_artifact("bullseye/test_1.0_all.deb")]),
+            ("bookworm", [_artifact("bookworm/test_1.0_all.deb")]),
+        ])
+
+    def test_artifacts_without_version(self) -> None:
+        unversioned = [{"t": "targz", "af": fn, "am": {"sha256": "00"}, "cbp": "targz"} for fn in ["a", "b"]]
+        builders.check_matrix_artifacts([("a", unversioned[:1]), ("b", unversioned[1:])])
+
+    def test_aptly_store_targets(self) -> None:
+        stores.init_subsystem()
+        aptly = stores.get_stores()["aptly"]
+        remote = stores.get_stores()["remote-aptly"]
+        args = Namespace(aptly_repo="bookworm", aptly_server_url=None, aptly_config=None,
+                         aptly_distribution="bookworm/main")
+        self.assertEqual(aptly.get_target(args), "aptly repo bookworm")
+        self.assertNotEqual(aptly.get_target(args),
+                            aptly.get_target(Namespace(**dict(vars(args), aptly_repo="bullseye"))))
+        # the distribution doesn't matter, because a repo can't contain the same package twice
+        self.assertEqual(aptly.get_target(args),
+                         aptly.get_target(Namespace(**dict(vars(args), aptly_distribution="bullseye/main"))))
+        self.assertEqual(remote.get_target(Namespace(**dict(vars(args), aptly_server_url="http://aptly/"))),
+                         "aptly repo bookworm at http://aptly/")
+
+
+class MatrixStoreTests(TestCase):
+    def setUp(self) -> None:
+        versioners.init_subsystem()
+        packers.init_subsystem()
+        self.folder = tempfile.mkdtemp()
+        self.calls = os.path.join(self.folder, "calls")
+        # records the command-line of each GoPythonGo process that stores a matrix build
+        self.gopythongo = os.path.join(self.folder, "gopythongo")
+        with open(self.gopythongo, "wt") as f:
+            f.write("#!/bin/sh\necho \"$@\" >> %s\n" % self.calls)
+        os.chmod(self.gopythongo, 0o755)
+
+        self.saved = (the_context.gopythongo_cmd, the_context.tempmount, the_context.read_version,
+                      the_context.generated_versions, the_context.packer_artifacts)
+        the_context.gopythongo_cmd = [self.gopythongo]
+        the_context.tempmount = self.folder
+        the_context.read_version = versioners.get_version_parsers()["debian"].parse("1.0", None)
+        the_context.generated_versions = {}
+        the_context.packer_artifacts = set()
+        for name in ["bullseye", "bookworm"]:
+            fn = os.path.join(self.folder, "test_1.0~%s_all.deb" % name)
+            with open(fn, "wb") as f:
+                f.write(name.encode("utf-8"))
+            the_context.packer_artifacts.add(PackerArtifact("deb", fn, {"package_name": "test", "version": "1.0"},
+                                                            packers.get_packers()["deb"], "deb"))
+
+    def tearDown(self) -> None:
+        (the_context.gopythongo_cmd, the_context.tempmount, the_context.read_version,
+         the_context.generated_versions, the_context.packer_artifacts) = self.saved
+        shutil.rmtree(self.folder)
+
+    def _tag(self) -> None:
+        # as if each artifact was created by the matrix build named in its filename
+        artifacts = the_context.packer_artifacts
+        for artifact in artifacts:
+            the_context.packer_artifacts = {artifact}
+            builders.tag_matrix_artifacts(Namespace(matrix_entry=artifact.artifact_filename.split("~")[1][:-8]),
+                                          "target")
+        the_context.packer_artifacts = artifacts
+
+    def test_store_per_entry(self) -> None:
+        self._tag()
+        artifacts = set(the_context.packer_artifacts)
+        builders.store_matrix(Namespace(matrix=["bullseye:--repo=bullseye", "bookworm:--repo=bookworm",
+                                                "trixie:--repo=trixie"]))
+        self.assertEqual(the_context.packer_artifacts, artifacts)
+
+        with open(self.calls, "rt") as f:
+            calls = [line.split() for line in f.read().splitlines()]
+        self.assertEqual([call[call.index("--matrix-entry") + 1] for call in calls], ["bullseye", "bookworm"])
+        for call, repo in zip(calls, ["bullseye", "bookworm"]):
+            self.assertIn("--repo=%s" % repo, call)
+            self.assertEqual(call[call.index("--resume-from") + 1], "store")
+            with open(call[call.index("--state-file") + 1], "rt", encoding="utf-8") as f:
+                stored = json.load(f)["packer_artifacts"]  # type: List[Dict[str, Any]]
+            self.assertEqual([artifact["am"]["matrix_entry"] for artifact in stored], [repo])
+
+    def test_unknown_entry(self) -> None:
+        self._tag()
+        self.assertRaises(ErrorMessage, builders.store_matrix, Namespace(matrix=["bullseye"]))
+        self.assertFalse(os.path.exists(self.calls))
@@ -0,0 +1,118 @@
+# -* encoding: utf-8 *-
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import os
+import shutil
+import tempfile
+
+from unittest.case import TestCase
+
+from gopythongo import packers, versioners
+from gopythongo.utils import ErrorMessage, sha256_file, outbox
+from gopythongo.utils.buildcontext import the_context, PackerArtifact
+
+
+class OutboxTests(TestCase):
+    def setUp(self) -> None:
+        versioners.init_subsystem()
+        packers.init_subsystem()
+        self.folder = tempfile.mkdtemp()
+        self.outbox = os.path.join(self.folder, "outbox")
+        self.artifact = os.path.join(self.folder, "test_1.0_all.deb")
+        with open(self.artifact, "wb") as f:
+            f.write(os.urandom(1024))
+
+        self.saved = (the_context.read_version, the_context.generated_versions, the_context.packer_artifacts)
+        the_context.read_version = versioners.get_version_parsers()["debian"].parse("1.0", None)
+        the_context.generated_versions = {}
+        the_context.packer_artifacts = {
+            PackerArtifact("deb", self.artifact, {"package_name": "test", "version": "1.0",
+                                                  "sha256": sha256_file(self.artifact)},
+                           packers.get_packers()["fpm"], "fpm")
+        }
+
+    def tearDown(self) -> None:
+        the_context.read_version, the_context.generated_versions, the_context.packer_artifacts = self.saved
+        shutil.rmtree(self.folder)
+
+    def test_roundtrip(self) -> None:
+        tempmount = the_context.tempmount
+        outbox.fill_outbox(self.outbox)
+        os.unlink(self.artifact)
+        the_context.packer_artifacts = set()
+
+        outbox.load_outbox(self.outbox)
+        self.assertEqual(len(the_context.packer_artifacts), 1)
+        artifact = the_context.packer_artifacts.pop()
+        self.assertEqual(artifact.artifact_filename, os.path.join(self.outbox, "test_1.0_all.deb"))
+        self.assertEqual(str(the_context.read_version.version), "1.0")
+        self.assertEqual(the_context.tempmount, tempmount)
+
+    def test_corrupt_artifact(self) -> None:
+        outbox.fill_outbox(self.outbox)
+        with open(os.path.join(self.outbox, "test_1.0_all.deb"), "ab") as f:
+            f.write(b"x")
+        self.assertRaises(ErrorMessage, outbox.load_outbox, self.outbox)
+
+    def test_clear(self) -> None:
+        outbox.fill_outbox(self.outbox)
+        outbox.clear_outbox(self.outbox)
+        self.assertEqual(os.listdir(self.outbox), [])
+        self.assertTrue(os.path.exists(self.artifact))
+        self.assertRaises(ErrorMessage, outbox.load_outbox, self.outbox)
+
+    def test_resume_state(self) -> None:
+        statefile = os.path.join(self.folder, "state.json")
+        the_context.persist_state(statefile, "version")
+        self.assertRaises(ErrorMessage, the_context.resume_state, statefile, "store")
+
+        the_context.resume_state(statefile, "build")
+        self.assertEqual(str(the_context.read_version.version), "1.0")
+
+        the_context.persist_state(statefile, "build")
+        the_context.packer_artifacts = set()
+        the_context.resume_state(statefile, "store")
+        self.assertEqual(the_context.packer_artifacts.pop().artifact_filename, self.artifact)
+
+        os.unlink(self.artifact)
+        the_context.resume_state(statefile, "build")
+        self.assertRaises(ErrorMessage, the_context.resume_state, statefile, "store")
+
+    def test_artifacts_in_outbox(self) -> None:
+        # the packers wrote their artifacts to the outbox folder (e.g. --outbox .)
+        os.makedirs(self.outbox)
+        artifact = the_context.packer_artifacts.pop()
+        artifact.artifact_filename = os.path.join(self.outbox, "test_1.0_all.deb")
+        shutil.move(self.artifact, artifact.artifact_filename)
+        the_context.packer_artifacts.add(artifact)
+
+        outbox.fill_outbox(self.outbox)
+        outbox.fill_outbox(self.outbox)
+        self.assertTrue(os.path.exists(artifact.artifact_filename))
+        outbox.load_outbox(self.outbox)
+
+        outbox.clear_outbox(self.outbox)
+        self.assertEqual(os.listdir(self.outbox), ["test_1.0_all.deb"])
+
+    def test_refill(self) -> None:
+        outbox.fill_outbox(self.outbox)
+        # the second build writes a new file instead of changing the hard linked one
+        for artifact in the_context.packer_artifacts:
+            artifact.artifact_filename = self.artifact
+        os.unlink(self.artifact)
+        with open(self.artifact, "wb") as f:
+            f.write(os.urandom(1024))
+        with open(os.path.join(self.outbox, "test_0.9_all.deb"), "wb") as f:
+            f.write(b"stale")
+        files = os.path.join(self.outbox, outbox.FILES_FILENAME)
+        with open(files, "wt", encoding="utf-8") as f:
+            f.write('["%s", "%s"]' % (os.path.join(self.outbox, "test_1.0_all.deb"),
+                                      os.path.join(self.outbox, "test_0.9_all.deb")))
+
+        outbox.fill_outbox(self.outbox)
+        self.assertEqual(sorted(os.listdir(self.outbox)),
+                         [outbox.FILES_FILENAME, outbox.STATE_FILENAME, "test_1.0_all.deb"])
+        self.assertTrue(os.path.samefile(self.artifact, os.path.join(self.outbox, "test_1.0_all.deb")))
@@ -0,0 +1,40 @@
+# -* encoding: utf-8 *-
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from typing import Dict
+from unittest.case import TestCase
+
+from gopythongo import builders
+from gopythongo.builders import BaseBuilder
+from gopythongo.utils import plugins
+
+
+class LazyPluginTests(TestCase):
+    def test_lazy_loading(self) -> None:
+        registry = {}  # type: Dict[str, BaseBuilder]
+        plugins.register_builtins(registry, {"noisolation": "gopythongo.builders.noisolation"}, "builder_class",
+                                  BaseBuilder, "builder_name")
+        self.assertFalse(registry["noisolation"].is_loaded)
+        self.assertEqual(registry["noisolation"].builder_name, "noisolation")
+        self.assertTrue(registry["noisolation"].is_loaded)
+        self.assertIs(registry["noisolation"].load(), registry["noisolation"].load())
+
+    def test_init_subsystem(self) -> None:
+        builders.init_subsystem()
+        self.assertIn("docker", builders.get_builders())
+        self.assertFalse(builders.get_builders()["docker"].is_loaded)
+
+    def test_name_mismatch(self) -> None:
+        registry = {}  # type: Dict[str, BaseBuilder]
+        plugins.register_builtins(registry, {"other": "gopythongo.builders.noisolation"}, "builder_class",
+                                  BaseBuilder, "builder_name")
+        self.assertRaises(ImportError, getattr, registry["other"], "builder_name")
+
+    def test_wrong_baseclass(self) -> None:
+        registry = {}  # type: Dict[str, BaseBuilder]
+        plugins.register_builtins(registry, {"noisolation": "gopythongo.builders.noisolation"}, "builder_class",
+                                  dict, "builder_name")
+        self.assertRaises(ImportError, registry["noisolation"].load)
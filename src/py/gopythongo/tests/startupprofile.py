@@ -0,0 +1,50 @@
+# -* encoding: utf-8 *-
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from unittest.case import TestCase
+
+_profiled_startup = """
+import sys
+sys.argv = ["gopythongo", "--profile-startup-json", sys.argv[1]]
+import gopythongo.main
+from gopythongo import startupprofile, builders
+with startupprofile.measure("init_subsystem", "gopythongo.builders"):
+    builders.init_subsystem()
+builders.get_builders()["noisolation"].builder_name
+startupprofile.finish()
+startupprofile.write_json(sys.argv[2], "outer")
+"""
+
+
+class StartupProfileTests(TestCase):
+    def test_profile(self) -> None:
+        fd, filename = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            env = dict(os.environ)
+            env["PYTHONPATH"] = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+            subprocess.check_call([sys.executable, "-c", _profiled_startup, filename], env=env)
+            with open(filename, "rt", encoding="utf-8") as f:
+                profile = json.load(f)
+        finally:
+            os.unlink(filename)
+
+        modules = {imp["module"]: imp for imp in profile["imports"]}
+        self.assertIn("gopythongo.main", modules)
+        self.assertIn("gopythongo.builders.noisolation", modules)
+        self.assertNotIn("gopythongo.builders.docker", modules)
+        self.assertGreaterEqual(modules["gopythongo.main"]["cumulative"], modules["gopythongo.main"]["self"])
+        self.assertGreaterEqual(profile["total"], modules["gopythongo.main"]["cumulative"])
+        self.assertEqual([(s["category"], s["name"]) for s in profile["steps"]],
+                         [("init_subsystem", "gopythongo.builders"),
+                          ("load plugin", "noisolation (gopythongo.builders.noisolation)")])
+        self.assertEqual(profile["imports"], sorted(profile["imports"], key=lambda x: x["self"], reverse=True))
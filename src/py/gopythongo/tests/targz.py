@@ -0,0 +1,118 @@
+# -* encoding: utf-8 *-
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+
+from argparse import Namespace
+from io import BytesIO
+from typing import Any, List
+from unittest.case import TestCase
+
+from gopythongo.packers.targz import TarGzPacker
+from gopythongo.utils import ErrorMessage
+from gopythongo.utils.targz import TarStream, create_targzip, normalize_tarinfo
+
+
+class TarStreamTests(TestCase):
+    def setUp(self) -> None:
+        self.folder = tempfile.mkdtemp()
+        for fn in ["a.txt", "b.bin"]:
+            with open(os.path.join(self.folder, fn), "wb") as f:
+                f.write(os.urandom(200 * 1024))
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.folder)
+
+    def _read(self, data: bytes) -> tarfile.TarFile:
+        return tarfile.open(fileobj=BytesIO(data))
+
+    def test_stream_matches_create_targzip(self) -> None:
+        with TarStream([(self.folder, "/ctx")], max_memory=1) as ts:
+            streamed = self._read(b"".join(ts))
+        created = self._read(create_targzip(paths=[(self.folder, "/ctx")]).getvalue())
+        self.assertEqual(sorted(streamed.getnames()), sorted(created.getnames()))
+        for name in streamed.getnames():
+            self.assertEqual(streamed.extractfile(name).read(), created.extractfile(name).read())
+
+    def test_uncompressed_stream(self) -> None:
+        with TarStream([(self.folder, "/ctx")], compress=False) as ts:
+            data = b"".join(ts)
+        self.assertEqual(len(tarfile.open(fileobj=BytesIO(data), mode="r:").getnames()), 2)
+
+    def test_close_while_producing(self) -> None:
+        ts = TarStream([(self.folder, "/ctx")], max_memory=1)
+        next(iter(ts))
+        ts.close()
+        self.assertFalse(ts._thread.is_alive())
+
+
+class ReproducibleTarTests(TestCase):
+    def setUp(self) -> None:
+        self.folders = [tempfile.mkdtemp(), tempfile.mkdtemp()]
+        # create the same files in a different order with different mtimes in both folders
+        for ix, folder in enumerate(self.folders):
+            names = ["b.txt", "a.txt", "c.sh"] if ix == 0 else ["c.sh", "a.txt", "b.txt"]
+            for fn in names:
+                with open(os.path.join(folder, fn), "wt") as f:
+                    f.write("content of %s\n" % fn)
+                os.utime(os.path.join(folder, fn), (time.time() - ix * 1000, time.time() - ix * 1000))
+            os.chmod(os.path.join(folder, "c.sh"), 0o775 if ix == 0 else 0o700)
+
+    def tearDown(self) -> None:
+        for folder in self.folders:
+            shutil.rmtree(folder)
+
+    def test_identical_inputs_identical_outputs(self) -> None:
+        for codec in ["gzip", "xz"]:
+            outputs = [create_targzip(paths=[(folder, "/ctx")], compression=codec, threads=ix + 1,
+                                      source_date_epoch=1000000000).getvalue()
+                       for ix, folder in enumerate(self.folders)]
+            self.assertEqual(outputs[0], outputs[1])
+
+    def test_stream_identical_outputs(self) -> None:
+        outputs = []
+        for folder in self.folders:
+            with TarStream([(folder, "/ctx")], source_date_epoch=1000000000) as ts:
+                outputs.append(b"".join(ts))
+        self.assertEqual(outputs[0], outputs[1])
+
+    def _read(self, data: bytes) -> tarfile.TarFile:
+        return tarfile.open(fileobj=BytesIO(data))
+
+    def test_normalized_metadata(self) -> None:
+        tf = self._read(create_targzip(paths=[(self.folders[0], "/ctx")], source_date_epoch=1000).getvalue())
+        self.assertEqual(tf.getnames(), ["ctx/a.txt", "ctx/b.txt", "ctx/c.sh"])
+        for ti in tf.getmembers():
+            self.assertEqual((ti.mtime, ti.uid, ti.gid, ti.uname), (1000, 0, 0, "root"))
+        self.assertEqual(tf.getmember("ctx/c.sh").mode, 0o755)
+        self.assertEqual(tf.getmember("ctx/a.txt").mode, 0o644)
+
+    def test_mtime_clamping(self) -> None:
+        ti = tarfile.TarInfo("x")
+        ti.mtime = 500
+        self.assertEqual(normalize_tarinfo(ti, 1000).mtime, 500)
+
+
+class TarGzPackerValidationTests(TestCase):
+    def _validate(self, targz: List[str], **kwargs: Any) -> None:
+        options = dict(targz=targz, targz_basename="test", targz_compression="gzip", targz_level=None,
+                       targz_threads=None, targz_reproducible=False, targz_source_date_epoch="1000")
+        options.update(kwargs)
+        TarGzPacker().validate_args(Namespace(**options))
+
+    def test_duplicate_specs(self) -> None:
+        self.assertRaises(ErrorMessage, self._validate, ["ext:/x", "ext:/y"])
+        self.assertRaises(ErrorMessage, self._validate, ["ext:/x", "ext:/y", "other:/z"], targz_reproducible=True)
+        self.assertRaises(ErrorMessage, self._validate, ["/x", "/y"], targz_reproducible=True)
+
+    def test_distinct_specs(self) -> None:
+        self._validate(["ext:/x", "ext:/y;codec=xz", "/z"])
+        self._validate(["ext:/x", "/z"], targz_reproducible=True)
+        self._validate([], targz_reproducible=True)
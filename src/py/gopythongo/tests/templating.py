@@ -4,6 +4,10 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import os
+import shutil
+import tempfile
+
 from unittest.case import TestCase
 
 from gopythongo.utils import template
@@ -16,3 +20,25 @@ class TemplateStringParsingTest(TestCase):
         self.assertEqual(pswt.original, teststr)
         self.assertEqual(pswt.format_str, "--test1={0} -t {1} -f \"{2}\"")
         self.assertListEqual(pswt.templates, ["blah", '"xyz"', "contained"])
+
+
+class TemplateCacheTest(TestCase):
+    def setUp(self) -> None:
+        self.folder = tempfile.mkdtemp()
+        self.tplfile = os.path.join(self.folder, "test.j2")
+        with open(self.tplfile, "wt") as f:
+            f.write("{{ value }}-1")
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.folder)
+
+    def test_cache(self) -> None:
+        self.assertEqual(template.process_in_memory(self.tplfile, {"value": "a"}), "a-1")
+        tpl = template.get_template(self.tplfile)
+        self.assertIs(template.get_template(self.tplfile), tpl)
+
+        with open(self.tplfile, "wt") as f:
+            f.write("{{ value }}-2")
+        os.utime(self.tplfile, (0, 0))
+        self.assertIsNot(template.get_template(self.tplfile), tpl)
+        self.assertEqual(template.process_in_memory(self.tplfile, {"value": "b"}), "b-2")
@@ -0,0 +1,123 @@
+# -* encoding: utf-8 *-
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import io
+import os
+import re
+import shutil
+import sys
+import tempfile
+
+from contextlib import redirect_stdout
+from typing import Dict
+
+from unittest.case import TestCase
+
+from gopythongo.utils import venvsnapshot
+
+
+class VirtualenvSnapshotTests(TestCase):
+    def setUp(self) -> None:
+        self.folder = tempfile.mkdtemp()
+        self.venv = os.path.join(self.folder, "venv")
+        self.snapshot = os.path.join(self.folder, "snapshots", "venv-test")
+        os.makedirs(os.path.join(self.venv, "lib", "site-packages", "pkg"))
+        os.makedirs(os.path.join(self.venv, "include"))
+        os.symlink("lib", os.path.join(self.venv, "lib64"))
+        self._write("bin/python", "#!/bin/sh\n", 0o755)
+        self._write("lib/site-packages/pkg/__init__.py", "x = 1\n")
+        self._write("lib/site-packages/pkg/data.txt", "data\n")
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.folder)
+
+    def _write(self, path: str, content: str, mode: int=0o644) -> None:
+        fn = os.path.join(self.venv, path)
+        os.makedirs(os.path.dirname(fn), exist_ok=True)
+        with open(fn, "wt") as f:
+            f.write(content)
+        os.chmod(fn, mode)
+
+    def _read_tree(self, path: str) -> Dict[str, str]:
+        ret = {}  # type: Dict[str, str]
+        for root, dirs, files in os.walk(path):
+            for name in dirs + files:
+                fn = os.path.join(root, name)
+                key = os.path.relpath(fn, path)
+                if os.path.islink(fn):
+                    ret[key] = "-> %s" % os.readlink(fn)
+                elif os.path.isdir(fn):
+                    ret[key] = "dir"
+                else:
+                    with open(fn, "rt") as f:
+                        ret[key] = "%o %s" % (os.stat(fn).st_mode, f.read())
+        return ret
+
+    def test_roundtrip(self) -> None:
+        expected = self._read_tree(self.venv)
+        venvsnapshot.save_snapshot(self.snapshot, self.venv, {"pkg": "1.0"})
+        shutil.rmtree(self.venv)
+
+        self.assertEqual(venvsnapshot.restore_snapshot(self.snapshot, self.venv), {"pkg": "1.0"})
+        self.assertEqual(self._read_tree(self.venv), expected)
+        self.assertEqual(os.listdir(os.path.dirname(self.snapshot)), ["venv-test"])
+
+    def test_restore_into_empty_folder(self) -> None:
+        venvsnapshot.save_snapshot(self.snapshot, self.venv, {})
+        shutil.rmtree(self.venv)
+        os.makedirs(self.venv)
+        self.assertEqual(venvsnapshot.restore_snapshot(self.snapshot, self.venv), {})
+        self.assertTrue(os.path.exists(os.path.join(self.venv, "bin", "python")))
+
+    def test_no_snapshot(self) -> None:
+        self.assertIsNone(venvsnapshot.restore_snapshot(self.snapshot, os.path.join(self.folder, "other")))
+        venvsnapshot.save_snapshot(self.snapshot, self.venv, {})
+        # the build path is not empty
+        self.assertIsNone(venvsnapshot.restore_snapshot(self.snapshot, self.venv))
+
+    def test_incremental_save(self) -> None:
+        venvsnapshot.save_snapshot(self.snapshot, self.venv, {"pkg": "1.0"})
+        unchanged = os.stat(os.path.join(self.snapshot, "venv", "lib", "site-packages", "pkg", "data.txt"))
+
+        self._write("lib/site-packages/pkg/__init__.py", "x = 2\n")
+        self._write("lib/site-packages/new.py", "")
+        os.chmod(os.path.join(self.venv, "bin", "python"), 0o700)
+        shutil.rmtree(os.path.join(self.venv, "include"))
+        os.unlink(os.path.join(self.venv, "lib64"))
+        os.symlink("lib/site-packages", os.path.join(self.venv, "lib64"))
+        expected = self._read_tree(self.venv)
+        venvsnapshot.save_snapshot(self.snapshot, self.venv, {"pkg": "2.0"})
+
+        self.assertEqual(self._read_tree(os.path.join(self.snapshot, "venv")), expected)
+        # unchanged files are linked from the previous snapshot instead of being copied again
+        self.assertEqual(os.stat(os.path.join(self.snapshot, "venv", "lib", "site-packages", "pkg",
+                                              "data.txt")).st_ino, unchanged.st_ino)
+
+        shutil.rmtree(self.venv)
+        self.assertEqual(venvsnapshot.restore_snapshot(self.snapshot, self.venv), {"pkg": "2.0"})
+        self.assertEqual(self._read_tree(self.venv), expected)
+
+    def test_print_changes(self) -> None:
+        out = io.StringIO()
+        with redirect_stdout(out):
+            venvsnapshot.print_changes({"a": "1.0", "b": "1.0", "c": "1.0"}, {"a": "1.0", "b": "2.0", "d": "1.0"})
+        lines = [re.sub(r"\x1b\[[0-9;]*m", "", line) for line in out.getvalue().splitlines()]
+        self.assertEqual(len(lines), 4)
+        self.assertIn("1 installed, 1 changed, 1 removed, 1 unchanged", lines[0])
+        self.assertTrue(lines[1].endswith("+ d 1.0"))
+        self.assertTrue(lines[2].endswith("~ b 1.0 => 2.0"))
+        self.assertTrue(lines[3].endswith("- c 1.0"))
+
+    def test_find_orphans(self) -> None:
+        # uses the packages installed in the interpreter running the tests
+        orphans = venvsnapshot.find_orphans(sys.executable, ["requests"])
+        for name in ["requests", "urllib3", "idna", "certifi", "pip", "setuptools"]:
+            self.assertNotIn(name, orphans)
+        self.assertIn("jinja2", orphans)
+
+        orphans = venvsnapshot.find_orphans(sys.executable, ["requests", "Jinja2>=2"])
+        self.assertNotIn("jinja2", orphans)
+        self.assertNotIn("markupsafe", orphans)
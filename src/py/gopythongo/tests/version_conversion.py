@@ -8,8 +8,9 @@ import argparse
 
 from unittest.case import TestCase
 from collections import namedtuple
-from typing import Any, cast, NamedTuple
+from typing import Any, Dict, Tuple, cast, NamedTuple
 
+from gopythongo.versioners.parsers import ConversionGraph, VersionContainer
 from gopythongo.versioners.parsers.debianparser import DebianVersionParser
 from gopythongo.versioners.parsers.pep440parser import PEP440VersionParser
 from gopythongo.versioners.parsers.semverparser import SemVerVersionParser
@@ -19,6 +20,23 @@ _Args = NamedTuple("_Args", [("semver_partial", bool), ("semver_coerce", bool)])
 args = cast(argparse.Namespace, _Args(semver_partial=False, semver_coerce=False))
 
 
+class _FakeParser(object):
+    def __init__(self, name: str, converts_from: Dict[str, bool]) -> None:
+        self.versionparser_name = name
+        self.converts_from = converts_from
+
+    def can_convert_from(self, parserid: str) -> Tuple[bool, bool]:
+        if parserid in self.converts_from:
+            return True, self.converts_from[parserid]
+        return False, False
+
+    def can_convert_to(self, parserid: str) -> Tuple[bool, bool]:
+        return False, False
+
+    def convert_from(self, version: VersionContainer) -> VersionContainer:
+        return VersionContainer("%s>%s" % (version.version, self.versionparser_name), self.versionparser_name)
+
+
 class VersionConversionTests(TestCase):
     def _testeachless(self, *test: Any) -> None:
         ix = 1
@@ -53,3 +71,36 @@ class VersionConversionTests(TestCase):
             dvp.convert_from(pvp.parse("1.2.3-post2", args)).version,  # ==post2
             dvp.convert_from(pvp.parse("1.2.3-rev3", args)).version    # ==post3
         )
+
+    def test_parse_many(self) -> None:
+        for parser, valid, invalid in [(DebianVersionParser(), ["1.0-1", "2:1.0~rc1", "1.0-1"], ["1.0:1", "ö"]),
+                                       (PEP440VersionParser(), ["1.0.post1", "1!2.0rc1"], ["1.0-bogus"]),
+                                       (SemVerVersionParser(), ["1.2.3", "1.2.3-rc.1"], ["1.2"])]:
+            versions, errors = parser.parse_many([valid[0], invalid[0]] + valid[1:] + invalid[1:], args)
+            self.assertListEqual([str(v.version) for v in versions],
+                                 [str(parser.parse(v, args).version) for v in valid])
+            self.assertListEqual([version_str for version_str, message in errors], invalid)
+            self.assertTrue(all(v.parsed_by == parser.versionparser_name for v in versions))
+
+    def test_conversion_routes(self) -> None:
+        graph = ConversionGraph({"debian": DebianVersionParser(), "pep440": PEP440VersionParser(),
+                                 "semver": SemVerVersionParser()})
+        self.assertEqual(graph.route("pep440", "debian"), (["pep440", "debian"], True))
+        self.assertEqual(graph.route("pep440", "semver"), (["pep440", "semver"], False))
+        self.assertIsNone(graph.route("debian", "semver"))
+        self.assertIs(graph.route("pep440", "debian"), graph.route("pep440", "debian"))
+        self.assertEqual(str(graph.convert(PEP440VersionParser().parse("1.0rc1", args), "debian").version), "1.0~rc1")
+
+    def test_lossless_route_preferred(self) -> None:
+        graph = ConversionGraph(cast(Any, {
+            "a": _FakeParser("a", {}),
+            "b": _FakeParser("b", {"a": True}),
+            "c": _FakeParser("c", {"a": False, "b": True}),
+            "d": _FakeParser("d", {"c": False}),
+        }))
+        self.assertEqual(graph.route("a", "c"), (["a", "b", "c"], True))
+        self.assertEqual(graph.route("a", "d"), (["a", "b", "c", "d"], False))
+        self.assertTrue(graph.is_lossless("a", "c"))
+        self.assertFalse(graph.is_lossless("a", "d"))
+        self.assertIsNone(graph.route("d", "a"))
+        self.assertEqual(graph.convert(VersionContainer("1", "a"), "d").version, "1>b>c>d")
@@ -0,0 +1,59 @@
+# -* encoding: utf-8 *-
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+
+from unittest.case import TestCase
+
+import gopythongo
+
+from gopythongo import builders
+
+
+class GoPythonGoVersionProbeTests(TestCase):
+    def setUp(self) -> None:
+        self.folder = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.folder, "bin"))
+        with open(os.path.join(self.folder, "bin", "python"), "wt") as f:
+            f.write("#!/bin/sh\nexit 1\n")
+        os.chmod(os.path.join(self.folder, "bin", "python"), 0o755)
+        self.sitepackages = os.path.join(self.folder, "lib", "python3.11", "site-packages")
+        os.makedirs(self.sitepackages)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.folder)
+
+    def _write_metadata(self, version: str) -> str:
+        distinfo = os.path.join(self.sitepackages, "gopythongo-%s.dist-info" % version)
+        os.makedirs(distinfo)
+        with open(os.path.join(distinfo, "METADATA"), "wt") as f:
+            f.write("Metadata-Version: 2.1\nName: gopythongo\nVersion: %s\n\nVersion: 0.0\n" % version)
+        return os.path.join(distinfo, "METADATA")
+
+    def test_virtualenv_metadata(self) -> None:
+        metadata = self._write_metadata(gopythongo.version)
+        self.assertEqual(builders._find_metadata_files(self.folder), [metadata])
+        self.assertEqual(builders._read_metadata_version(metadata), gopythongo.version)
+        self.assertEqual(builders.test_gopythongo(self.folder)[0], self.folder)
+
+    def test_fallback(self) -> None:
+        # a different version in the metadata makes GoPythonGo run the probe, which fails with our fake python
+        self._write_metadata("0.0.1")
+        self.assertRaises(builders.NoMountableGoPythonGo, builders.test_gopythongo, self.folder)
+
+    def test_pex_manifest(self) -> None:
+        pexfile = os.path.join(self.folder, "gopythongo.pex")
+        with zipfile.ZipFile(pexfile, "w") as pex:
+            pex.writestr("PEX-INFO", json.dumps({"distributions": {
+                "configargparse-1.7-py3-none-any.whl": "x",
+                "gopythongo-%s-py3-none-any.whl" % gopythongo.version: "y",
+            }}))
+        self.assertEqual(builders._read_pex_version(pexfile), gopythongo.version)
+        self.assertIsNone(builders._read_pex_version(os.path.join(self.folder, "bin", "python")))
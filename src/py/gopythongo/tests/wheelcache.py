@@ -0,0 +1,56 @@
+# -* encoding: utf-8 *-
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import os
+import shutil
+import tempfile
+
+from unittest.case import TestCase
+
+from gopythongo.utils.wheelcache import WheelCache, parse_wheel_filename
+
+
+class WheelCacheTests(TestCase):
+    def setUp(self) -> None:
+        self.cache_root = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.cache_root)
+
+    def _add_wheel(self, cache: WheelCache, fn: str, size: int) -> None:
+        with open(os.path.join(cache.path, fn), "wb") as f:
+            f.write(b"x" * size)
+
+    def _open_cache(self, max_size: int) -> WheelCache:
+        cache = WheelCache(self.cache_root, max_size)
+        cache.environment_id = "env1"
+        cache.path = os.path.join(self.cache_root, "env1")
+        os.makedirs(cache.path, exist_ok=True)
+        return cache
+
+    def test_parse_wheel_filename(self) -> None:
+        self.assertEqual(parse_wheel_filename("lxml-5.2.1-cp311-cp311-manylinux_2_28_x86_64.whl"),
+                         ("lxml", "5.2.1", "cp311-cp311-manylinux_2_28_x86_64"))
+        self.assertEqual(parse_wheel_filename("/some/path/Django-4.2-1-py3-none-any.whl"),
+                         ("django", "4.2", "py3-none-any"))
+        self.assertIsNone(parse_wheel_filename("lxml-5.2.1.tar.gz"))
+
+    def test_hits_misses_and_eviction(self) -> None:
+        cache = self._open_cache(250)
+        self._add_wheel(cache, "old-1.0-py3-none-any.whl", 100)
+        self._add_wheel(cache, "lxml-5.2.1-cp311-cp311-linux_x86_64.whl", 100)
+        cache._load_index()
+        cache._index["env1/old-1.0-py3-none-any.whl"]["last_used"] = 0
+        cache._preexisting = set(cache._scan())
+
+        self._add_wheel(cache, "psycopg2-2.9.9-cp311-cp311-linux_x86_64.whl", 100)
+        cache.record_usage({"lxml": "5.2.1", "psycopg2": "2.9.9"})
+        self.assertListEqual(cache.hits, ["lxml-5.2.1-cp311-cp311-linux_x86_64.whl"])
+        self.assertListEqual(cache.misses, ["psycopg2-2.9.9-cp311-cp311-linux_x86_64.whl"])
+
+        self.assertListEqual(cache.evict(), ["env1/old-1.0-py3-none-any.whl"])
+        self.assertFalse(os.path.exists(os.path.join(cache.path, "old-1.0-py3-none-any.whl")))
+        self.assertTrue(os.path.exists(os.path.join(cache.path, "lxml-5.2.1-cp311-cp311-linux_x86_64.whl")))
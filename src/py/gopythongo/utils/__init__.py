@@ -5,6 +5,7 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 import collections
+import hashlib
 import shlex
 import subprocess
 from abc import ABCMeta, abstractmethod
@@ -129,8 +130,8 @@ def run_process(*args: str, allow_nonzero_exitcode: bool=False, raise_nonzero_ex
                                    (str(args), exitcode, output), exitcode=exitcode)
 
             if enable_debug_output:
-                print(highlight("******** Subprocess output follows ********"))
-                print(output)
+                # print the output with a single call, so the output of concurrent processes doesn't interleave
+                print("%s\n%s" % (highlight("******** Subprocess output follows ********"), output))
 
             return ProcessOutput(output.strip(), exitcode)
 
@@ -198,7 +199,21 @@ def umasked_makedirs(path: str, mode: int) -> None:
     os.makedirs(path, mode=get_umasked_mode(mode), exist_ok=True)
 
 
+def sha256_file(filename: str) -> str:
+    """
+    :return: the hex SHA256 digest of the contents of ``filename``
+    """
+    h = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
 class GoPythonGoEnableSuper(object):
+    # subclasses that use __slots__ must not get a __dict__ from here
+    __slots__ = ()
+
     def __init__(self, *args: Any, **kwargs: Any) -> None:
         pass
 
@@ -13,7 +13,7 @@ import tempfile
 from typing import Set, Any, Dict, List, Union, cast, Tuple, TextIO
 
 from gopythongo.packers import BasePacker, get_packers
-from gopythongo.utils import GoPythonGoEnableSuper, print_debug, highlight
+from gopythongo.utils import GoPythonGoEnableSuper, print_debug, highlight, ErrorMessage, sha256_file
 from gopythongo.versioners.parsers import VersionContainer
 
 
@@ -22,7 +22,10 @@ class PackerArtifact(GoPythonGoEnableSuper):
     Describes the results of a Packer.pack() call for other parts of the system that need to interact with it. For
     example: the aptly Store needs to store all the packages that the FPM Packer created.
 
-      * The contents of ``artifact_metadata`` are entirely up to the Packer.
+      * The contents of ``artifact_metadata`` are entirely up to the Packer. By convention Packers store the name of the
+        artifact in ``package_name``, its version in ``version`` (if it has one) and the hex SHA256 digest of the
+        artifact file in ``sha256``, which Stores use to skip storing artifacts that haven't changed. --matrix builds
+        add ``matrix_entry`` and ``store_target`` (see ``gopythongo.builders.tag_matrix_artifacts``).
       * ``created_by`` is a reference to the Packer instance, in case it offers an API for Stores and other parts of the
         system to call.
     """
@@ -61,6 +64,10 @@ class BuildContext(object):
         >>> from gopythongo.utils.buildcontext import the_context
         >>> the_context.mounts.add("path/to/my/stuff")  # makes your stuff available to your code during the build
     """
+    # the stages of the build in the order in which they run. A persisted state records the last completed stage, so
+    # a later run can resume the build from the next one.
+    stages = ["version", "build", "store"]  # type: List[str]
+
     def __init__(self) -> None:
         self.packer_artifacts = set()  # type: Set[PackerArtifact]
         self.read_version = None  # type: VersionContainer[Any]
@@ -74,14 +81,19 @@ class BuildContext(object):
         os.close(fd)
         self.mounts.add(self.tempmount)
 
-    def write(self, outf: TextIO) -> None:
-        json.dump({
+    def write(self, outf: TextIO, *, completed_stage: str=None) -> None:
+        state = {
             "read_version": self.read_version.todict(),
             "generated_versions": {key: value.todict() for key, value in self.generated_versions.items()},
-            "packer_artifacts": [value.todict() for value in self.packer_artifacts],
+            # sorted, so the order of the artifacts doesn't depend on the order in which the packers finished
+            "packer_artifacts": [value.todict() for value in sorted(self.packer_artifacts,
+                                                                    key=lambda a: a.artifact_filename)],
             "tempmount": self.tempmount,
             "state_file": self.state_file
-        }, outf)
+        }  # type: Dict[str, Any]
+        if completed_stage:
+            state["completed_stage"] = completed_stage
+        json.dump(state, outf)
 
     def parse_state(self, statestr: str) -> None:
         from gopythongo.versioners.parsers import VersionContainer
@@ -106,6 +118,50 @@ class BuildContext(object):
         print_debug("Reading state from %s in outer shell" % highlight(the_context.state_file))
         self.read(self.state_file)
 
+    def persist_state(self, filename: str, completed_stage: str) -> None:
+        """
+        Writes the state to ``filename``, which unlike ``state_file`` outlives this GoPythonGo run, so a later run can
+        use ``resume_state`` to continue the build after ``completed_stage``. The file is replaced atomically, so an
+        interrupted build never leaves a half-written state behind.
+        """
+        with open("%s.tmp" % filename, "wt", encoding="utf-8") as f:
+            self.write(f, completed_stage=completed_stage)
+        os.replace("%s.tmp" % filename, filename)
+        print_debug("Persisted state after stage %s to %s" % (highlight(completed_stage), highlight(filename)))
+
+    def resume_state(self, filename: str, stage: str) -> None:
+        """
+        Reads a state written by ``persist_state`` to resume the build at ``stage``. When resuming the ``store`` stage,
+        this also verifies that all recorded packer artifacts still exist and are unchanged. This run's ``tempmount``
+        and ``state_file`` are kept.
+        """
+        if not os.path.exists(filename):
+            raise ErrorMessage("Can't resume the build from stage %s, because there is no saved state in %s" %
+                               (highlight(stage), highlight(filename)))
+        with open(filename, "rt", encoding="utf-8") as f:
+            statestr = f.read()
+
+        completed_stage = json.loads(statestr).get("completed_stage", None)
+        if completed_stage not in self.stages or self.stages.index(completed_stage) < self.stages.index(stage) - 1:
+            raise ErrorMessage("The state in %s was saved after stage %s, so GoPythonGo can't resume the build from "
+                               "stage %s" % (highlight(filename), highlight(str(completed_stage)), highlight(stage)))
+
+        tempmount, state_file = self.tempmount, self.state_file
+        self.parse_state(statestr)
+        self.tempmount, self.state_file = tempmount, state_file
+
+        if stage != "store":
+            return
+
+        for artifact in self.packer_artifacts:
+            if not os.path.exists(artifact.artifact_filename):
+                raise ErrorMessage("Artifact %s recorded in %s is missing" %
+                                   (highlight(artifact.artifact_filename), highlight(filename)))
+            if "sha256" in artifact.artifact_metadata and \
+                    sha256_file(artifact.artifact_filename) != artifact.artifact_metadata["sha256"]:
+                raise ErrorMessage("The SHA256 digest of %s doesn't match the digest recorded by the Packer. The file "
+                                   "has been modified or is corrupt." % highlight(artifact.artifact_filename))
+
     def get_gopythongo_inner_commandline(self, *, cwd: str=None) -> List[str]:
         cmd = self.gopythongo_cmd + ["--inner"] + ['--read-state', self.state_file]
         cmd += ['--cwd', cwd if cwd else os.getcwd()]
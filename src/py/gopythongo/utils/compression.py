@@ -0,0 +1,202 @@
+# -* encoding: utf-8 *-
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Compression backends for tar archives. Each backend wraps a binary file object in a writable file object that
+compresses everything written to it. ``tarfile`` then writes an uncompressed tar stream into that wrapper (mode
+``w|``), so the codec, level and thread count are independent of ``tarfile``.
+"""
+
+import collections
+import gzip
+import lzma
+import struct
+import time
+import zlib
+
+from concurrent.futures import ThreadPoolExecutor, Future
+from io import RawIOBase
+from typing import Any, BinaryIO, Dict, Deque, cast
+
+from gopythongo.utils import GoPythonGoEnableSuper, ErrorMessage, highlight
+
+
+class CompressionBackend(GoPythonGoEnableSuper):
+    name = None  # type: str
+    extension = None  # type: str
+    default_level = None  # type: int
+    min_level = None  # type: int
+    max_level = None  # type: int
+    multithreaded = False  # type: bool
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+
+    def validate(self, level: int, threads: int) -> None:
+        """
+        Raises ``ErrorMessage`` if this backend can't be used with ``level`` and ``threads``.
+        """
+        if level is not None and not self.min_level <= level <= self.max_level:
+            raise ErrorMessage("Compression level %s is invalid for %s. Valid levels are %s to %s." %
+                               (highlight(str(level)), highlight(self.name), self.min_level, self.max_level))
+        if threads < 1:
+            raise ErrorMessage("The number of compression threads must be at least 1")
+
+    def open(self, fileobj: BinaryIO, level: int=None, threads: int=1, reproducible: bool=False) -> BinaryIO:
+        """
+        :param reproducible: if ``True``, the compressed output only depends on the input data and ``level``, not
+                             on the time or ``threads``
+        :return: a writable file object that compresses everything written to it into ``fileobj``. Closing it
+                 finishes the compressed stream, but does not close ``fileobj``.
+        """
+        raise NotImplementedError("Each subclass of CompressionBackend MUST implement open")
+
+
+class _ParallelGzipWriter(RawIOBase):
+    """
+    Block-parallel gzip compression, like pigz does it: the input is split into blocks which are compressed as raw
+    deflate streams on a thread pool (zlib releases the GIL while it compresses). Each block is primed with the last
+    32KB of the previous block as its dictionary, so the compression ratio stays close to single-threaded gzip, and
+    ends with a sync flush, so the blocks concatenate to one valid deflate stream.
+    """
+    block_size = 128 * 1024  # type: int
+
+    def __init__(self, fileobj: BinaryIO, level: int, threads: int, mtime: int=None) -> None:
+        super().__init__()
+        self.fileobj = fileobj
+        self.level = level
+        self.threads = threads
+        self._executor = ThreadPoolExecutor(max_workers=threads)
+        self._pending = collections.deque()  # type: Deque[Future]
+        self._buf = bytearray()
+        self._dict = b""
+        self._crc = 0
+        self._size = 0
+
+        xfl = b"\x02" if level == 9 else b"\x04" if level == 1 else b"\x00"
+        self.fileobj.write(b"\x1f\x8b\x08\x00" + struct.pack("<I", int(time.time() if mtime is None else mtime)) +
+                           xfl + b"\xff")
+
+    @staticmethod
+    def _compress_block(block: bytes, zdict: bytes, level: int, last: bool) -> bytes:
+        if zdict:
+            c = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, zlib.DEF_MEM_LEVEL, zlib.Z_DEFAULT_STRATEGY,
+                                 zdict)
+        else:
+            c = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        return c.compress(block) + c.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+    def _submit(self, block: bytes, last: bool) -> None:
+        self._crc = zlib.crc32(block, self._crc)
+        self._size += len(block)
+        self._pending.append(self._executor.submit(self._compress_block, block, self._dict, self.level, last))
+        self._dict = block[-32768:]
+        # keep a bounded number of blocks in flight and write finished blocks in order
+        while len(self._pending) > self.threads * 2:
+            self.fileobj.write(self._pending.popleft().result())
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b: Any) -> int:
+        self._buf.extend(b)
+        while len(self._buf) >= self.block_size:
+            self._submit(bytes(self._buf[:self.block_size]), False)
+            del self._buf[:self.block_size]
+        return len(b)
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        try:
+            self._submit(bytes(self._buf), True)
+            while self._pending:
+                self.fileobj.write(self._pending.popleft().result())
+            self.fileobj.write(struct.pack("<II", self._crc, self._size & 0xffffffff))
+        finally:
+            self._executor.shutdown()
+            super().close()
+
+
+class GzipBackend(CompressionBackend):
+    name = "gzip"
+    extension = "gz"
+    default_level = 9  # the same as tarfile's w|gz
+    min_level = 1
+    max_level = 9
+    multithreaded = True
+
+    def open(self, fileobj: BinaryIO, level: int=None, threads: int=1, reproducible: bool=False) -> BinaryIO:
+        if level is None:
+            level = self.default_level
+        if reproducible:
+            # the block-parallel output does not depend on the number of threads, but it differs from GzipFile's,
+            # so reproducible archives always use it and have a zero timestamp in the gzip header
+            return cast(BinaryIO, _ParallelGzipWriter(fileobj, level, threads, mtime=0))
+        if threads > 1:
+            return cast(BinaryIO, _ParallelGzipWriter(fileobj, level, threads))
+        # an empty filename keeps GzipFile from storing the name of fileobj in the gzip header
+        return cast(BinaryIO, gzip.GzipFile(filename="", mode="wb", fileobj=fileobj, compresslevel=level))
+
+
+class XzBackend(CompressionBackend):
+    name = "xz"
+    extension = "xz"
+    default_level = 6
+    min_level = 0
+    max_level = 9
+
+    def validate(self, level: int, threads: int) -> None:
+        super().validate(level, threads)
+        if threads > 1:
+            raise ErrorMessage("The %s compression backend does not support multiple threads, because Python's "
+                               "lzma module doesn't. Use %s or %s for multithreaded compression." %
+                               (highlight("xz"), highlight("zstd"), highlight("gzip")))
+
+    def open(self, fileobj: BinaryIO, level: int=None, threads: int=1, reproducible: bool=False) -> BinaryIO:
+        # xz headers contain no timestamps
+        return cast(BinaryIO, lzma.LZMAFile(fileobj, mode="wb", format=lzma.FORMAT_XZ,
+                                            preset=self.default_level if level is None else level))
+
+
+class ZstdBackend(CompressionBackend):
+    name = "zstd"
+    extension = "zst"
+    default_level = 3
+    min_level = 1
+    max_level = 22
+    multithreaded = True
+
+    def validate(self, level: int, threads: int) -> None:
+        super().validate(level, threads)
+        try:
+            import zstandard  # noqa: F401
+        except ImportError as e:
+            raise ErrorMessage("The %s compression backend requires the Python package %s. Please install it into "
+                               "GoPythonGo's environment (pip install zstandard)." %
+                               (highlight("zstd"), highlight("zstandard"))) from e
+
+    def open(self, fileobj: BinaryIO, level: int=None, threads: int=1, reproducible: bool=False) -> BinaryIO:
+        import zstandard
+        # zstd's multithreaded output does not depend on the number of worker threads, but it differs from its
+        # single-threaded output, so reproducible archives always use worker threads
+        compressor = zstandard.ZstdCompressor(level=self.default_level if level is None else level,
+                                              threads=threads if threads > 1 or reproducible else 0)
+        return cast(BinaryIO, compressor.stream_writer(fileobj, closefd=False))
+
+
+backends = {
+    u"gzip": GzipBackend(),
+    u"zstd": ZstdBackend(),
+    u"xz": XzBackend(),
+}  # type: Dict[str, CompressionBackend]
+
+
+def get_backend(name: str) -> CompressionBackend:
+    if name not in backends:
+        raise ErrorMessage("Unknown compression backend %s. Valid backends are: %s" %
+                           (highlight(name), ", ".join(sorted(backends.keys()))))
+    return backends[name]
@@ -0,0 +1,258 @@
+# -* encoding: utf-8 *-
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Writes Debian binary packages without external tools. A .deb is an ``ar`` archive containing the members
+``debian-binary``, ``control.tar.gz`` (the package metadata) and ``data.tar[.gz|.xz|.zst]`` (the installed files).
+"""
+
+import fnmatch
+import hashlib
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+
+from io import BytesIO
+from typing import Any, BinaryIO, Dict, List, Sequence, Tuple, Union, cast
+
+from gopythongo.utils import GoPythonGoEnableSuper, ErrorMessage, highlight
+from gopythongo.utils.compression import get_backend
+
+# the maintainer scripts dpkg knows about
+maintainer_scripts = ["preinst", "postinst", "prerm", "postrm", "config"]  # type: List[str]
+
+
+class _HashingReader(object):
+    """
+    Wraps a file object and calculates the MD5 digest of everything that is read from it, so files only have to be
+    read once to be both archived and listed in ``md5sums``.
+    """
+    def __init__(self, fileobj: BinaryIO) -> None:
+        self.fileobj = fileobj
+        self.md5 = hashlib.md5()
+
+    def read(self, size: int=-1) -> bytes:
+        data = self.fileobj.read(size)
+        self.md5.update(data)
+        return data
+
+
+def _ar_member_header(name: str, size: int, mtime: int) -> bytes:
+    return ("%-16s%-12d%-6d%-6d%-8s%-10d`\n" % (name, mtime, 0, 0, "100644", size)).encode("ascii")
+
+
+def _write_ar_member(out: BinaryIO, name: str, fileobj: BinaryIO, size: int, mtime: int) -> None:
+    out.write(_ar_member_header(name, size, mtime))
+    shutil.copyfileobj(fileobj, out, 1024 * 1024)
+    if size % 2:
+        out.write(b"\n")
+
+
+class DebArchive(GoPythonGoEnableSuper):
+    """
+    Collects the contents and metadata of a Debian binary package and writes it as a .deb file.
+
+        >>> deb = DebArchive([("Package", "myapp"), ("Version", "1.0-1"), ("Architecture", "amd64"),
+        ...                   ("Maintainer", "Me <me@example.com>"), ("Description", "My app")])
+        >>> deb.add_path("build/venv", "/opt/myapp")
+        >>> deb.write("myapp_1.0-1_amd64.deb")
+
+    The files are streamed from the file system into the compressed ``data.tar``, their MD5 digests for ``md5sums``
+    are calculated on the way.
+    """
+    def __init__(self, control: Sequence[Tuple[str, str]], *args: Any, compression: str="gzip", level: int=None,
+                 threads: int=1, source_date_epoch: int=None, owner: str="root", group: str="root",
+                 **kwargs: Any) -> None:
+        """
+        :param control: the fields of the control file in order. ``Installed-Size`` is added automatically.
+        :param compression: the name of the compression backend for ``data.tar`` or ``"none"``
+        :param source_date_epoch: if this is not ``None``, file mtimes are clamped to this value and it is used as the
+                                  timestamp for all generated files, so the package is reproducible
+        """
+        super().__init__(control, *args, **kwargs)
+        self.control = list(control)
+        self.compression = compression
+        self.level = level
+        self.threads = threads
+        self.source_date_epoch = source_date_epoch
+        self.owner = owner
+        self.group = group
+        self.paths = []  # type: List[Tuple[str, str]]
+        self.excludes = []  # type: List[str]
+        self.conffiles = []  # type: List[str]
+        self.scripts = {}  # type: Dict[str, str]
+
+    def add_path(self, source: str, dest: str) -> None:
+        """
+        Installs the file or the contents of the folder ``source`` at the absolute path ``dest``.
+        """
+        if not os.path.lexists(source):
+            raise ErrorMessage("Can't add %s to the package, because it doesn't exist" % highlight(source))
+        self.paths.append((source, "/" + dest.strip("/")))
+
+    def add_exclude(self, pattern: str) -> None:
+        """
+        Excludes files and folders whose name, path relative to the added source path or installed path (without the
+        leading '/') match the shell pattern ``pattern``.
+        """
+        self.excludes.append(pattern)
+
+    def add_conffile(self, path: str) -> None:
+        self.conffiles.append("/" + path.lstrip("/"))
+
+    def add_script(self, name: str, filename: str) -> None:
+        if name not in maintainer_scripts:
+            raise ErrorMessage("%s is not a maintainer script. Valid scripts are: %s" %
+                               (highlight(name), ", ".join(maintainer_scripts)))
+        self.scripts[name] = filename
+
+    @property
+    def data_member_name(self) -> str:
+        if self.compression == "none":
+            return "data.tar"
+        return "data.tar.%s" % get_backend(self.compression).extension
+
+    def _is_excluded(self, relpath: str, dest: str) -> bool:
+        installed = os.path.join(dest, relpath).lstrip("/")
+        for pattern in self.excludes:
+            if fnmatch.fnmatch(relpath, pattern) or fnmatch.fnmatch(installed, pattern) or \
+                    fnmatch.fnmatch(os.path.basename(relpath), pattern):
+                return True
+        return False
+
+    def _collect_entries(self) -> List[Tuple[str, Union[str, None]]]:
+        """
+        :return: a sorted list of ``(archive name, source path)`` for all entries of ``data.tar``. Parent folders of
+                 the destination paths have no source path.
+        """
+        entries = {"./": None}  # type: Dict[str, Union[str, None]]
+        for source, dest in self.paths:
+            parts = dest.strip("/").split("/")
+            for ix in range(1, len(parts)):
+                entries.setdefault("./%s/" % "/".join(parts[:ix]), None)
+
+            if os.path.isdir(source) and not os.path.islink(source):
+                entries["./%s/" % dest.strip("/")] = source if dest != "/" else None
+                for root, dirs, files in os.walk(source):
+                    rel = os.path.relpath(root, source)
+                    dirs[:] = [d for d in dirs if not self._is_excluded(os.path.normpath(os.path.join(rel, d)), dest)]
+                    for name in dirs + files:
+                        relpath = os.path.normpath(os.path.join(rel, name))
+                        if name in files and self._is_excluded(relpath, dest):
+                            continue
+                        arcname = "." + os.path.join(dest, relpath)
+                        if name in dirs and not os.path.islink(os.path.join(root, name)):
+                            arcname += "/"
+                        entries[arcname] = os.path.join(root, name)
+            else:
+                entries["." + dest] = source
+        return sorted(entries.items())
+
+    def _tarinfo(self, tf: tarfile.TarFile, arcname: str, source: Union[str, None]) -> tarfile.TarInfo:
+        if source is None:
+            ti = tarfile.TarInfo(arcname)
+            ti.type = tarfile.DIRTYPE
+            ti.mode = 0o755
+            ti.mtime = self.source_date_epoch if self.source_date_epoch is not None else int(time.time())
+        else:
+            ti = tf.gettarinfo(source, arcname)
+            if ti.isdir() and not ti.name.endswith("/"):
+                ti.name += "/"
+            if self.source_date_epoch is not None:
+                ti.mtime = min(int(ti.mtime), self.source_date_epoch)
+        ti.uid = ti.gid = 0
+        ti.uname = self.owner
+        ti.gname = self.group
+        return ti
+
+    def _write_data(self, out: BinaryIO) -> Tuple[List[Tuple[str, str]], int]:
+        """
+        Writes the compressed ``data.tar`` to ``out``.
+
+        :return: a tuple of the ``md5sums`` entries and the installed size in KiB
+        """
+        if self.compression == "none":
+            cf = out
+        else:
+            cf = get_backend(self.compression).open(out, level=self.level, threads=self.threads,
+                                                    reproducible=self.source_date_epoch is not None)
+        md5sums = []  # type: List[Tuple[str, str]]
+        digests = {}  # type: Dict[str, str]
+        installed_size = 0
+        with tarfile.open(fileobj=cf, mode="w|", format=tarfile.GNU_FORMAT) as tf:
+            for arcname, source in self._collect_entries():
+                ti = self._tarinfo(tf, arcname, source)
+                if ti.isreg():
+                    with open(cast(str, source), "rb") as f:
+                        reader = _HashingReader(cast(BinaryIO, f))
+                        tf.addfile(ti, cast(BinaryIO, reader))
+                    digests[ti.name] = reader.md5.hexdigest()
+                    md5sums.append((ti.name[2:], digests[ti.name]))
+                    installed_size += (ti.size + 1023) // 1024
+                else:
+                    if ti.islnk():
+                        # a hard link to a file that has already been archived
+                        md5sums.append((ti.name[2:], digests[ti.linkname]))
+                    tf.addfile(ti)
+                    installed_size += 1
+        if cf is not out:
+            cf.close()
+        return md5sums, installed_size
+
+    def _write_control(self, out: BinaryIO, md5sums: List[Tuple[str, str]], installed_size: int) -> None:
+        mtime = self.source_date_epoch if self.source_date_epoch is not None else int(time.time())
+        control = ""
+        for key, value in self.control:
+            if key == "Description":
+                # continuation lines are indented and empty lines are represented by a single '.'
+                lines = value.strip().split("\n")
+                value = "\n".join([lines[0]] + [" %s" % (l.rstrip() if l.strip() else ".") for l in lines[1:]])
+            control += "%s: %s\n" % (key, value)
+            if key == "Version":
+                control += "Installed-Size: %s\n" % installed_size
+
+        members = [
+            ("./control", control.encode("utf-8"), 0o644),
+            ("./md5sums", "".join("%s  %s\n" % (md5, name) for name, md5 in md5sums).encode("utf-8"), 0o644),
+        ]  # type: List[Tuple[str, bytes, int]]
+        if self.conffiles:
+            members.append(("./conffiles", "".join("%s\n" % cf for cf in self.conffiles).encode("utf-8"), 0o644))
+        for name in sorted(self.scripts.keys()):
+            with open(self.scripts[name], "rb") as f:
+                members.append(("./%s" % name, f.read(), 0o755))
+
+        cf = get_backend("gzip").open(out, reproducible=True)
+        with tarfile.open(fileobj=cf, mode="w|", format=tarfile.GNU_FORMAT) as tf:
+            ti = tarfile.TarInfo("./")
+            ti.type, ti.mode, ti.mtime, ti.uname, ti.gname = tarfile.DIRTYPE, 0o755, mtime, "root", "root"
+            tf.addfile(ti)
+            for name, data, mode in members:
+                ti = tarfile.TarInfo(name)
+                ti.size, ti.mode, ti.mtime, ti.uname, ti.gname = len(data), mode, mtime, "root", "root"
+                tf.addfile(ti, BytesIO(data))
+        cf.close()
+
+    def write(self, filename: str) -> None:
+        mtime = self.source_date_epoch if self.source_date_epoch is not None else int(time.time())
+        # ar needs the size of each member before its contents, so the compressed data.tar is written to a temporary
+        # file next to the package first
+        with tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(filename))) as data:
+            md5sums, installed_size = self._write_data(cast(BinaryIO, data))
+            data_size = data.tell()
+            data.seek(0)
+
+            control = BytesIO()
+            self._write_control(cast(BinaryIO, control), md5sums, installed_size)
+            control_size = control.tell()
+            control.seek(0)
+
+            with open(filename, "wb") as out:
+                out.write(b"!<arch>\n")
+                _write_ar_member(out, "debian-binary", cast(BinaryIO, BytesIO(b"2.0\n")), 4, mtime)
+                _write_ar_member(out, "control.tar.gz", cast(BinaryIO, control), control_size, mtime)
+                _write_ar_member(out, self.data_member_name, cast(BinaryIO, data), data_size, mtime)
@@ -10,9 +10,11 @@ tools to parse and compare Debian version strings as per
 https://www.debian.org/doc/debian-policy/ch-controlfields.html. Partially based on
 https://github.com/chaos/apt/blob/master/apt/apt-pkg/deb/debversion.cc (see debVersioningSystem::DoCmpVersion)
 """
+import functools
 import re
+import sys
 
-from typing import List, Tuple, Union, Any, Type, Callable
+from typing import Any, Dict, List, Pattern, Tuple, Type, Union
 
 
 class InvalidDebianVersionString(Exception):
@@ -21,6 +23,65 @@ class InvalidDebianVersionString(Exception):
         self.passed_args = ([message] + list(args)) if msg else list(args)  # type: List[Any]
 
 
+# '^' is our special character representing an "empty part" as '^' is not allowed in Debian version strings
+_sortorder = "~^ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz+-.:"
+_char_order = {c: ix for ix, c in enumerate(_sortorder)}  # type: Dict[str, int]
+
+# Version parts (see split_version_parts) sort by class first. '~' sorts before everything, even before the end of
+# the version string, which sorts before numbers, which sort before all other characters.
+_TILDE, _EMPTY, _NUMERIC, _CHARS = range(4)
+
+_version_part_re = re.compile("[0-9]+|[^0-9]+")
+_epoch_re = re.compile("[0-9]+")
+_revision_re = re.compile(r"[A-Za-z0-9\+\.~]+")
+_split_res = {}  # type: Dict[str, Pattern[str]]
+
+# (has epoch, has revision) -> (validation regex, split regex, error details)
+_validation_rules = {
+    (True, True): (r"^[A-Za-z0-9\+\.~\:\-]+$", r"[A-Za-z\+\.~\:\-]+", ""),
+    (True, False): (r"^[A-Za-z0-9\+\.~\:]+$", r"[A-Za-z\+\.~\:]+",
+                    "Version string has no Revision and may not contain hyphens (-)."),
+    (False, True): (r"^[A-Za-z0-9\+\.~\-]+$", r"[A-Za-z\+\.~\-]+",
+                    "Version string has no Epoch and may not contain colons (:)."),
+    (False, False): (r"^[A-Za-z0-9\+\.~]+$", r"[A-Za-z\+\.~]+",
+                     "Version string has neither Epoch nor Revision and may not contain colons (:) or hyphens (-)."),
+}  # type: Dict[Tuple[bool, bool], Tuple[str, str, str]]
+_validation_res = {rule[0]: re.compile(rule[0]) for rule in _validation_rules.values()}  # type: Dict[str, Pattern[str]]
+
+SortKey = Tuple[int, ...]
+
+
+@functools.lru_cache(maxsize=4096)
+def _part_key(part: str) -> Tuple[int, ...]:
+    """
+    :return: a tuple of ints that sorts like the version part ``part`` according to ``debian_substr_compare``. Parts
+             are made up of the same few strings most of the time, so their keys are cached.
+    """
+    if not part:
+        return _EMPTY,
+    if "0" <= part[0] <= "9":
+        return _NUMERIC, int(part)
+    try:
+        # the trailing "empty part" makes "~~" sort before "~" and "a" before "ab"
+        return (_TILDE if part[0] == "~" else _CHARS,) + tuple([_char_order[c] for c in part]) + (_char_order["^"],)
+    except KeyError as e:
+        raise InvalidDebianVersionString("Cannot compare %s because '%s' is not sortable" % (part, e.args[0]))
+
+
+def _parts_key(version_str: Union[str, None]) -> List[int]:
+    """
+    :return: the concatenated keys of all parts of ``version_str``. Comparing two of these lists gives the same
+             result as comparing the parts one by one, because the lists only differ within the first part that
+             differs and that part decides the comparison. Missing parts are compared as empty parts, the final
+             empty part takes care of that.
+    """
+    key = []  # type: List[int]
+    for part in _version_part_re.findall(version_str or ""):
+        key.extend(_part_key(part))
+    key.append(_EMPTY)
+    return key
+
+
 def debian_substr_compare(a: str, b: str) -> int:
     """
     Compares two strings using Debian Policy Manual rules. This is complicated because standard Python str comparison
@@ -42,58 +103,15 @@ def debian_substr_compare(a: str, b: str) -> int:
     :type b: str
     :return: negative int if a<b; 0 if a==b; positive int if a>b
     """
-    # '^' is our special character representing an "empty part" as '^' is not allowed in Debian version strings
-    sortorder = "~^ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz+-.:"
-
-    def order(c: str) -> int:
-        if c in sortorder:
-            return sortorder.index(c)
-        else:
-            raise InvalidDebianVersionString("Cannot compare (%s, %s) because '%s' is not sortable" % (
-                a, b, c
-            ))
-
-    def select_char(version_str: str, ix: int) -> str:
-        if ix >= len(version_str):
-            return '^'
-        else:
-            return version_str[ix]
-
-    # numeric groups are handled separately from character groups
-    a_is_numeric = re.match("[0-9]+", a)
-    b_is_numeric = re.match("[0-9]+", b)
-    if a_is_numeric and b_is_numeric:
+    a_key = _part_key(a)
+    b_key = _part_key(b)
+    if a_key[0] == _NUMERIC and b_key[0] == _NUMERIC:
         # DPM specifies to compare the numeric values for number groups
-        a_int = int(a)
-        b_int = int(b)
-        return a_int - b_int
-    elif a_is_numeric and not b_is_numeric:
-        # ~ always sorts first, even before numbers, also shorter strings before longer strings (unless ~)
-        if b.startswith("~") or b == "":
-            return +1
-        else:
-            return -1
-    elif not a_is_numeric and b_is_numeric:
-        # ~ always sorts first, even before numbers, also shorter strings before longer strings (unless ~)
-        if a.startswith("~") or a == "":
-            return -1
-        else:
-            return +1
-    else:
-        maxlen = len(a) if len(a) > len(b) else len(b)
-        for c_ix in range(0, maxlen):
-            if order(select_char(a, c_ix)) < order(select_char(b, c_ix)):
-                return -1
-            if order(select_char(a, c_ix)) == order(select_char(b, c_ix)):
-                continue
-            if order(select_char(a, c_ix)) > order(select_char(b, c_ix)):
-                return +1
-
-    # the strings are equal
-    return 0
+        return a_key[1] - b_key[1]
+    return (a_key > b_key) - (a_key < b_key)
 
 
-def split_version_parts(version_str: str, version_char_re: str="[A-Za-z\+\.~]+") -> List[str]:
+def split_version_parts(version_str: str, version_char_re: str=r"[A-Za-z\+\.~]+") -> List[str]:
     """
     Splits ``version_str`` into groups of digits and characters to perform Debian-style version comparison.
     For example: "a67bhgs89" has 4 groups -> ["a", "67", "bhgs", "89"]
@@ -104,9 +122,11 @@ def split_version_parts(version_str: str, version_char_re: str="[A-Za-z\+\.~]+")
     :return: a list of str
     :rtype: list
     """
+    if version_char_re not in _split_res:
+        _split_res[version_char_re] = re.compile("(%s)" % version_char_re)
     # re.split might return an empty string as the first element if version_str starts with a character
     if version_str:
-        return [x for x in re.split("(%s)" % version_char_re, version_str) if x != ""]
+        return [x for x in _split_res[version_char_re].split(version_str) if x != ""]
     else:
         return [""]
 
@@ -128,57 +148,74 @@ def debian_versionpart_compare(mine: List[str], theirs: List[str]) -> int:
 
 
 class DebianVersion(object):
-    def __init__(self, epoch: Union[str, None], version: str, revision: Union[str, None]) -> None:
-        self.epoch = epoch  # type: str
-        self.version = version  # type: str
-        self.revision = revision  # type: str
-        self.version_re = None  # type: str
-        self.version_char_re = None  # type: str
-
-        if self.epoch is not None:
+    """
+    An immutable Debian version. Repository scans create tens of thousands of these, so instances have no
+    ``__dict__`` and the epoch, version and revision strings are interned, i.e. the revision "1" of all versions
+    is the same object. Two instances are equal if they have the same epoch, version and revision.
+    """
+    __slots__ = ("epoch", "version", "revision", "_sort_key", "_hash")
+
+    def __init__(self, epoch: Union[str, int, None], version: str, revision: Union[str, None]) -> None:
+        if epoch is not None:
             try:
-                if int(self.epoch) == 0:
+                if int(epoch) == 0:
                     # special case: zero Epoch is no Epoch
-                    self.epoch = None
+                    epoch = None
             except ValueError:
                 raise InvalidDebianVersionString("Epoch must be an integer")
 
+        # instances are immutable, so attributes can only be set through object.__setattr__
+        object.__setattr__(self, "epoch", sys.intern(str(epoch)) if epoch is not None else None)
+        object.__setattr__(self, "version", sys.intern(version) if version else version)
+        object.__setattr__(self, "revision", sys.intern(revision) if revision else revision)
+        object.__setattr__(self, "_sort_key", None)
+        object.__setattr__(self, "_hash", None)
         self.validate()
 
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError("DebianVersion objects are immutable. Create a new DebianVersion instead of changing %s."
+                             % name)
+
+    def __reduce__(self) -> Tuple[Type['DebianVersion'], Tuple[str, str, str]]:
+        # copy and pickle can't restore the state of immutable objects by setting attributes
+        return self.__class__, self.as_tuple()
+
+    @property
+    def version_re(self) -> str:
+        return _validation_rules[(bool(self.epoch), bool(self.revision))][0]
+
+    @property
+    def version_char_re(self) -> str:
+        return _validation_rules[(bool(self.epoch), bool(self.revision))][1]
+
     def validate(self) -> None:
         """
         :raises InvalidDebianVersionString: if this DebianVersion object represents an invalid version
         """
-        details = ""
-        if self.epoch:
-            if self.revision:
-                self.version_re = "^[A-Za-z0-9\+\.~\:\-]+$"
-                self.version_char_re = "[A-Za-z\+\.~\:\-]+"
-            else:
-                self.version_re = "^[A-Za-z0-9\+\.~\:]+$"
-                self.version_char_re = "[A-Za-z\+\.~\:]+"
-                details = "Version string has no Revision and may not contain hyphens (-)."
-        else:
-            if self.revision:
-                self.version_re = "^[A-Za-z0-9\+\.~\-]+$"
-                self.version_char_re = "[A-Za-z\+\.~\-]+"
-                details = "Version string has no Epoch and may not contain colons (:)."
-            else:
-                self.version_re = "^[A-Za-z0-9\+\.~]+$"
-                self.version_char_re = "[A-Za-z\+\.~]+"
-                details = "Version string has neither Epoch nor Revision and may not contain colons (:) or hyphens (-)."
+        version_re, version_char_re, details = _validation_rules[(bool(self.epoch), bool(self.revision))]
 
         if self.epoch:
-            if not re.match("[0-9]+", self.epoch):
+            if not _epoch_re.match(self.epoch):
                 raise InvalidDebianVersionString("Epoch error: %s does not match %s. %s" %
-                                                 (self.epoch, "[0-9]+", details))
+                                                 (self.epoch, _epoch_re.pattern, details))
         if self.revision:
-            if not re.match("[A-Za-z0-9\+\.~]+", self.revision):
+            if not _revision_re.match(self.revision):
                 raise InvalidDebianVersionString("Revision error: %s does not match %s. %s" %
-                                                 (self.revision, "[A-Za-z0-9\+\.~]+", details))
-        if not re.match(self.version_re, self.version):
+                                                 (self.revision, _revision_re.pattern, details))
+        if not _validation_res[version_re].match(self.version):
             raise InvalidDebianVersionString("Version error: %s does not match %s. %s" %
-                                             (self.version, self.version_re, details))
+                                             (self.version, version_re, details))
+
+    def sort_key(self) -> SortKey:
+        """
+        :return: a tuple that sorts like this version, so lists of versions can be sorted efficiently using
+                 ``versions.sort(key=DebianVersion.sort_key)``. It's calculated on first use. A missing epoch sorts
+                 like the epoch 0.
+        """
+        if self._sort_key is None:
+            object.__setattr__(self, "_sort_key", tuple([int(self.epoch) if self.epoch else 0] +
+                                                        _parts_key(self.version) + _parts_key(self.revision)))
+        return self._sort_key
 
     @classmethod
     def fromstring(cls: Type['DebianVersion'], version_str: str) -> 'DebianVersion':
@@ -208,43 +245,39 @@ class DebianVersion(object):
         return str(self)
 
     def __lt__(self, other: 'DebianVersion') -> bool:
-        return self._compare(other, lambda x: x < 0)
+        if not isinstance(other, DebianVersion):
+            return NotImplemented
+        return self.sort_key() < other.sort_key()
 
     def __le__(self, other: 'DebianVersion') -> bool:
-        return self._compare(other, lambda x: x <= 0)
+        if not isinstance(other, DebianVersion):
+            return NotImplemented
+        return self.sort_key() <= other.sort_key()
 
     def __gt__(self, other: 'DebianVersion') -> bool:
-        return self._compare(other, lambda x: x > 0)
+        if not isinstance(other, DebianVersion):
+            return NotImplemented
+        return self.sort_key() > other.sort_key()
 
     def __ge__(self, other: 'DebianVersion') -> bool:
-        return self._compare(other, lambda x: x >= 0)
-
-    def _compare(self, other: 'DebianVersion', method: Callable[[int], bool]) -> bool:
         if not isinstance(other, DebianVersion):
             return NotImplemented
-
-        # special case: zero Epoch is the same as no Epoch
-        if self.epoch is not None and other.epoch is not None and \
-           int(self.epoch) != int(other.epoch) and int(self.epoch) != 0 and int(other.epoch) != 0:
-            return method(int(self.epoch) - int(other.epoch))
-
-        res = debian_versionpart_compare(split_version_parts(self.version, self.version_char_re),
-                                         split_version_parts(other.version, self.version_char_re))
-        if res == 0:
-            return method(debian_versionpart_compare(split_version_parts(self.revision),
-                                                     split_version_parts(other.revision)))
-        else:
-            return method(res)
+        return self.sort_key() >= other.sort_key()
 
     def __eq__(self, other: Union['DebianVersion', Any, None]) -> bool:
         if not isinstance(other, DebianVersion):
             return NotImplemented
-        return repr(self) == repr(other)
+        return self.as_tuple() == other.as_tuple()
 
     def __ne__(self, other: Union['DebianVersion', Any, None]) -> bool:
         if not isinstance(other, DebianVersion):
             return NotImplemented
-        return repr(self) != repr(other)
+        return self.as_tuple() != other.as_tuple()
+
+    def __hash__(self) -> int:
+        if self._hash is None:
+            object.__setattr__(self, "_hash", hash(self.as_tuple()))
+        return self._hash
 
     def as_tuple(self) -> Tuple[str, str, str]:
         return self.epoch, self.version, self.revision
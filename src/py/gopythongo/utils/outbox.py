@@ -0,0 +1,100 @@
+# -* encoding: utf-8 *-
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+The outbox is a local folder that keeps the packed artifacts of a build together with the build state until a Store
+has published them. If storing fails (e.g. because the aptly server is unreachable), running GoPythonGo again with
+``--store-only`` publishes the artifacts from the outbox without rebuilding them.
+"""
+
+import json
+import os
+import shutil
+
+from typing import List
+
+from gopythongo.utils import print_info, print_debug, highlight, ErrorMessage
+from gopythongo.utils.buildcontext import the_context
+
+STATE_FILENAME = "state.json"  # type: str
+FILES_FILENAME = "files.json"  # type: str
+
+
+def _read_outbox_files(outbox: str) -> List[str]:
+    filesfile = os.path.join(outbox, FILES_FILENAME)
+    if not os.path.exists(filesfile):
+        return []
+    with open(filesfile, "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _is_any(fn: str, others: List[str]) -> bool:
+    return any(os.path.exists(other) and os.path.samefile(fn, other) for other in others)
+
+
+def clear_outbox(outbox: str) -> None:
+    """
+    Removes the artifacts and the state of a previous build from ``outbox``. Only the files that ``fill_outbox`` linked
+    or copied into ``outbox`` are removed. Artifacts that the packers wrote to ``outbox`` directly and other files in
+    ``outbox`` are left alone.
+    """
+    for fn in _read_outbox_files(outbox):
+        if os.path.exists(fn):
+            os.unlink(fn)
+    for fn in [FILES_FILENAME, STATE_FILENAME]:
+        if os.path.exists(os.path.join(outbox, fn)):
+            os.unlink(os.path.join(outbox, fn))
+
+
+def fill_outbox(outbox: str) -> None:
+    """
+    Hard links or copies all packer artifacts in ``the_context`` into ``outbox`` and writes the build state next to
+    them. The packer artifacts in ``the_context`` are updated to point to the copies. Artifacts of a previous build
+    that are not part of this build are removed from ``outbox``.
+    """
+    os.makedirs(outbox, exist_ok=True)
+    previous = _read_outbox_files(outbox)
+    dests = []  # type: List[str]
+    owned = []  # type: List[str]
+
+    for artifact in the_context.packer_artifacts:
+        dest = os.path.join(os.path.abspath(outbox), os.path.basename(artifact.artifact_filename))
+        if os.path.abspath(artifact.artifact_filename) != dest:
+            # the packer didn't write the artifact to the outbox (e.g. --outbox . with a packer writing to .)
+            if os.path.exists(dest) and not os.path.samefile(artifact.artifact_filename, dest):
+                os.unlink(dest)
+            if not os.path.exists(dest):
+                try:
+                    os.link(artifact.artifact_filename, dest)
+                except OSError:
+                    # the outbox is on a different file system
+                    shutil.copy2(artifact.artifact_filename, dest)
+            owned.append(dest)
+        print_debug("Added %s to outbox %s" % (highlight(artifact.artifact_filename), highlight(outbox)))
+        artifact.artifact_filename = dest
+        dests.append(dest)
+
+    for fn in previous:
+        if fn not in dests and os.path.exists(fn) and not _is_any(fn, dests):
+            os.unlink(fn)
+
+    with open(os.path.join(outbox, FILES_FILENAME), "wt", encoding="utf-8") as f:
+        json.dump(owned, f)
+    the_context.persist_state(os.path.join(outbox, STATE_FILENAME), "build")
+    print_info("Stored %s artifact(s) in outbox %s" % (len(the_context.packer_artifacts), highlight(outbox)))
+
+
+def load_outbox(outbox: str) -> None:
+    """
+    Reads the build state from ``outbox`` into ``the_context`` and verifies that all artifacts in the outbox are
+    intact.
+    """
+    statefile = os.path.join(outbox, STATE_FILENAME)
+    if not os.path.exists(statefile):
+        raise ErrorMessage("The outbox %s contains no build. Run a full build first." % highlight(outbox))
+
+    the_context.resume_state(statefile, "store")
+    print_info("Loaded %s artifact(s) from outbox %s" % (len(the_context.packer_artifacts), highlight(outbox)))
@@ -4,23 +4,107 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
-from importlib.metadata import entry_points
-from typing import Dict, Union, Iterable, Any, Type, TypeVar
+import importlib
+
+from importlib.metadata import entry_points, EntryPoints
+from typing import Dict, Union, Iterable, Any, Type, TypeVar, cast
+
+from gopythongo import startupprofile
 
 
 T = TypeVar("T")
 
+_entry_points = None  # type: EntryPoints
+
+
+def _get_entry_points(group: str) -> EntryPoints:
+    # scanning the installed distributions for entry points is expensive, so it's only done once for all plugin types
+    global _entry_points
+    if _entry_points is None:
+        _entry_points = entry_points()
+    return _entry_points.select(group=group)
+
+
+class LazyPlugin(object):
+    """
+    Stands in for a plugin instance in a plugin registry. The plugin module is only imported and the plugin class is
+    only instantiated when an attribute of the plugin is accessed for the first time, e.g. because the plugin was
+    selected on the command-line or its command-line arguments are added to the parser. All attribute access is
+    then forwarded to the plugin instance.
+    """
+    def __init__(self, name: str, module_name: str, plugin_class_attribute: str, plugin_baseclass: Type[Any],
+                 plugin_name_property: str, initargs: Union[Iterable[Any], None]=None) -> None:
+        self._name = name
+        self._module_name = module_name
+        self._plugin_class_attribute = plugin_class_attribute
+        self._plugin_baseclass = plugin_baseclass
+        self._plugin_name_property = plugin_name_property
+        self._initargs = list(initargs) if initargs else []
+        self._plugin = None  # type: Any
+
+    def load(self) -> Any:
+        if self._plugin is None:
+            with startupprofile.measure("load plugin", "%s (%s)" % (self._name, self._module_name)):
+                self._plugin = self._load()
+        return self._plugin
+
+    def _load(self) -> Any:
+        module = importlib.import_module(self._module_name)
+        if not hasattr(module, self._plugin_class_attribute):
+            raise ImportError("Plugin modules for %s must all have an attribute called %s, but %s has none." %
+                              (self._plugin_baseclass.__name__, self._plugin_class_attribute, self._module_name))
+
+        if not issubclass(getattr(module, self._plugin_class_attribute), self._plugin_baseclass):
+            raise ImportError("The plugin class for module %s does not inherit from %s." %
+                              (self._module_name, self._plugin_baseclass.__name__))
+
+        plugin_instance = getattr(module, self._plugin_class_attribute)(*self._initargs)
+
+        if not isinstance(getattr(plugin_instance, self._plugin_name_property), str):
+            raise ImportError("Plugin class in %s has an attribute %s, but it does not return unicode string." %
+                              (self._module_name, self._plugin_name_property))
+        if getattr(plugin_instance, self._plugin_name_property) != self._name:
+            raise ImportError("Plugin class in %s is registered as %s, but its attribute %s is %s." %
+                              (self._module_name, self._name, self._plugin_name_property,
+                               getattr(plugin_instance, self._plugin_name_property)))
+        return plugin_instance
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._plugin is not None
+
+    def __getattr__(self, name: str) -> Any:
+        # don't import the plugin for protocol lookups like copy or pickle do them
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+
+    def __repr__(self) -> str:
+        return "<LazyPlugin %s (%s)%s>" % (self._name, self._module_name, "" if self.is_loaded else " not loaded")
+
+
+def register_builtins(registry: Dict[str, T], modules: Dict[str, str], plugin_class_attribute: str,
+                      plugin_baseclass: Type[T], plugin_name_property: str,
+                      initargs: Union[Iterable[Any], None]=None) -> None:
+    """
+    Registers GoPythonGo's builtin plugins in ``registry`` without importing them. ``modules`` maps each plugin id
+    to the module containing the plugin. See ``load_plugins`` for the other parameters.
+    """
+    for name, module_name in modules.items():
+        registry[name] = cast(T, LazyPlugin(name, module_name, plugin_class_attribute, plugin_baseclass,
+                                            plugin_name_property, initargs))
+
 
 def load_plugins(entrypoint: str, registry: Dict[str, T], plugin_class_attribute: str,
                  plugin_baseclass: Type[T], plugin_name_property: str,
                  initargs: Union[Iterable[Any], None]=None) -> None:
     """
-    Loads ``entrypoint`` via ``importlib.metadata.entry_points`` and imports all modules attached to it. It then
-    looks at the attribute ``plugin_class_attribute`` of the module, which is set to the plugin class. It instantiates
-    an instance of the plugin class by calling it's constructor, passing the optional ``initargs``. It then reads the
-    ``plugin_name_property`` of the instance which is a string that contains the plugin id, i.e. the "registration
-    name" of that module.``registry`` is a ``dict``-like in which a reference to each module will be saved
-    using the value of the attribute named by ``plugin_name_property`` as the key.
+    Finds all modules attached to ``entrypoint`` via ``importlib.metadata.entry_points`` and registers them in
+    ``registry`` under the name of their entry point. The modules are not imported until the plugin is used (see
+    ``LazyPlugin``). When that happens GoPythonGo looks at the attribute ``plugin_class_attribute`` of the module, which
+    is set to the plugin class. It instantiates an instance of the plugin class by calling it's constructor, passing
+    the optional ``initargs``. It then verifies that the ``plugin_name_property`` of the instance, which is a string
+    that contains the plugin id, i.e. the "registration name" of that module, matches the name of the entry point.
 
     :param entrypoint: the name of the setuptools plugin entry point
     :param registry: a dict-like that serves as a registry for the plugins. Each plug-in class is set using
@@ -29,29 +113,8 @@ def load_plugins(entrypoint: str, registry: Dict[str, T], plugin_class_attribute
     :param plugin_baseclass: the class that the plugins are supposed to inherit from
     :param plugin_name_property: the property on an instance of ``plugin_class_atrribute`` that will yield the plugin id
     :param initargs: parameters that will be passed to the constructor of ``plugin_class_attribute`` when
-                     ``load_plugins`` instantiates it
+                     the plugin is loaded
     """
-
-    if initargs is None:
-        initargs = []
-
-    # load external modules
-    for ep in entry_points(group=entrypoint):  # type: ignore
-        module = ep.load()
-        if not hasattr(module, plugin_class_attribute):
-            raise ImportError("Plugin modules for entry point %s must all have an attribute called %s, but %s has "
-                              "none." % (entrypoint, plugin_class_attribute, ep.module_name))
-
-        if not issubclass(plugin_baseclass, getattr(module, plugin_class_attribute)):
-            raise ImportError("The plugin class for module %s in plugin entry point %s does not inherit from %s." %
-                              (ep.module_name, entrypoint, plugin_baseclass.__name__))
-
-        plugin_instance = getattr(module, plugin_class_attribute)(*initargs)
-
-        if isinstance(getattr(plugin_instance, plugin_name_property), str):
-            module_id = getattr(plugin_instance, plugin_name_property)
-        else:
-            raise ImportError("Plugin class in %s has an attribute %s, but it does not return unicode string." %
-                              (ep.module_name, plugin_name_property))
-
-        registry[module_id] = module
+    for ep in _get_entry_points(entrypoint):
+        registry[ep.name] = cast(T, LazyPlugin(ep.name, ep.module, plugin_class_attribute, plugin_baseclass,
+                                               plugin_name_property, initargs))
@@ -5,14 +5,20 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 import os
+import queue
 import tarfile
+import threading
 
-from io import BytesIO
-from typing import Sequence, Union, cast, Tuple
+from io import BytesIO, RawIOBase
+from typing import Sequence, Union, cast, Tuple, Iterator, Any, BinaryIO, List
+
+from gopythongo.utils import GoPythonGoEnableSuper, ErrorMessage, highlight
+from gopythongo.utils.compression import get_backend
 
 
 def create_targzip(*, filename: str=None, paths: Sequence[Tuple[str, str]], verbose: bool=False,
-                   make_paths_relative: bool=False) -> Union[BytesIO, None]:
+                   make_paths_relative: bool=False, compression: str="gzip", level: int=None,
+                   threads: int=1, source_date_epoch: int=None) -> Union[BytesIO, None]:
     """
     Creates a .tar.gz of everything below paths, making sure all
     stored paths are relative if make_paths_relative is `True`.
@@ -26,6 +32,13 @@ def create_targzip(*, filename: str=None, paths: Sequence[Tuple[str, str]], verb
     :param verbose: output each filename in paths as it is being processed
     :param make_paths_relative: ensure that the .tar.gz keeps all files relative to the path in paths. This is only
                                 mildly useful if you pack up multiple paths
+    :param compression: the name of the compression backend from ``gopythongo.utils.compression.backends`` to use.
+                        Despite this function's name this can also create .tar.zst or .tar.xz archives.
+    :param level: the compression level or ``None`` for the backend's default
+    :param threads: the number of threads to compress with, if the backend supports it
+    :param source_date_epoch: if this is not ``None``, create a reproducible archive: entries are sorted, mtimes are
+                              clamped to this value, ownership and permissions are normalized and the compressed
+                              stream contains no timestamps (see ``normalize_tarinfo``)
     """
     if filename:
         if os.path.exists(filename):
@@ -36,36 +49,204 @@ def create_targzip(*, filename: str=None, paths: Sequence[Tuple[str, str]], verb
 
     # we're using stream mode here as otherwise tarfile seems
     # to add spurious information about f's path to the gzip
-    # wrapper... this can be seen inside 7-zip :(
-    tf = tarfile.open(fileobj=f, mode='w|gz')
+    # wrapper... this can be seen inside 7-zip :( The compression
+    # backend does the compressing, so tarfile writes a plain tar.
+    cf = get_backend(compression).open(f, level=level, threads=threads,
+                                       reproducible=source_date_epoch is not None)
+    tf = tarfile.open(fileobj=cf, mode='w|')
+    _add_paths(tf, paths, verbose=verbose, make_paths_relative=make_paths_relative,
+               source_date_epoch=source_date_epoch)
+    tf.close()
+    cf.close()
+
+    if filename:
+        f.close()
+    else:
+        return cast(BytesIO, f)
+
+    return None
+
+
+def get_source_date_epoch(value: Union[str, int, None]=None) -> int:
+    """
+    :return: ``value`` or the value of the ``SOURCE_DATE_EPOCH`` environment variable (see
+             https://reproducible-builds.org/specs/source-date-epoch/) or ``0`` if neither is set
+    """
+    if value is None or value == "":
+        value = os.environ.get("SOURCE_DATE_EPOCH", "0")
+    try:
+        return int(value)
+    except ValueError as e:
+        raise ErrorMessage("SOURCE_DATE_EPOCH must be a UNIX timestamp, not %s" % highlight(str(value))) from e
+
+
+def normalize_tarinfo(tarinfo: tarfile.TarInfo, source_date_epoch: int) -> tarfile.TarInfo:
+    """
+    Removes everything from ``tarinfo`` that depends on the machine or the time of the build instead of the file's
+    contents: mtimes newer than ``source_date_epoch`` are clamped to it, files are owned by root and permissions are
+    either 0755 or 0644 depending on whether the file is executable.
+    """
+    tarinfo.mtime = min(int(tarinfo.mtime), source_date_epoch)
+    tarinfo.uid = tarinfo.gid = 0
+    tarinfo.uname = tarinfo.gname = "root"
+    if tarinfo.isdir() or tarinfo.mode & 0o111:
+        tarinfo.mode = 0o755
+    else:
+        tarinfo.mode = 0o644
+    return tarinfo
+
+
+def list_paths(paths: Sequence[Tuple[str, str]], *, make_paths_relative: bool=False,
+               include_dirs: bool=False) -> List[Tuple[str, str]]:
+    """
+    :return: a list of ``(path, arcname)`` of everything that is added to an archive of ``paths`` (see
+             ``create_targzip``). Symlinks are listed, but not followed. Folders below ``paths`` are only listed if
+             ``include_dirs`` is ``True``, which keeps empty folders and symlinks to folders in the archive.
+    """
+    entries = []  # type: List[Tuple[str, str]]
     for pspec in paths:
         path = pspec[0]
         altpath = pspec[1] if pspec[1] else None
 
         if os.path.exists(path) and os.path.isdir(path):
-            for root, dir, files in os.walk(path):
-                for fn in files:
-                    filepath = os.path.join(root, fn)
-                    arcpath = root
-                    if altpath:
-                        arcpath = altpath
-                    elif make_paths_relative:
-                        arcpath = root[len(path):]
-                    arcname = os.path.join(arcpath, fn)
-                    if verbose:
-                        print('adding %s as %s' % (filepath, arcname,))
-                    tf.add(filepath, arcname, recursive=False)
+            for root, dirs, files in os.walk(path):
+                arcpath = root
+                if altpath:
+                    arcpath = os.path.normpath(os.path.join(altpath, os.path.relpath(root, path)))
+                elif make_paths_relative:
+                    arcpath = root[len(path):]
+                for fn in (dirs if include_dirs else []) + files:
+                    entries.append((os.path.join(root, fn), os.path.join(arcpath, fn)))
 
         elif os.path.exists(path) and os.path.isfile(path):
-            if verbose:
-                print('adding %s as %s' % (path, altpath if altpath else path))
-            tf.add(path, altpath if altpath else path, recursive=False)
+            entries.append((path, altpath if altpath else path))
+    return entries
 
-    if filename:
-        tf.close()
-        f.close()
-    else:
-        tf.close()
-        return cast(BytesIO, f)
 
-    return None
+def _add_paths(tf: tarfile.TarFile, paths: Sequence[Tuple[str, str]], *, verbose: bool=False,
+               make_paths_relative: bool=False, include_dirs: bool=False, source_date_epoch: int=None) -> None:
+    entries = list_paths(paths, make_paths_relative=make_paths_relative, include_dirs=include_dirs)
+
+    if source_date_epoch is not None:
+        # os.walk's order depends on the file system, so reproducible archives are sorted by name
+        entries.sort(key=lambda x: x[1])
+
+    for filepath, arcname in entries:
+        if verbose:
+            print('adding %s as %s' % (filepath, arcname,))
+        if source_date_epoch is not None:
+            tf.add(filepath, arcname, recursive=False,
+                   filter=lambda ti: normalize_tarinfo(ti, source_date_epoch))
+        else:
+            tf.add(filepath, arcname, recursive=False)
+
+
+class _QueueWriter(RawIOBase):
+    """
+    A write-only file object that cuts everything written to it into chunks and puts them into a bounded queue,
+    blocking while the queue is full.
+    """
+    def __init__(self, q: queue.Queue, chunk_size: int, cancelled: threading.Event) -> None:
+        super().__init__()
+        self.q = q
+        self.chunk_size = chunk_size
+        self.cancelled = cancelled
+        self.buf = bytearray()
+
+    def writable(self) -> bool:
+        return True
+
+    def _put(self, item: Union[bytes, None]) -> None:
+        while not self.cancelled.is_set():
+            try:
+                self.q.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                pass
+        raise BrokenPipeError("The consumer of the tar stream went away")
+
+    def write(self, b: Any) -> int:
+        self.buf.extend(b)
+        while len(self.buf) >= self.chunk_size:
+            self._put(bytes(self.buf[:self.chunk_size]))
+            del self.buf[:self.chunk_size]
+        return len(b)
+
+    def flush_all(self) -> None:
+        if self.buf:
+            self._put(bytes(self.buf))
+            self.buf = bytearray()
+
+
+class TarStream(GoPythonGoEnableSuper):
+    """
+    Creates a .tar or .tar.gz of ``paths`` (see ``create_targzip``) in a background thread while it is being
+    consumed. Iterating over a ``TarStream`` yields the archive in chunks, so it can be passed as a request body to
+    an API (e.g. the Docker build API) which then uploads the archive while it is still being compressed. At most
+    ``max_memory`` bytes of the archive are held in memory; if the consumer is slower than the producer, the producer
+    waits.
+
+    Always ``close()`` a ``TarStream`` (or use it as a context manager), otherwise the producer thread keeps waiting
+    for a consumer when the archive is not fully consumed.
+    """
+    chunk_size = 64 * 1024  # type: int
+
+    def __init__(self, paths: Sequence[Tuple[str, str]], *args: Any, compress: bool=True,
+                 max_memory: int=16 * 1024 * 1024, verbose: bool=False, make_paths_relative: bool=False,
+                 include_dirs: bool=False, source_date_epoch: int=None, **kwargs: Any) -> None:
+        super().__init__(paths, *args, **kwargs)
+        self.paths = paths
+        self.compress = compress
+        self.verbose = verbose
+        self.make_paths_relative = make_paths_relative
+        self.include_dirs = include_dirs
+        self.source_date_epoch = source_date_epoch
+        self._queue = queue.Queue(maxsize=max(1, max_memory // self.chunk_size))  # type: queue.Queue
+        self._cancelled = threading.Event()
+        self._error = None  # type: BaseException
+        self._thread = None  # type: threading.Thread
+
+    def _produce(self) -> None:
+        writer = _QueueWriter(self._queue, self.chunk_size, self._cancelled)
+        try:
+            out = cast(BinaryIO, writer)
+            if self.compress:
+                out = get_backend("gzip").open(out, reproducible=self.source_date_epoch is not None)
+            with tarfile.open(fileobj=out, mode="w|") as tf:
+                _add_paths(tf, self.paths, verbose=self.verbose, make_paths_relative=self.make_paths_relative,
+                           include_dirs=self.include_dirs, source_date_epoch=self.source_date_epoch)
+            if self.compress:
+                out.close()
+            writer.flush_all()
+        except BrokenPipeError:
+            return
+        except BaseException as e:
+            self._error = e
+        try:
+            writer._put(None)
+        except BrokenPipeError:
+            pass
+
+    def __iter__(self) -> Iterator[bytes]:
+        if self._thread is not None:
+            raise ValueError("A TarStream can only be consumed once")
+        self._thread = threading.Thread(target=self._produce, name="TarStream", daemon=True)
+        self._thread.start()
+        while True:
+            chunk = self._queue.get()
+            if chunk is None:
+                break
+            yield chunk
+        if self._error is not None:
+            raise self._error
+
+    def close(self) -> None:
+        self._cancelled.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> 'TarStream':
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
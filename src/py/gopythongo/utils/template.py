@@ -4,14 +4,62 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import os
 import tempfile
 import re
 
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Union, TYPE_CHECKING
 
-import jinja2
+from gopythongo.utils import GoPythonGoEnableSuper, ErrorMessage, print_debug, print_warning, highlight
 
-from gopythongo.utils import GoPythonGoEnableSuper, ErrorMessage
+if TYPE_CHECKING:
+    import jinja2
+
+_environment = None  # type: jinja2.Environment
+_bytecode_cache_folder = None  # type: Union[str, None]
+
+
+def get_environment() -> 'jinja2.Environment':
+    """
+    Returns the ``jinja2.Environment`` shared by all templates. Templates are loaded by their absolute path and the
+    compiled templates are cached, so rendering the same template again only costs the render. Cached templates are
+    recompiled when their file's mtime changes.
+    """
+    global _environment
+    if _environment is None:
+        import jinja2
+        _environment = jinja2.Environment(loader=jinja2.FileSystemLoader("/"), auto_reload=True, cache_size=-1)
+        if _bytecode_cache_folder:
+            _environment.bytecode_cache = jinja2.FileSystemBytecodeCache(_bytecode_cache_folder)
+    return _environment
+
+
+def set_bytecode_cache(folder: str) -> None:
+    """
+    Stores the bytecode of compiled templates in ``folder``, so later runs of GoPythonGo don't have to compile them
+    again. The cache is optional, so if ``folder`` can't be created (e.g. because it's not available inside the build
+    environment) templates are just compiled for each run.
+    """
+    global _bytecode_cache_folder
+    try:
+        os.makedirs(folder, exist_ok=True)
+    except OSError as e:
+        print_warning("Can't cache compiled templates in %s (%s)" % (highlight(folder), str(e)))
+        return
+
+    _bytecode_cache_folder = folder
+    if _environment is not None:
+        import jinja2
+        _environment.bytecode_cache = jinja2.FileSystemBytecodeCache(folder)
+    print_debug("Caching compiled templates in %s" % highlight(folder))
+
+
+def get_template(filepath: str) -> 'jinja2.Template':
+    import jinja2
+    try:
+        return get_environment().get_template(os.path.abspath(filepath))
+    except jinja2.TemplateNotFound as e:
+        raise ErrorMessage("Template %s not found" % highlight(filepath)) from e
 
 
 def process_to_tempfile(filepath: str, context: Dict[str, Any]) -> str:
@@ -22,11 +70,9 @@ def process_to_tempfile(filepath: str, context: Dict[str, Any]) -> str:
 
     :return: the full path of the temporary file containing the result
     """
+    tpl = get_template(filepath)
     outfd, ofname = tempfile.mkstemp()
     with open(outfd, mode="w") as outf:
-        with open(filepath) as inf:
-            tplstr = inf.read()
-        tpl = jinja2.Template(tplstr)
         outf.write(tpl.render(context))
 
     import gopythongo.main
@@ -41,10 +87,7 @@ def process_in_memory(filepath: str, context: Dict[str, Any]) -> str:
 
     :return: the processed result
     """
-    with open(filepath) as inf:
-        tplstr = inf.read()
-    tpl = jinja2.Template(tplstr)
-    return tpl.render(context)
+    return get_template(filepath).render(context)
 
 
 class ProcessedStringWithTemplates(GoPythonGoEnableSuper):
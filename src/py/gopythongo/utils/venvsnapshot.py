@@ -0,0 +1,206 @@
+# -* encoding: utf-8 *-
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Snapshots of assembled virtualenvs for incremental builds. After a successful build the virtualenv at ``build_path``
+is saved as a folder together with the list of installed distributions. Saving only copies the files that changed
+since the previous snapshot. The next build in the same build environment restores it in place (virtualenvs are not
+relocatable, but the build path stays the same) and lets pip install or upgrade only what changed. Distributions that
+are no longer required by any of the requested packages are removed afterwards.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import stat
+
+from typing import Dict, List, Iterable, Union
+
+from gopythongo.utils import run_process, print_info, print_warning, highlight
+from gopythongo.utils.wheelcache import get_environment_identity
+
+
+# this runs inside the virtualenv that is being assembled, so it can only rely on the standard library and pip.
+# importlib.metadata is only available on Python 3.8 and newer, older interpreters use pkg_resources instead.
+_find_orphans_script = """
+import json, sys
+from pip._vendor.packaging.requirements import Requirement
+from pip._vendor.packaging.utils import canonicalize_name
+
+try:
+    import importlib.metadata as md
+except ImportError:
+    import pkg_resources
+    dists = {canonicalize_name(d.project_name): d for d in pkg_resources.working_set}
+
+    def requires(dist, extras):
+        return [Requirement(str(r)) for r in dist.requires([e for e in extras if e in dist.extras])]
+else:
+    dists = {canonicalize_name(d.metadata["Name"]): d for d in md.distributions()}
+
+    def requires(dist, extras):
+        reqs = [Requirement(dep) for dep in dist.requires or []]
+        return [r for r in reqs if r.marker is None or any(r.marker.evaluate({"extra": e}) for e in [""] + extras)]
+
+extras = {}
+todo = [Requirement(r) for r in json.loads(sys.argv[1])]
+while todo:
+    req = todo.pop()
+    name = canonicalize_name(req.name)
+    if name not in dists or (name in extras and set(req.extras) <= extras[name]):
+        continue
+    extras.setdefault(name, set()).update(req.extras)
+    todo.extend(requires(dists[name], sorted(extras[name])))
+print(json.dumps(sorted(n for n in dists if n not in extras and n not in ("pip", "setuptools", "wheel"))))
+"""
+
+
+def get_snapshot_filename(snapshot_dir: str, build_path: str, python_binary: str) -> str:
+    """
+    :return: the path of the snapshot for ``build_path`` assembled with ``python_binary`` in the current build
+             environment
+    """
+    environment_id, _ = get_environment_identity(python_binary)
+    pathid = hashlib.sha256(build_path.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(snapshot_dir, "venv-%s-%s" % (environment_id, pathid))
+
+
+def _remove(path: str) -> None:
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    else:
+        os.unlink(path)
+
+
+def _link_or_copy(src: str, dst: str) -> None:
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _sync_tree(src: str, dst: str) -> None:
+    """
+    Makes the existing folder ``dst`` a copy of ``src``, copying only the files that differ in size or modification
+    time. Files in ``dst`` are replaced instead of overwritten, because they may be hard links into another snapshot.
+    """
+    names = set(os.listdir(src))
+    for name in os.listdir(dst):
+        if name not in names:
+            _remove(os.path.join(dst, name))
+
+    for name in names:
+        srcname, dstname = os.path.join(src, name), os.path.join(dst, name)
+        st = os.lstat(srcname)
+        dst_st = os.lstat(dstname) if os.path.lexists(dstname) else None
+        if stat.S_ISDIR(st.st_mode):
+            if dst_st and not stat.S_ISDIR(dst_st.st_mode):
+                _remove(dstname)
+                dst_st = None
+            if not dst_st:
+                os.mkdir(dstname)
+            _sync_tree(srcname, dstname)
+        elif stat.S_ISLNK(st.st_mode):
+            target = os.readlink(srcname)
+            if dst_st and stat.S_ISLNK(dst_st.st_mode) and os.readlink(dstname) == target:
+                continue
+            if dst_st:
+                _remove(dstname)
+            os.symlink(target, dstname)
+        else:
+            if dst_st and stat.S_ISREG(dst_st.st_mode) and dst_st.st_size == st.st_size and \
+                    dst_st.st_mtime_ns == st.st_mtime_ns and dst_st.st_mode == st.st_mode:
+                continue
+            if dst_st:
+                _remove(dstname)
+            shutil.copy2(srcname, dstname, follow_symlinks=False)
+    shutil.copystat(src, dst, follow_symlinks=False)
+
+
+def restore_snapshot(snapshot: str, build_path: str) -> Union[Dict[str, str], None]:
+    """
+    Restores the virtualenv in ``snapshot`` to ``build_path``.
+
+    :return: the distributions that were installed in the snapshot or ``None`` if there is no usable snapshot
+    """
+    if not os.path.isdir(os.path.join(snapshot, "venv")) or \
+            not os.path.exists(os.path.join(snapshot, "installed.json")):
+        return None
+
+    if os.path.exists(build_path) and os.listdir(build_path):
+        print_info("Not restoring virtualenv snapshot, because %s is not empty" % highlight(build_path))
+        return None
+
+    print_info("Restoring virtualenv snapshot %s to %s" % (highlight(snapshot), highlight(build_path)))
+    try:
+        with open(os.path.join(snapshot, "installed.json"), "rt", encoding="utf-8") as f:
+            installed = json.load(f)
+        if os.path.exists(build_path):
+            os.rmdir(build_path)
+        shutil.copytree(os.path.join(snapshot, "venv"), build_path, symlinks=True)
+    except OSError as e:
+        # another build replaced the snapshot while we were copying it
+        print_warning("Unable to restore virtualenv snapshot %s (%s)" % (highlight(snapshot), str(e)))
+        if os.path.exists(build_path):
+            shutil.rmtree(build_path)
+        return None
+    return installed
+
+
+def save_snapshot(snapshot: str, build_path: str, installed: Dict[str, str]) -> None:
+    """
+    Saves the virtualenv in ``build_path`` and the list of ``installed`` distributions as the new snapshot. The new
+    snapshot starts out as hard links to the files of the previous one and only the changed files are copied. It
+    replaces the previous snapshot by renaming it, so concurrent builds never see a partial snapshot.
+    """
+    print_info("Saving virtualenv snapshot %s" % highlight(snapshot))
+    tmpdir = "%s.%s.tmp" % (snapshot, os.getpid())
+    if os.path.exists(tmpdir):
+        shutil.rmtree(tmpdir)
+    os.makedirs(tmpdir)
+    if os.path.isdir(os.path.join(snapshot, "venv")):
+        shutil.copytree(os.path.join(snapshot, "venv"), os.path.join(tmpdir, "venv"), symlinks=True,
+                        copy_function=_link_or_copy)
+    else:
+        os.mkdir(os.path.join(tmpdir, "venv"))
+    _sync_tree(build_path, os.path.join(tmpdir, "venv"))
+    with open(os.path.join(tmpdir, "installed.json"), "wt", encoding="utf-8") as f:
+        json.dump(installed, f)
+
+    olddir = "%s.%s.old" % (snapshot, os.getpid())
+    if os.path.exists(snapshot):
+        os.rename(snapshot, olddir)
+    os.rename(tmpdir, snapshot)
+    shutil.rmtree(olddir, ignore_errors=True)
+
+
+def find_orphans(envpy: str, requested: Iterable[str]) -> List[str]:
+    """
+    Walks the dependency tree of the ``requested`` requirement specifiers in the virtualenv of ``envpy``.
+
+    :return: the names of all installed distributions that are not part of the dependency tree
+    """
+    out = run_process(envpy, "-c", _find_orphans_script, json.dumps(list(requested)))
+    for line in out.output.split("\n"):
+        if line.startswith("["):
+            return json.loads(line)
+    return []
+
+
+def print_changes(before: Dict[str, str], after: Dict[str, str]) -> None:
+    installed = sorted(set(after.keys()) - set(before.keys()))
+    removed = sorted(set(before.keys()) - set(after.keys()))
+    changed = sorted(k for k in set(before.keys()) & set(after.keys()) if before[k] != after[k])
+    print_info("Incremental virtualenv update: %s installed, %s changed, %s removed, %s unchanged" %
+               (highlight(str(len(installed))), highlight(str(len(changed))), highlight(str(len(removed))),
+                highlight(str(len(after) - len(installed) - len(changed)))))
+    for name in installed:
+        print_info("    + %s %s" % (name, after[name]))
+    for name in changed:
+        print_info("    ~ %s %s => %s" % (name, before[name], after[name]))
+    for name in removed:
+        print_info("    - %s %s" % (name, before[name]))
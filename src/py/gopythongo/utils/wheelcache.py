@@ -0,0 +1,227 @@
+# -* encoding: utf-8 *-
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+A persistent wheel cache that is shared between builds. Wheels are stored below a folder per build environment
+identity (the distribution, the installed system packages and the Python ABI of the build environment), so a wheel
+compiled against the libraries of one pbuilder basetgz or Docker image is never reused in a different one. Inside
+that folder the wheel filename itself carries the package name, version and Python/ABI/platform tags.
+
+The cache keeps an index of all wheels with their size and the time they were last used by a build, which allows
+it to evict the least recently used wheels when it grows beyond its configured size.
+"""
+
+import hashlib
+import json
+import os
+import re
+import time
+
+from typing import Dict, List, Set, Tuple, Union, Any
+
+from gopythongo.utils import GoPythonGoEnableSuper, run_process, print_info, print_debug, print_warning, highlight, \
+    umasked_makedirs
+
+
+# files that identify the system libraries which C extensions get compiled against inside a build environment
+_environment_identity_files = ["/etc/os-release", "/var/lib/dpkg/status"]  # type: List[str]
+
+_wheel_filename_re = re.compile(r"^(?P<name>[^-]+)-(?P<version>[^-]+)(-(?P<build>\d[^-]*))?-"
+                                r"(?P<tags>[^-]+-[^-]+-[^-]+)\.whl$")
+
+_index_filename = "index.json"  # type: str
+
+
+def normalize_name(name: str) -> str:
+    """
+    Normalizes a distribution name the same way the wheel filename convention does, so that names reported by pip
+    can be matched against wheel filenames.
+    """
+    return re.sub(r"[-_.]+", "_", name).lower()
+
+
+def parse_wheel_filename(filename: str) -> Union[Tuple[str, str, str], None]:
+    """
+    :return: a tuple of normalized distribution name, version and ``pyver-abi-platform`` tags or ``None`` if
+             ``filename`` is not a wheel filename
+    """
+    m = _wheel_filename_re.match(os.path.basename(filename))
+    if not m:
+        return None
+    return normalize_name(m.group("name")), m.group("version"), m.group("tags")
+
+
+def get_environment_identity(envpy: str) -> Tuple[str, Dict[str, str]]:
+    """
+    Computes the identity of the build environment we're running in from the Python interpreter ``envpy`` and the
+    system package database.
+
+    :return: a tuple of a hex digest identifying the environment and a dict describing its parts
+    """
+    out = run_process(envpy, "-c", "import sys, sysconfig, platform; "
+                                   "print(sys.implementation.cache_tag, sysconfig.get_config_var('SOABI'), "
+                                   "platform.machine())")
+    description = {"python": out.output}  # type: Dict[str, str]
+    h = hashlib.sha256()
+    h.update(out.output.encode("utf-8"))
+    for fn in _environment_identity_files:
+        if os.path.isfile(fn):
+            fh = hashlib.sha256()
+            with open(fn, "rb") as f:
+                for chunk in iter(lambda: f.read(65536), b""):
+                    fh.update(chunk)
+            description[fn] = fh.hexdigest()
+            h.update(fn.encode("utf-8"))
+            h.update(fh.digest())
+    return h.hexdigest()[:16], description
+
+
+class WheelCache(GoPythonGoEnableSuper):
+    """
+    Manages a wheel cache folder for a single build. Call ``open`` once the virtualenv exists, let pip build wheels
+    into the returned folder and install from it, then call ``record_usage`` with the installed distributions and
+    ``close`` to evict old wheels and persist the index.
+    """
+    def __init__(self, cache_root: str, max_size: int, *args: Any, **kwargs: Any) -> None:
+        super().__init__(cache_root, max_size, *args, **kwargs)
+        self.cache_root = cache_root  # type: str
+        self.max_size = max_size  # type: int
+        self.environment_id = None  # type: str
+        self.path = None  # type: str
+        self.hits = []  # type: List[str]
+        self.misses = []  # type: List[str]
+        self._index = {}  # type: Dict[str, Dict[str, Any]]
+        self._preexisting = set()  # type: Set[str]
+
+    def open(self, envpy: str) -> str:
+        """
+        Selects the cache folder for the current build environment, creating it if necessary, and loads the index.
+
+        :param envpy: the Python interpreter of the virtualenv that is being assembled
+        :return: the folder that pip should use as its wheel directory
+        """
+        self.environment_id, description = get_environment_identity(envpy)
+        self.path = os.path.join(self.cache_root, self.environment_id)
+        umasked_makedirs(self.path, 0o755)
+
+        envfile = os.path.join(self.path, "environment.json")
+        if not os.path.exists(envfile):
+            with open(envfile, "wt", encoding="utf-8") as f:
+                json.dump(description, f, indent=4)
+
+        self._load_index()
+        self._preexisting = set(self._scan())
+        print_info("Using wheel cache %s for build environment %s (%s wheels cached)" %
+                   (highlight(self.path), highlight(self.environment_id), len(self._preexisting)))
+        return self.path
+
+    def _scan(self) -> List[str]:
+        return [fn for fn in os.listdir(self.path) if parse_wheel_filename(fn)]
+
+    def _load_index(self) -> None:
+        indexfn = os.path.join(self.cache_root, _index_filename)
+        self._index = {}
+        if os.path.exists(indexfn):
+            try:
+                with open(indexfn, "rt", encoding="utf-8") as f:
+                    self._index = json.load(f)
+            except ValueError as e:
+                print_warning("Wheel cache index %s is corrupt and will be rebuilt (%s)" % (highlight(indexfn), str(e)))
+
+        # the index is advisory, the file system is the truth. So we add wheels that other builds created without
+        # updating the index (e.g. concurrent builds) and forget wheels that were removed.
+        for envdir in os.listdir(self.cache_root):
+            fullenvdir = os.path.join(self.cache_root, envdir)
+            if not os.path.isdir(fullenvdir):
+                continue
+            for fn in os.listdir(fullenvdir):
+                key = "%s/%s" % (envdir, fn)
+                if parse_wheel_filename(fn) and key not in self._index:
+                    st = os.stat(os.path.join(fullenvdir, fn))
+                    self._index[key] = {"size": st.st_size, "last_used": int(st.st_mtime)}
+        for key in list(self._index.keys()):
+            if not os.path.exists(os.path.join(self.cache_root, key)):
+                del self._index[key]
+
+    def discard(self, filenames: List[str]) -> None:
+        """
+        Removes wheels from the cache folder that pip put there, but which should not be cached, like wheels of local
+        projects which change with every build.
+        """
+        for fn in filenames:
+            if os.path.exists(os.path.join(self.path, fn)) and fn not in self._preexisting:
+                os.unlink(os.path.join(self.path, fn))
+
+    def record_usage(self, installed: Dict[str, str]) -> None:
+        """
+        Marks all wheels in the cache folder that match an installed distribution as used and sorts them into cache
+        hits (the wheel existed before this build) and misses (the wheel was built or downloaded by this build).
+
+        :param installed: a dict of distribution name to version, as installed in the virtualenv
+        """
+        installed_normalized = {normalize_name(k): v for k, v in installed.items()}
+        now = int(time.time())
+        for fn in self._scan():
+            name, version, _ = parse_wheel_filename(fn)
+            if installed_normalized.get(name) != version:
+                continue
+
+            key = "%s/%s" % (self.environment_id, fn)
+            self._index[key] = {
+                "size": os.path.getsize(os.path.join(self.path, fn)),
+                "last_used": now,
+            }
+            if fn in self._preexisting:
+                self.hits.append(fn)
+            else:
+                self.misses.append(fn)
+
+    def evict(self) -> List[str]:
+        """
+        Removes the least recently used wheels from all build environments until the cache is smaller than
+        ``max_size``. Wheels used by the current build are never evicted.
+
+        :return: the list of evicted index keys
+        """
+        keep = set("%s/%s" % (self.environment_id, fn) for fn in self.hits + self.misses)
+        total = sum(entry["size"] for entry in self._index.values())
+        evicted = []  # type: List[str]
+        for key, entry in sorted(self._index.items(), key=lambda x: x[1]["last_used"]):
+            if total <= self.max_size:
+                break
+            if key in keep:
+                continue
+            try:
+                os.unlink(os.path.join(self.cache_root, key))
+            except FileNotFoundError:
+                pass  # a concurrent build got there first
+            total -= entry["size"]
+            evicted.append(key)
+            del self._index[key]
+        return evicted
+
+    def close(self) -> None:
+        """
+        Evicts old wheels, writes the index and reports the cache statistics of this build.
+        """
+        evicted = self.evict()
+        for key in evicted:
+            print_debug("Evicted %s from the wheel cache" % highlight(key))
+
+        indexfn = os.path.join(self.cache_root, _index_filename)
+        tmpfn = "%s.%s.tmp" % (indexfn, os.getpid())
+        with open(tmpfn, "wt", encoding="utf-8") as f:
+            json.dump(self._index, f)
+        os.replace(tmpfn, indexfn)
+
+        for fn in self.hits:
+            print_debug("Wheel cache hit: %s" % highlight(fn))
+        for fn in self.misses:
+            print_debug("Wheel cache miss: %s" % highlight(fn))
+        print_info("Wheel cache: %s hits, %s misses, %s evicted, %s MB in use" %
+                   (highlight(str(len(self.hits))), highlight(str(len(self.misses))),
+                    highlight(str(len(evicted))),
+                    highlight("%.1f" % (sum(e["size"] for e in self._index.values()) / 1024 / 1024))))
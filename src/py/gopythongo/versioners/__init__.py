@@ -12,7 +12,8 @@ from typing import Dict, Any
 from gopythongo.packers import get_packers
 from gopythongo.stores import get_stores
 from gopythongo.utils import highlight, print_info, plugins, CommandLinePlugin, ErrorMessage
-from gopythongo.versioners.parsers import help as parser_help, BaseVersionParser, VersionContainer
+from gopythongo.versioners.parsers import help as parser_help, BaseVersionParser, VersionContainer, \
+    get_conversion_graph
 from gopythongo.versioners import help as versioner_help
 
 
@@ -30,24 +31,23 @@ def get_version_parsers() -> Dict[str, BaseVersionParser]:
 
 def init_subsystem() -> None:
     global _versioners, _version_parsers
-    from gopythongo.versioners import aptly, aptly_remote, pymodule, bumpversion, static, searchfile
-    from gopythongo.versioners.parsers import regexparser, semverparser, debianparser, pep440parser
-
-    _versioners = {
-        "aptly": aptly.versioner_class(),
-        "remote-aptly": aptly_remote.versioner_class(),
-        "pymodule": pymodule.versioner_class(),
-        "bumpversion": bumpversion.versioner_class(),
-        "static": static.versioner_class(),
-        "searchfile": searchfile.versioner_class(),
-    }
-
-    _version_parsers = {
-        "regex": regexparser.versionparser_class(),
-        "semver": semverparser.versionparser_class(),
-        "debian": debianparser.versionparser_class(),
-        "pep440": pep440parser.versionparser_class(),
-    }
+    _versioners = {}
+    plugins.register_builtins(_versioners, {
+        "aptly": "gopythongo.versioners.aptly",
+        "remote-aptly": "gopythongo.versioners.aptly_remote",
+        "pymodule": "gopythongo.versioners.pymodule",
+        "bumpversion": "gopythongo.versioners.bumpversion",
+        "static": "gopythongo.versioners.static",
+        "searchfile": "gopythongo.versioners.searchfile",
+    }, "versioner_class", BaseVersioner, "versioner_name")
+
+    _version_parsers = {}
+    plugins.register_builtins(_version_parsers, {
+        "regex": "gopythongo.versioners.parsers.regexparser",
+        "semver": "gopythongo.versioners.parsers.semverparser",
+        "debian": "gopythongo.versioners.parsers.debianparser",
+        "pep440": "gopythongo.versioners.parsers.pep440parser",
+    }, "versionparser_class", BaseVersionParser, "versionparser_name")
 
     plugins.load_plugins("gopythongo.versioners", _versioners, "versioner_class", BaseVersioner,
                          "versioner_name")
@@ -149,18 +149,18 @@ def validate_args(args: configargparse.Namespace) -> None:
         raise ErrorMessage("%s is not a valid Version Parser for parsing version numbers. Valid options are %s" %
                            (highlight(args.version_parser), ", ".join(_version_parsers.keys())))
 
-    # TODO: this can be much improved, for example by searching for lossless conversion paths
     if args.version_action != "none":
         from gopythongo.stores import get_stores
         used_parser = args.version_parser
         available_parsers = get_stores()[args.store].supported_version_parsers
         if used_parser not in available_parsers:
-            for parser in available_parsers:
-                if (get_version_parsers()[parser].can_convert_from(used_parser)[1] or
-                        get_version_parsers()[used_parser].can_convert_to(parser)[1]):
-                    used_parser = parser
-                    break
-            if used_parser not in available_parsers:
+            # use the supported Version Parser with the shortest lossless conversion route
+            graph = get_conversion_graph()
+            routes = [(len(graph.route(used_parser, parser)[0]), ix, parser)
+                      for ix, parser in enumerate(available_parsers) if graph.is_lossless(used_parser, parser)]
+            if routes:
+                used_parser = min(routes)[2]
+            else:
                 raise ErrorMessage("User-selected Version Parser %s is not supported by the selected Store %s and the "
                                    "Store does not support any versioning systems which can losslessly convert "
                                    "from %s. Supported Version Parsers are: %s" %
@@ -170,8 +170,8 @@ def validate_args(args: configargparse.Namespace) -> None:
 
         if args.version_action not in _version_parsers[used_parser].supported_actions:
             raise ErrorMessage("Version Parser %s does not support action '%s'. Valid choices are: %s." %
-                               (highlight(args.version_parser), args.version_action,
-                                ", ".join(_version_parsers[args.version_parser].supported_actions)))
+                               (highlight(used_parser), args.version_action,
+                                ", ".join(_version_parsers[used_parser].supported_actions)))
 
 
 def version(args: configargparse.Namespace) -> None:
@@ -6,13 +6,13 @@
 
 import configargparse
 
-from typing import List, Any, Type
+from typing import List, Any, Type, Tuple
 
 import gopythongo.shared.aptly_args as _aptly_args
 from gopythongo.shared.aptly_base import AptlyBaseVersioner
 
 from gopythongo.utils.debversion import DebianVersion, InvalidDebianVersionString
-from gopythongo.utils import highlight, run_process, ErrorMessage, print_info, cmdargs_unquote_split
+from gopythongo.utils import highlight, run_process, ErrorMessage, cmdargs_unquote_split
 
 
 class AptlyVersioner(AptlyBaseVersioner):
@@ -70,18 +70,8 @@ class AptlyVersioner(AptlyBaseVersioner):
             raise ErrorMessage("aptly reported an unknown problem with exit code %s\n*** Output follows:\n%s" %
                                (ret.exitcode, highlight(ret.output) if ret.output else "no output"))
         else:
-            versions = []  # type: List[DebianVersion]
-            for line in ret.output.split():
-                line = line.strip()
-                if line:
-                    try:
-                        versions.append(DebianVersion.fromstring(line))
-                    except InvalidDebianVersionString as e:
-                        print_info("aptly returned an unparsable Debian version string. This should never happen "
-                                   "in a APT repository where all versions must be valid Debian versions. (Unparseable "
-                                   "return value was: %s)" % highlight(line))
+            versions = self.parse_repo_versions(ret.output.split(), args)
             if len(versions) > 0:
-                versions.sort()
                 return versions
             else:
                 if allow_fallback_version and args.aptly_fallback_version:
@@ -89,5 +79,23 @@ class AptlyVersioner(AptlyBaseVersioner):
                 else:
                     return []
 
+    def query_repo_packages(self, query: str, args: configargparse.Namespace) -> List[Tuple[str, str, str]]:
+        cmd = _aptly_args.get_aptly_cmdline(args) + ["repo", "search"]
+        cmd += cmdargs_unquote_split(args.aptly_versioner_opts)
+
+        cmd += ["-format", "{{.Package}} {{.Version}} {{.SHA256}}", args.aptly_repo, query]
+        ret = run_process(*cmd, allow_nonzero_exitcode=True)
+        if ret.exitcode != 0 and "ERROR: no results" in ret.output:
+            return []
+        elif ret.exitcode != 0:
+            raise ErrorMessage("aptly reported an unknown problem with exit code %s\n*** Output follows:\n%s" %
+                               (ret.exitcode, highlight(ret.output) if ret.output else "no output"))
+        packages = []  # type: List[Tuple[str, str, str]]
+        for line in ret.output.split("\n"):
+            parts = line.split()
+            if len(parts) >= 2:
+                packages.append((parts[0], parts[1], parts[2] if len(parts) > 2 else ""))
+        return packages
+
 
 versioner_class = AptlyVersioner  # type: Type[AptlyVersioner]
@@ -6,13 +6,13 @@
 
 import configargparse
 
-from typing import List, Any, Type
+from typing import List, Any, Type, Tuple
 
-import aptly_api
+import gopythongo.shared.aptly_args as _aptly_args
 from gopythongo.shared.aptly_base import AptlyBaseVersioner
 
-from gopythongo.utils.debversion import DebianVersion, InvalidDebianVersionString
-from gopythongo.utils import highlight, ErrorMessage, print_info
+from gopythongo.utils.debversion import DebianVersion
+from gopythongo.utils import highlight, ErrorMessage
 
 
 class RemoteAptlyVersioner(AptlyBaseVersioner):
@@ -40,7 +40,9 @@ class RemoteAptlyVersioner(AptlyBaseVersioner):
 
     def query_repo_versions(self, query: str, args: configargparse.Namespace, *,
                             allow_fallback_version: bool=False) -> List[DebianVersion]:
-        _aptly = aptly_api.Client(args.aptly_server_url)
+        import aptly_api
+
+        _aptly = _aptly_args.get_aptly_api_client(args)
 
         try:
             packages = _aptly.repos.search_packages(args.aptly_repo, query, detailed=True)
@@ -54,18 +56,9 @@ class RemoteAptlyVersioner(AptlyBaseVersioner):
                 else:
                     return []
 
-            versions = []  # type: List[DebianVersion]
-            for pkg in packages:
-                line = pkg.fields["Version"]
-                if line:
-                    try:
-                        versions.append(DebianVersion.fromstring(line))
-                    except InvalidDebianVersionString as e:
-                        print_info("aptly returned an unparsable Debian version string. This should never happen "
-                                   "in a APT repository where all versions must be valid Debian versions. (Unparseable "
-                                   "return value was: %s)" % highlight(line))
+            versions = self.parse_repo_versions((pkg.fields["Version"] for pkg in packages if pkg.fields["Version"]),
+                                                args)
             if len(versions) > 0:
-                versions.sort()
                 return versions
             else:
                 if allow_fallback_version and args.aptly_fallback_version:
@@ -73,5 +66,17 @@ class RemoteAptlyVersioner(AptlyBaseVersioner):
                 else:
                     return []
 
+    def query_repo_packages(self, query: str, args: configargparse.Namespace) -> List[Tuple[str, str, str]]:
+        import aptly_api
+
+        _aptly = _aptly_args.get_aptly_api_client(args)
+
+        try:
+            packages = _aptly.repos.search_packages(args.aptly_repo, query, detailed=True)
+        except aptly_api.AptlyAPIException as e:
+            raise ErrorMessage("aptly reported an unknown problem:\n%s" % str(e)) from e
+        return [(pkg.fields["Package"], pkg.fields["Version"], pkg.fields.get("SHA256", ""))
+                for pkg in packages if pkg.fields]
+
 
 versioner_class = RemoteAptlyVersioner  # type: Type[RemoteAptlyVersioner]
@@ -3,11 +3,13 @@
 # This Source Code Form is subject to the terms of the Mozilla Public
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
+import heapq
+
 from abc import abstractmethod
 
 import configargparse
 
-from typing import Tuple, Any, List, Dict, TypeVar, Generic, Union
+from typing import Tuple, Any, List, Dict, TypeVar, Generic, Union, Iterable, Set
 
 from gopythongo.utils import CommandLinePlugin, GoPythonGoEnableSuper, ErrorMessage, highlight
 
@@ -17,6 +19,21 @@ def get_version_parsers() -> Dict[str, 'BaseVersionParser']:
     return gvp()
 
 
+_conversion_graph = None  # type: Union['ConversionGraph', None]
+
+
+def get_conversion_graph() -> 'ConversionGraph':
+    """
+    :return: the conversion graph of the registered Version Parsers. It's built on first use, because that loads all
+             Version Parser plugins, and rebuilt if the Version Parser registry is replaced.
+    """
+    global _conversion_graph
+    version_parsers = get_version_parsers()
+    if _conversion_graph is None or _conversion_graph.parsers is not version_parsers:
+        _conversion_graph = ConversionGraph(version_parsers)
+    return _conversion_graph
+
+
 class UnknownParserName(Exception):
     pass
 
@@ -29,6 +46,14 @@ T = TypeVar("T")
 
 
 class VersionContainer(Generic[T], GoPythonGoEnableSuper):
+    """
+    Wraps a version object together with the id of the Version Parser that created it. Versioners can return a
+    container for every version in a repository, so containers are slotted and the wrapped version objects are
+    expected to be immutable and hashable. Two containers are equal if they contain equal versions parsed by the same
+    Version Parser.
+    """
+    __slots__ = ("version", "parsed_by")
+
     def __init__(self, version: T, parsed_by: str, *args: Any, **kwargs: Any) -> None:
         super().__init__(version, parsed_by, *args, **kwargs)
         self.version = version  # type: T
@@ -42,21 +67,7 @@ class VersionContainer(Generic[T], GoPythonGoEnableSuper):
         if parsername == self.parsed_by:
             return self
 
-        target_can_convert, target_losslessly = version_parsers[parsername].can_convert_from(self.parsed_by)
-        if target_can_convert and target_losslessly:
-            return version_parsers[parsername].convert_from(self)
-
-        source_can_convert, source_losslessly = version_parsers[self.parsed_by].can_convert_to(parsername)
-        if source_can_convert and source_losslessly:
-            return version_parsers[self.parsed_by].convert_to(self, parsername)
-
-        if target_can_convert:
-            return version_parsers[parsername].convert_from(self)
-
-        if source_can_convert:
-            return version_parsers[parsername].convert_from(self)
-
-        raise UnconvertableVersion("No known way to convert version data from %s to %s" % (self.parsed_by, parsername))
+        return get_conversion_graph().convert(self, parsername)
 
     def todict(self) -> Dict[str, str]:
         """
@@ -84,10 +95,112 @@ class VersionContainer(Generic[T], GoPythonGoEnableSuper):
                                "id is %s" % (highlight(str(rep)), highlight(rep["p"])))
         return version_parsers[rep["p"]].deserialize(rep["v"])
 
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, VersionContainer):
+            return NotImplemented
+        return (self.parsed_by, self.version) == (other.parsed_by, other.version)
+
+    def __ne__(self, other: Any) -> bool:
+        if not isinstance(other, VersionContainer):
+            return NotImplemented
+        return (self.parsed_by, self.version) != (other.parsed_by, other.version)
+
+    def __hash__(self) -> int:
+        return hash((self.parsed_by, self.version))
+
     def __str__(self) -> str:
         return "VersionContainer(%s, %s)" % (str(self.version), self.parsed_by)
 
 
+class ConversionGraph(object):
+    """
+    A directed graph of the Version Parsers with an edge from each parser to each parser it can convert versions to,
+    either because the target parser ``can_convert_from`` the source parser or because the source parser
+    ``can_convert_to`` the target parser. Lossless edges are preferred over lossy ones and converting through the
+    target parser is preferred over converting through the source parser.
+
+    Conversions follow the shortest route that has the fewest lossy edges, so a lossless route through other parsers
+    is preferred over a lossy direct conversion. Routes are calculated once for each pair of parsers and then reused.
+    """
+    def __init__(self, parsers: Dict[str, 'BaseVersionParser']) -> None:
+        self.parsers = parsers
+        # source parser id -> target parser id -> (lossless, convert through the target parser)
+        self.edges = {}  # type: Dict[str, Dict[str, Tuple[bool, bool]]]
+        self._routes = {}  # type: Dict[Tuple[str, str], Union[Tuple[List[str], bool], None]]
+
+        for source in parsers.keys():
+            self.edges[source] = {}
+            for target in parsers.keys():
+                if source == target:
+                    continue
+                target_can_convert, target_losslessly = parsers[target].can_convert_from(source)
+                source_can_convert, source_losslessly = parsers[source].can_convert_to(target)
+                if target_can_convert and target_losslessly:
+                    self.edges[source][target] = (True, True)
+                elif source_can_convert and source_losslessly:
+                    self.edges[source][target] = (True, False)
+                elif target_can_convert:
+                    self.edges[source][target] = (False, True)
+                elif source_can_convert:
+                    self.edges[source][target] = (False, False)
+
+    def route(self, source: str, target: str) -> Union[Tuple[List[str], bool], None]:
+        """
+        :return: ``None`` if there is no way to convert versions from ``source`` to ``target``, otherwise a tuple of
+                 the ids of the parsers on the route, starting with ``source`` and ending with ``target``, and whether
+                 the route is lossless
+        """
+        if (source, target) not in self._routes:
+            self._routes[(source, target)] = self._shortest_route(source, target)
+        return self._routes[(source, target)]
+
+    def _shortest_route(self, source: str, target: str) -> Union[Tuple[List[str], bool], None]:
+        if source not in self.edges or target not in self.edges:
+            return None
+
+        # a lossy edge costs more than the longest possible lossless route, so routes are compared by their number
+        # of lossy edges first and their length second
+        lossy_cost = len(self.edges)
+        queue = [(0, source, [source])]  # type: List[Tuple[int, str, List[str]]]
+        done = set()  # type: Set[str]
+        while queue:
+            cost, parser, path = heapq.heappop(queue)
+            if parser == target:
+                return path, cost < lossy_cost
+            if parser in done:
+                continue
+            done.add(parser)
+            for next_parser, (lossless, _) in self.edges[parser].items():
+                if next_parser not in done:
+                    heapq.heappush(queue, (cost + (1 if lossless else lossy_cost), next_parser, path + [next_parser]))
+        return None
+
+    def is_lossless(self, source: str, target: str) -> bool:
+        if source == target:
+            return True
+        route = self.route(source, target)
+        return route is not None and route[1]
+
+    def convert(self, version: VersionContainer, target: str) -> VersionContainer:
+        """
+        Converts ``version`` along the best route to the parser ``target``.
+
+        :raises UnconvertableVersion: if there is no route to ``target``
+        """
+        route = self.route(version.parsed_by, target)
+        if route is None:
+            raise UnconvertableVersion("No known way to convert version data from %s to %s" %
+                                       (version.parsed_by, target))
+
+        path = route[0]
+        for source, next_parser in zip(path, path[1:]):
+            if self.edges[source][next_parser][1]:
+                version = self.parsers[next_parser].convert_from(version)
+            else:
+                version = self.parsers[source].convert_to(version, next_parser)
+        return version
+
+
 class BaseVersionParser(CommandLinePlugin):
     """
     A base class for Version Parsers for GoPythonGo. You can register your own Version Parsers by using setuptools
@@ -139,6 +252,27 @@ class BaseVersionParser(CommandLinePlugin):
         """
         raise NotImplementedError("Every Version Parser MUST implement parse()")
 
+    def parse_many(self, version_strs: Iterable[str],
+                   args: configargparse.Namespace) -> Tuple[List[VersionContainer], List[Tuple[str, str]]]:
+        """
+        Parses many version strings at once, e.g. all versions of a package in a repository. Unlike ``parse()`` this
+        does not stop at the first invalid version string. The default implementation calls ``parse()`` for each
+        version string, Version Parsers can override this with something faster.
+
+        :param version_strs: the version strings to parse
+        :param args: The parsed command-line arguments as provided by configargparse
+        :return: a tuple of the parsed versions in the order of ``version_strs`` and a list of
+                 ``(version string, error message)`` tuples for the version strings that could not be parsed
+        """
+        versions = []  # type: List[VersionContainer]
+        errors = []  # type: List[Tuple[str, str]]
+        for version_str in version_strs:
+            try:
+                versions.append(self.parse(version_str, args))
+            except ErrorMessage as e:
+                errors.append((version_str, str(e)))
+        return versions, errors
+
     @abstractmethod
     def deserialize(self, version_str: str) -> VersionContainer:
         """
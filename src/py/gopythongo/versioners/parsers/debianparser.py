@@ -7,7 +7,7 @@
 import configargparse
 import re
 
-from typing import Any, Tuple, List, Type
+from typing import Any, Dict, Iterable, Tuple, List, Type, Union
 
 from gopythongo.utils import highlight, ErrorMessage
 from gopythongo.utils.debversion import DebianVersion, InvalidDebianVersionString
@@ -43,32 +43,54 @@ class DebianVersionParser(BaseVersionParser):
 
         return VersionContainer(dv, self.versionparser_name)
 
+    def parse_many(self, version_strs: Iterable[str], args: configargparse.Namespace) -> \
+            Tuple[List[VersionContainer[DebianVersion]], List[Tuple[str, str]]]:
+        # repository listings contain the same version strings many times (e.g. once per package and architecture)
+        # and DebianVersion objects are immutable, so each distinct version string is only parsed once
+        parsed = {}  # type: Dict[str, Union[VersionContainer[DebianVersion], str]]
+        versions = []  # type: List[VersionContainer[DebianVersion]]
+        errors = []  # type: List[Tuple[str, str]]
+        for version_str in version_strs:
+            result = parsed.get(version_str)
+            if result is None:
+                try:
+                    result = VersionContainer(DebianVersion.fromstring(version_str), self.versionparser_name)
+                except InvalidDebianVersionString as e:
+                    result = "%s is not a valid Debian version string: %s" % (highlight(version_str), str(e))
+                parsed[version_str] = result
+
+            if isinstance(result, str):
+                errors.append((version_str, result))
+            else:
+                versions.append(result)
+        return versions, errors
+
     def can_execute_action(self, version: VersionContainer, action: str) -> bool:
         if action in self.supported_actions:
             return True
         return False
 
     def execute_action(self, version: VersionContainer[DebianVersion], action: str) -> VersionContainer[DebianVersion]:
-        # make a copy of the DebianVersion object
-        ver = DebianVersion.fromstring(version.version.tostring())
+        ver = version.version
         if action == "bump-epoch":
             if ver.epoch:
-                ver.epoch = str(int(ver.epoch) + 1)
+                ver = DebianVersion(str(int(ver.epoch) + 1), ver.version, ver.revision)
             else:
-                ver.epoch = "1"
+                ver = DebianVersion("1", ver.version, ver.revision)
         elif action == "bump-revision":
             # find the first number group in revision and increment it
             if ver.revision:
                 matches = re.search("([0-9]+)", ver.revision)
                 if matches:
                     # replace the first occurrence
-                    ver.revision = ver.revision.replace(matches.group(1), str(int(matches.group(1)) + 1), 1)
+                    ver = DebianVersion(ver.epoch, ver.version,
+                                        ver.revision.replace(matches.group(1), str(int(matches.group(1)) + 1), 1))
                 else:
                     raise ErrorMessage("Version Action is '%s', but the revision string of %s (revision=%s) does not "
                                        "contain an incrementable integer number" %
                                        (highlight(action), highlight(str(ver)), highlight(ver.revision)))
             else:
-                ver.revision = "1"
+                ver = DebianVersion(ver.epoch, ver.version, "1")
         return VersionContainer(ver, self.versionparser_name)
 
     def deserialize(self, serialized: str) -> VersionContainer:
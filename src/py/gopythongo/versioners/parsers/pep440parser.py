@@ -7,7 +7,7 @@
 import configargparse
 
 from copy import copy
-from typing import Any, List, Tuple, Union, Type
+from typing import Any, Iterable, List, Tuple, Union, Type
 
 from gopythongo.utils import highlight, ErrorMessage
 from gopythongo.versioners.parsers import BaseVersionParser, VersionContainer
@@ -18,6 +18,9 @@ class PEP440Adapter(Version):
     """
     provides some extra utility methods for GoPythonGo
     """
+    # packaging's Version is slotted, so don't add a __dict__
+    __slots__ = ()
+
     def to_parts(self, *, epoch_suffix: str="!", release_sep: str=".", pre_prefix: str="", pre_sep: str="",
                  post_prefix: str=".", dev_prefix: str=".", local_prefix: str="+", local_sep: str=".") -> List[str]:
         parts = []  # type:List[str]
@@ -82,6 +85,19 @@ class PEP440VersionParser(BaseVersionParser):
 
         return VersionContainer(version, self.versionparser_name)
 
+    def parse_many(self, version_strs: Iterable[str], args: configargparse.Namespace) -> \
+            Tuple[List[VersionContainer[PEP440Adapter]], List[Tuple[str, str]]]:
+        versions = []  # type: List[VersionContainer[PEP440Adapter]]
+        errors = []  # type: List[Tuple[str, str]]
+        for version_str in version_strs:
+            try:
+                # unlike parse() this doesn't parse every version string twice (see _adapt)
+                versions.append(VersionContainer(PEP440Adapter(version_str), self.versionparser_name))
+            except InvalidVersion as e:
+                errors.append((version_str, "%s is not a valid PEP-440 version string: %s" %
+                               (highlight(version_str), str(e))))
+        return versions, errors
+
     # mad hackz ahead
     def _patch_version(self, version: PEP440Adapter, *, epoch: int=None, release: Tuple[int, ...]=None,
                        pre: Tuple[str, int]=None, dev: Tuple[str, int]=None, post: Tuple[str, int]=None,
@@ -5,9 +5,10 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 import configargparse
+import functools
 import re
 
-from typing import Any, Tuple, List, Type
+from typing import Any, Callable, Iterable, Tuple, List, Type
 from semantic_version import Version as SemVerBase
 
 from gopythongo.utils import highlight, ErrorMessage, print_info
@@ -58,6 +59,22 @@ class SemVerVersionParser(BaseVersionParser):
 
         return VersionContainer(sv, self.versionparser_name)
 
+    def parse_many(self, version_strs: Iterable[str], args: configargparse.Namespace) -> \
+            Tuple[List[VersionContainer[SemVerAdapter]], List[Tuple[str, str]]]:
+        # look up the command-line arguments once instead of once per version string
+        create = functools.partial(SemVerAdapter.coerce if args.semver_coerce else SemVerAdapter,
+                                   partial=args.semver_partial)  # type: Callable[[str], SemVerAdapter]
+
+        versions = []  # type: List[VersionContainer[SemVerAdapter]]
+        errors = []  # type: List[Tuple[str, str]]
+        for version_str in version_strs:
+            try:
+                versions.append(VersionContainer(create(version_str), self.versionparser_name))
+            except ValueError as e:
+                errors.append((version_str, "%s is not a valid SemVer version string (%s)" %
+                               (highlight(version_str), str(e))))
+        return versions, errors
+
     def can_convert_from(self, parserid: str) -> Tuple[bool, bool]:
         if parserid == self.versionparser_name:
             return True, True